@@ -3,6 +3,31 @@ from celery import Celery
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+EXECUTION_TASKS = {
+    'scheduler.tasks.execute_scheduled_task',
+    'scheduler.tasks.execute_scheduled_tasks',
+}
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Send executions to the queue for their ``priority`` kwarg and every other
+    scheduler task (recovery, retention, ...) to the maintenance queue, so a
+    backlog of low-priority runs delays neither urgent runs nor recovery.
+    """
+    from django.conf import settings
+
+    routing = settings.TASK_ROUTING
+    if name in EXECUTION_TASKS:
+        queues = routing['PRIORITY_QUEUES']
+        priority = (kwargs or {}).get('priority')
+        return {'queue': queues.get(priority, queues['MEDIUM'])}
+    if name.startswith('scheduler.tasks.'):
+        return {'queue': routing['MAINTENANCE_QUEUE']}
+    return None
+
+
 app = Celery('config')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.conf.task_routes = (route_task,)
+app.autodiscover_tasks()
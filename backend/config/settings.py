@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 
+from .database import database_from_env, sqlite_pragmas_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -53,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'scheduler.middleware.NotificationSinkMiddleware',
+    'scheduler.middleware.MetricsMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -82,14 +86,16 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+#
+# Set with DATABASE_URL and tuned with DB_CONN_MAX_AGE, DB_POOL_* (Postgres)
+# and SQLITE_* (SQLite) environment variables; see config/database.py.
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_env(BASE_DIR),
 }
 
+SQLITE_PRAGMAS = sqlite_pragmas_from_env()
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -109,6 +115,55 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'scheduler.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+}
+
+# Full-text search backends for ?search=, by database vendor (see
+# scheduler.search). Other databases fall back to DRF's icontains search.
+SEARCH = {
+    'BACKENDS': {
+        'sqlite': 'scheduler.search.SQLiteSearchBackend',
+        'postgresql': 'scheduler.search.PostgresSearchBackend',
+    },
+}
+
+# Upper bound for ?page_size= so clients walking a whole table can request
+# large pages without letting a single request load it all at once.
+PAGINATION_MAX_PAGE_SIZE = 1000
+
+# Number of execution logs embedded as recent_logs in task responses;
+# overridable per request with ?recent_logs= up to the max.
+RECENT_LOGS_LIMIT = 5
+RECENT_LOGS_MAX_LIMIT = 50
+
+# Shared cache for the change versions and cached responses of the polled
+# list endpoints (see scheduler/caching.py). Cached responses live for at
+# most TIMEOUT seconds.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    },
+}
+
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+}
+
+# Prometheus metrics, exposed at /metrics (see scheduler/metrics.py for
+# running with several processes).
+METRICS = {
+    'ENABLED': True,
+}
+
+# Default window, in hours, of /api/stats/ and /api/tasks/{id}/stats/, and
+# the most buckets one request may span.
+STATS_DEFAULT_WINDOW = 24
+STATS_MAX_BUCKETS = 2000
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -121,6 +176,171 @@ CELERY_BEAT_SCHEDULE = {
             'expires': 600,
         },
     },
+    'reconcile-notification-counters': {
+        'task': 'scheduler.tasks.reconcile_notification_counters',
+        'schedule': 3600.0,  # Every hour
+        'options': {
+            'expires': 3600,
+        },
+    },
+    'apply-retention': {
+        'task': 'scheduler.tasks.apply_retention',
+        'schedule': 3600.0,  # Every hour
+        'options': {
+            'expires': 3600,
+        },
+    },
+    'collect-orphan-schedules': {
+        'task': 'scheduler.tasks.collect_orphan_schedule_rows',
+        'schedule': 86400.0,  # Every day
+        'options': {
+            'expires': 3600,
+        },
+    },
+}
+
+
+# config.celery.route_task sends executions to the queue for the task's
+# priority and all other scheduler tasks to MAINTENANCE_QUEUE. MEDIUM stays
+# on Celery's default queue.
+TASK_ROUTING = {
+    'PRIORITY_QUEUES': {
+        'HIGH': 'executions.high',
+        'MEDIUM': 'celery',
+        'LOW': 'executions.bulk',
+    },
+    'MAINTENANCE_QUEUE': 'maintenance',
+}
+
+
+# Pub/sub layer behind /api/notifications/stream/. Use
+# scheduler.events.InMemoryEventBroker for tests or a single process.
+NOTIFICATION_STREAM = {
+    'BACKEND': 'scheduler.events.RedisEventBroker',
+    'OPTIONS': {
+        'url': CELERY_BROKER_URL,
+        'stream': 'scheduler:events',
+        'maxlen': 10000,
+    },
+    'HEARTBEAT': 15.0,
+    'RETRY_MS': 3000,
+}
+
+
+# Notifications from views and workers are buffered and written with
+# bulk_create once MAX_BATCH rows are queued or the oldest is MAX_DELAY
+# seconds old. SYNCHRONOUS writes each one immediately (use in tests).
+NOTIFICATION_SINK = {
+    'MAX_BATCH': 500,
+    'MAX_DELAY': 1.0,
+    'SYNCHRONOUS': False,
+}
+
+# Notifications of these categories about a recurring task are coalesced:
+# repeats within WINDOW seconds of the first update one digest row (its
+# occurrences, last_occurred_at and latest execution log) instead of adding
+# rows. A task's notification_digest_window overrides WINDOW (0 disables
+# it). Any other notification about the task, or reading the digest,
+# starts a new one.
+NOTIFICATION_COALESCING = {
+    'TASK_EXECUTED': {'WINDOW': 3600},
+}
+
+
+# What an execution runs (a scheduler.handlers.TaskHandler) and how workers
+# run it. In 'prefork' mode every execution is its own Celery message. In
+# 'async' mode recovery, bulk execute and HeapScheduler queue batches of up
+# to ASYNC_BATCH_SIZE ids; a worker runs a batch on one event loop with at
+# most ASYNC_CONCURRENCY executions in flight, which suits I/O-bound
+# handlers such as scheduler.handlers.SimulatedIOWork. Queued re-runs are
+# sent back as batches of one; retries of a failed run go through the
+# per-task execution task, which counts the attempts.
+TASK_EXECUTION = {
+    'HANDLER': 'scheduler.handlers.SimulatedWork',
+    'MODE': 'prefork',
+    'ASYNC_CONCURRENCY': 200,
+    'ASYNC_BATCH_SIZE': 200,
+}
+
+
+# Every run of a task holds an execution lease for up to TTL seconds (longer
+# than the execution task's hard time limit). A run that finds the lease held
+# follows the task's overlap_policy: SKIP records a SKIPPED ExecutionLog,
+# QUEUE re-sends the run after QUEUE_DELAY seconds and ALLOW takes no lease.
+# Leases live in Redis; while it is unreachable they are taken from the
+# database instead.
+EXECUTION_LEASE = {
+    'BACKEND': 'scheduler.leases.RedisLeaseBackend',
+    'OPTIONS': {
+        'url': CELERY_BROKER_URL,
+        'fallback': 'scheduler.leases.DatabaseLeaseBackend',
+    },
+    'TTL': 900,
+    'QUEUE_DELAY': 30,
+}
+
+
+# Failed executions are retried up to the task's max_retries times. Retry n
+# waits retry_delay * 2**(n-1) seconds, capped at the task's retry_max_delay
+# or MAX_DELAY; with retry_jitter the wait is drawn at random from zero to
+# that value (never less than MIN_DELAY). At most BUDGET['LIMIT'] retries are
+# sent per BUDGET['WINDOW'] seconds across all workers; retries over budget
+# are dropped and the task waits for its next scheduled run. A task that runs
+# out of retries is marked FAILED and unscheduled.
+RETRY = {
+    'MAX_DELAY': 3600,
+    'MIN_DELAY': 1,
+    'BUDGET': {
+        'BACKEND': 'scheduler.retries.RedisRetryBudget',
+        'OPTIONS': {
+            'url': CELERY_BROKER_URL,
+        },
+        'LIMIT': 1000,
+        'WINDOW': 60,
+    },
+}
+
+
+# POST /api/tasks/bulk/ accepts up to MAX_ITEMS task definitions and inserts
+# them BATCH_SIZE rows per statement.
+BULK_TASKS = {
+    'MAX_ITEMS': 10000,
+    'BATCH_SIZE': 500,
+}
+
+
+# recovery_scan streams candidates CHUNK_SIZE rows at a time. Overdue ONE_TIME
+# tasks are claimed by moving them to PENDING; a claim older than CLAIM_TTL
+# seconds (e.g. the worker died) makes the task eligible again. A recurring
+# task counts as stuck once it is STUCK_GRACE seconds past its next_execution.
+RECOVERY = {
+    'CHUNK_SIZE': 500,
+    'CLAIM_TTL': 900,
+    'STUCK_GRACE': 300,
+}
+
+
+# scheduler.beat:HeapScheduler, an alternative to DatabaseScheduler that
+# polls the TaskChange log every POLL_INTERVAL seconds.
+HEAP_SCHEDULER = {
+    'POLL_INTERVAL': 5,
+    'MAX_FIRE_PER_TICK': 1000,
+    'CHANGE_BATCH_SIZE': 10000,
+}
+
+
+# Raw execution logs are kept for LOG_MAX_AGE_DAYS (and never deleted before
+# a daily rollup covers them); archived notifications for
+# ARCHIVED_NOTIFICATION_MAX_AGE_DAYS. The task and notification change logs
+# back the changes/ endpoints; a client whose cursor is older than
+# *_CHANGE_MAX_AGE_DAYS gets 410 and must reload. Deletes run
+# DELETE_CHUNK_SIZE rows at a time.
+RETENTION = {
+    'LOG_MAX_AGE_DAYS': 30,
+    'ARCHIVED_NOTIFICATION_MAX_AGE_DAYS': 7,
+    'TASK_CHANGE_MAX_AGE_DAYS': 7,
+    'NOTIFICATION_CHANGE_MAX_AGE_DAYS': 7,
+    'DELETE_CHUNK_SIZE': 1000,
 }
 
 
@@ -0,0 +1,35 @@
+"""
+Settings for ``manage.py test``: everything that would talk to Redis runs in
+process instead, so the suite needs no Redis and no test can reach one.
+"""
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+CELERY_BROKER_URL = 'memory://'
+
+NOTIFICATION_STREAM = {
+    'BACKEND': 'scheduler.events.InMemoryEventBroker',
+    'HEARTBEAT': 15.0,
+    'RETRY_MS': 3000,
+}
+
+EXECUTION_LEASE = {
+    'BACKEND': 'scheduler.leases.LocalLeaseBackend',
+    'TTL': 900,
+    'QUEUE_DELAY': 30,
+}
+
+RETRY = {
+    'MAX_DELAY': 3600,
+    'MIN_DELAY': 1,
+    'BUDGET': {
+        'BACKEND': 'scheduler.retries.LocalRetryBudget',
+        'LIMIT': 1000,
+        'WINDOW': 60,
+    },
+}
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class SchedulerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scheduler'
+
+    def ready(self):
+        from config.database import configure_connection
+
+        from .changes import install_change_positions
+        from .search import install_search_indexes
+
+        connection_created.connect(configure_connection)
+        post_migrate.connect(install_search_indexes, sender=self)
+        post_migrate.connect(install_change_positions, sender=self)
@@ -0,0 +1,192 @@
+"""
+Celery beat scheduler that reads ScheduledTask directly.
+
+Run it with::
+
+    celery -A config beat -l info --scheduler scheduler.beat:HeapScheduler
+
+``DatabaseScheduler`` reloads and re-evaluates every enabled PeriodicTask
+whenever anything changes. ``HeapScheduler`` keeps a min-heap of
+``(next run, task id)``, loads the table once, and afterwards only reloads
+the tasks named in the TaskChange log since its last poll. A tick pops the
+due entries (O(log n) each) and sleeps until the next one is due, waking at
+least every POLL_INTERVAL seconds to pick up changes. Entries from
+CELERY_BEAT_SCHEDULE are still handled by the base scheduler.
+"""
+import heapq
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from celery.beat import Scheduler
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .changes import change_watermark, purge_horizon, read_change_rows
+from .cron import CronError, compile_cron
+from .models import ScheduledTask, TaskChange
+from .tasks import dispatch_executions
+
+TASK_FIELDS = [
+    'id', 'schedule_type', 'scheduled_time', 'interval_seconds', 'last_execution', 'next_execution',
+    'cron_minute', 'cron_hour', 'cron_day_of_week', 'cron_day_of_month', 'cron_month_of_year', 'priority',
+]
+
+
+class TaskSchedule(namedtuple('TaskSchedule', ['schedule_type', 'scheduled_time', 'interval', 'cron', 'priority'])):
+    """The part of a ScheduledTask needed to work out when it fires next."""
+
+    @classmethod
+    def from_row(cls, row):
+        (_id, schedule_type, scheduled_time, interval_seconds, _last, _next,
+         minute, hour, day_of_week, day_of_month, month_of_year, priority) = row
+        cron = None
+        if schedule_type == 'CRON':
+            try:
+                cron = compile_cron(
+                    minute or '*', hour or '*', day_of_week or '*', day_of_month or '*', month_of_year or '*'
+                )
+            except CronError:
+                pass
+        interval = timedelta(seconds=interval_seconds) if interval_seconds else None
+        return cls(schedule_type, scheduled_time, interval, cron, priority)
+
+    def next_run(self, now, last_run=None):
+        if self.schedule_type == 'ONE_TIME':
+            return None if last_run else self.scheduled_time
+        if self.schedule_type == 'INTERVAL':
+            if self.interval is None:
+                return None
+            return max(last_run + self.interval, now) if last_run else now + self.interval
+        if self.schedule_type == 'CRON' and self.cron is not None:
+            return self.cron.next_after(now)
+        return None
+
+
+class HeapScheduler(Scheduler):
+
+    def __init__(self, *args, **kwargs):
+        config = settings.HEAP_SCHEDULER
+        self.poll_interval = config['POLL_INTERVAL']
+        self.max_fire_per_tick = config['MAX_FIRE_PER_TICK']
+        self.change_batch_size = config['CHANGE_BATCH_SIZE']
+        self._task_heap = []
+        self._next_run = {}
+        self._schedules = {}
+        self._last_change_id = 0
+        super().__init__(*args, **kwargs)
+        self.max_interval = min(self.max_interval, self.poll_interval)
+
+    def setup_schedule(self):
+        super().setup_schedule()
+        self.load_tasks()
+
+    def schedulable_tasks(self):
+        return ScheduledTask.objects.filter(
+            is_active=True, status='ACTIVE'
+        ).exclude(
+            schedule_type='ONE_TIME', executed_once=True
+        ).values_list(*TASK_FIELDS)
+
+    def load_tasks(self):
+        # Take the change-log position first so that anything written while
+        # the table is being read is replayed on the next tick.
+        self._last_change_id = change_watermark(TaskChange)
+        self._task_heap = []
+        self._next_run = {}
+        self._schedules = {}
+        now = timezone.now()
+        for row in self.schedulable_tasks().iterator(chunk_size=2000):
+            self._add(row, now, push=self._task_heap.append)
+        heapq.heapify(self._task_heap)
+
+    def _add(self, row, now, push=None):
+        task_id, last_execution, next_execution = row[0], row[4], row[5]
+        schedule = TaskSchedule.from_row(row)
+        # next_execution is maintained on every save and execution; it is
+        # only computed here for rows the recovery scan has not backfilled.
+        next_run = next_execution or schedule.next_run(now, last_execution)
+        if next_run is None:
+            return
+        self._schedules[task_id] = schedule
+        self._push(task_id, next_run.timestamp(), push)
+
+    def _push(self, task_id, when, push=None):
+        self._next_run[task_id] = when
+        (push or (lambda item: heapq.heappush(self._task_heap, item)))((when, task_id))
+
+    def _remove(self, task_id):
+        # Heap entries are dropped lazily: an entry whose time no longer
+        # matches _next_run is skipped when it reaches the top.
+        self._next_run.pop(task_id, None)
+        self._schedules.pop(task_id, None)
+
+    def apply_changes(self):
+        if self._last_change_id < purge_horizon(TaskChange):
+            # Changes since the last poll have been purged: start over.
+            self.load_tasks()
+            return 0
+
+        changes, self._last_change_id, _has_more = read_change_rows(
+            TaskChange, 'task_id', self._last_change_id, self.change_batch_size
+        )
+        if not changes:
+            return 0
+
+        # Execution bookkeeping moves next_execution the same way fire_due
+        # already has, so only edits and deletes are reloaded.
+        task_ids = {task_id for _position, task_id, kind in changes if kind != 'EXECUTION'}
+        for task_id in task_ids:
+            self._remove(task_id)
+
+        now = timezone.now()
+        for row in self.schedulable_tasks().filter(id__in=task_ids):
+            self._add(row, now)
+
+        if len(self._task_heap) > 2 * len(self._next_run) + 1024:
+            self._task_heap = [(when, task_id) for task_id, when in self._next_run.items()]
+            heapq.heapify(self._task_heap)
+        return len(changes)
+
+    def send_executions(self, tasks):
+        """Send ``(task_id, priority)`` pairs; see ``tasks.dispatch_executions``."""
+        dispatch_executions(tasks)
+
+    def fire_due(self):
+        now = time.time()
+        due = []
+        while self._task_heap and self._task_heap[0][0] <= now and len(due) < self.max_fire_per_tick:
+            when, task_id = heapq.heappop(self._task_heap)
+            if self._next_run.get(task_id) != when:
+                continue
+
+            schedule = self._schedules[task_id]
+            due.append((task_id, schedule.priority))
+
+            fired_at = timezone.now()
+            next_run = schedule.next_run(fired_at, last_run=fired_at)
+            if next_run is None:
+                self._remove(task_id)
+            else:
+                self._push(task_id, next_run.timestamp())
+
+        self.send_executions(due)
+        return len(due)
+
+    def tick(self, *args, **kwargs):
+        close_old_connections()
+        self.apply_changes()
+        fired = self.fire_due()
+        static_delay = super().tick(*args, **kwargs)
+        if fired >= self.max_fire_per_tick:
+            return 0
+
+        delay = self.max_interval
+        if self._task_heap:
+            delay = min(delay, self._task_heap[0][0] - time.time())
+        return max(0, min(delay, static_delay))
+
+    @property
+    def info(self):
+        return f"    . tasks -> {len(self._next_run)} scheduled"
@@ -0,0 +1,124 @@
+"""
+Set-based versions of the per-task pause, resume, delete and execute_now
+actions, applied to whatever a filtered ScheduledTask queryset selects.
+
+Ids are read once and then handled in chunks: each chunk is one conditional
+UPDATE (or DELETE) on ScheduledTask, a read of the rows it actually changed,
+one UPDATE (or DELETE) on their PeriodicTasks by name, and one change-log
+insert. Each changed task gets a ``task_status`` (or ``task_deleted``)
+event once its chunk commits. Beat is told about the PeriodicTask changes
+once at the end, and each operation writes one summary notification.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_celery_beat.models import PeriodicTask, PeriodicTasks
+
+from .changes import record_task_change
+from .events import publish_task_status
+from .models import ScheduledTask
+from .notifications import notify
+from .schedules import periodic_task_name
+
+# Set-based ScheduledTask.can_be_deleted and can_be_resumed.
+RECURRING = ~Q(schedule_type="ONE_TIME")
+DELETABLE = (
+    ~Q(status__in=['COMPLETED', 'FAILED'])
+    | Q(schedule_type="ONE_TIME", executed_once=False)
+    | RECURRING & ~Q(status='COMPLETED')
+)
+RESUMABLE = Q(status='PAUSED') | RECURRING & Q(status='FAILED')
+
+
+def _id_chunks(queryset):
+    chunk_size = settings.BULK_TASKS['BATCH_SIZE']
+    ids = list(queryset.order_by().values_list('id', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start:start + chunk_size]
+
+
+def _periodic_tasks(task_ids):
+    return PeriodicTask.objects.filter(name__in=[periodic_task_name(task_id) for task_id in task_ids])
+
+
+def _summarize(count, title, verb):
+    if count:
+        notify(
+            title=f"Tasks {title}: {count}",
+            message=f"{count} scheduled tasks have been {verb}.",
+            category='SYSTEM',
+            priority='LOW'
+        )
+    return count
+
+
+def _record_changed(tasks, deleted=False):
+    task_ids = [task.id for task in tasks]
+    record_task_change(*task_ids, deleted=deleted)
+    for task in tasks:
+        publish_task_status(task, deleted=deleted)
+    return task_ids
+
+
+def pause_tasks(queryset):
+    paused = 0
+    for chunk in _id_chunks(queryset.filter(status='ACTIVE')):
+        now = timezone.now()
+        with transaction.atomic():
+            ScheduledTask.objects.filter(id__in=chunk, status='ACTIVE').update(
+                status='PAUSED', is_active=False, next_execution=None, updated_at=now
+            )
+            # Read back by our own timestamp, as recovery claims do, so only
+            # the rows this UPDATE changed are reported and disabled.
+            tasks = list(ScheduledTask.objects.filter(id__in=chunk, status='PAUSED', updated_at=now))
+            _periodic_tasks(_record_changed(tasks)).update(enabled=False)
+        paused += len(tasks)
+    PeriodicTasks.update_changed()
+    return _summarize(paused, "Paused", "paused")
+
+
+def resume_tasks(queryset):
+    resumed = 0
+    for chunk in _id_chunks(queryset.filter(RESUMABLE)):
+        now = timezone.now()
+        with transaction.atomic():
+            ScheduledTask.objects.filter(RESUMABLE, id__in=chunk).update(
+                status='ACTIVE', is_active=True, updated_at=now
+            )
+            tasks = list(ScheduledTask.objects.filter(id__in=chunk, status='ACTIVE', updated_at=now))
+            for task in tasks:
+                task.next_execution = task.compute_next_execution(now)
+            ScheduledTask.objects.bulk_update(tasks, ['next_execution'])
+            _periodic_tasks(_record_changed(tasks)).update(enabled=True)
+        resumed += len(tasks)
+    PeriodicTasks.update_changed()
+    return _summarize(resumed, "Resumed", "resumed")
+
+
+def delete_tasks(queryset):
+    deleted = 0
+    for chunk in _id_chunks(queryset.filter(DELETABLE)):
+        with transaction.atomic():
+            tasks = list(ScheduledTask.objects.select_for_update().filter(DELETABLE, id__in=chunk))
+            task_ids = _record_changed(tasks, deleted=True)
+            ScheduledTask.objects.filter(id__in=task_ids).delete()
+            # PeriodicTask's post_delete handler bumps PeriodicTasks once per
+            # row. The only reference to it, from ScheduledTask, is gone now,
+            # so delete without the collector and bump once below.
+            periodic_tasks = _periodic_tasks(task_ids)
+            periodic_tasks._raw_delete(periodic_tasks.db)
+        deleted += len(task_ids)
+    PeriodicTasks.update_changed()
+    return _summarize(deleted, "Deleted", "deleted")
+
+
+def execute_tasks(queryset):
+    from .tasks import dispatch_executions
+
+    chunk_size = settings.BULK_TASKS['BATCH_SIZE']
+    tasks = list(queryset.filter(is_active=True).order_by().values_list('id', 'priority'))
+    for start in range(0, len(tasks), chunk_size):
+        dispatch_executions(tasks[start:start + chunk_size])
+    queued = len(tasks)
+    return _summarize(queued, "Queued", "queued for execution")
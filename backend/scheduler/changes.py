@@ -0,0 +1,187 @@
+"""
+Append-only change logs for tasks and notifications.
+
+The autoincrement id of TaskChange and NotificationChange is a change
+sequence: HeapScheduler and the ``changes`` endpoints read the rows after
+the last id they saw, and act on the ids they name. A row only says "look
+at this object again"; recording one too many is harmless.
+
+Ids are handed out when a row is inserted, not when its transaction
+commits, so a reader could see a row after one with a lower id that is
+still to commit. Readers therefore go by each row's *position* and stop at
+``change_watermark``, the last position at or below which nothing can still
+commit, without taking any lock:
+
+- on SQLite the position is the id: there is one writer at a time, so ids
+  commit in order, and the watermark is a plain read of the last one;
+- on PostgreSQL it is the id of the transaction that wrote the row, kept in
+  a ``txid`` column that defaults to ``pg_current_xact_id()`` (added after
+  every ``migrate``). Every transaction still running has an id of at least
+  the current snapshot's xmin, so every position below it is final. All the
+  rows of one transaction share a position and are read together.
+
+Cursors are positions. Cursors handed out before the ``txid`` column was
+added are ids, not transaction ids; clients should reload after upgrading.
+Retention records how far it has purged each log in ChangeLogPurge, so a
+cursor older than that is refused rather than silently missing changes.
+"""
+from collections import namedtuple
+
+from django.db import connection, connections
+from django.db.models import BigIntegerField, Max
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .caching import bump_version
+from .models import ChangeLogPurge, NotificationChange, TaskChange
+
+
+ChangePage = namedtuple('ChangePage', ['upserted', 'deleted', 'cursor', 'has_more'])
+
+CHANGE_LOGS = [TaskChange, NotificationChange]
+
+TXID_COLUMN = 'txid'
+
+
+class CursorExpired(Exception):
+    """The changes after a cursor have been partly purged; the client must reload."""
+
+
+def purge_horizon(model):
+    """The highest id retention has deleted from the change log ``model``."""
+    return ChangeLogPurge.objects.filter(log=model._meta.label_lower).values_list(
+        'purged_through', flat=True
+    ).first() or 0
+
+
+def advance_purge_horizon(model, change_ids):
+    """Record that the rows ``change_ids`` of ``model`` are being purged."""
+    log = model._meta.label_lower
+    purged = with_positions(model).filter(id__in=change_ids).aggregate(last=Max('position'))['last']
+    ChangeLogPurge.objects.get_or_create(log=log)
+    ChangeLogPurge.objects.filter(log=log, purged_through__lt=purged).update(purged_through=purged)
+
+
+def with_positions(model):
+    """``model``'s rows annotated with their ``position`` in the log."""
+    quote = connection.ops.quote_name
+    column = TXID_COLUMN if connection.vendor == 'postgresql' else 'id'
+    return model.objects.annotate(position=RawSQL(
+        f"{quote(model._meta.db_table)}.{quote(column)}", [], output_field=BigIntegerField()
+    ))
+
+
+def change_watermark(model):
+    """
+    The last position of the change log ``model`` that readers may go up
+    to: every row at or below it has committed or rolled back.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint - 1")
+            last = cursor.fetchone()[0]
+    else:
+        last = model.objects.aggregate(last=Max('id'))['last']
+    return max(last or 0, purge_horizon(model))
+
+
+def read_change_rows(model, field, since, limit):
+    """
+    Up to ``limit`` ``(position, field, kind)`` rows of the change log
+    ``model`` after position ``since``, the position to continue from, and
+    whether there are more. Rows sharing a position are never split across
+    reads, so a single position with more than ``limit`` rows is read whole.
+    """
+    positions = with_positions(model).filter(position__lte=change_watermark(model))
+    rows = list(
+        positions.filter(position__gt=since)
+        .order_by('position', 'id').values_list('position', field, 'kind')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    if has_more:
+        boundary = rows[limit][0]
+        rows = [row for row in rows[:limit] if row[0] != boundary]
+        if not rows:
+            rows = list(positions.filter(position=boundary).order_by('id').values_list('position', field, 'kind'))
+    return rows, rows[-1][0] if rows else since, has_more
+
+
+def read_changes(model, field, since, limit):
+    """
+    Read up to ``limit`` rows of the change log ``model`` after the cursor
+    ``since`` and fold them into the ids (``field``) to refetch and the ids
+    deleted, the latest change for an id winning. Without ``since`` nothing
+    is read and the cursor is the current watermark.
+    """
+    if since is None:
+        return ChangePage([], [], change_watermark(model), False)
+    if since < purge_horizon(model):
+        raise CursorExpired(since)
+
+    rows, cursor, has_more = read_change_rows(model, field, since, limit)
+    latest = {}
+    for _position, object_id, kind in rows:
+        latest[object_id] = kind
+    return ChangePage(
+        upserted=[object_id for object_id, kind in latest.items() if kind != 'DELETE'],
+        deleted=[object_id for object_id, kind in latest.items() if kind == 'DELETE'],
+        cursor=cursor,
+        has_more=has_more
+    )
+
+
+def install_change_positions(sender, using, **kwargs):
+    """post_migrate receiver adding the ``txid`` position column on PostgreSQL."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in CHANGE_LOGS:
+            table = model._meta.db_table
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ADD COLUMN IF NOT EXISTS {quote(TXID_COLUMN)} bigint "
+                f"NOT NULL DEFAULT (pg_current_xact_id()::text::bigint)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote(f'{table}_{TXID_COLUMN}')} "
+                f"ON {quote(table)} ({quote(TXID_COLUMN)}, {quote('id')})"
+            )
+
+
+def record_task_change(*task_ids, deleted=False, execution=False):
+    """
+    Append one change-log row per task; pass ``deleted=True`` for
+    tombstones and ``execution=True`` for changes made by execution
+    bookkeeping, which HeapScheduler can skip.
+    """
+    kind = 'DELETE' if deleted else 'EXECUTION' if execution else 'UPSERT'
+    TaskChange.objects.bulk_create([TaskChange(task_id=task_id, kind=kind) for task_id in task_ids])
+    if execution:
+        bump_version('tasks')
+    else:
+        # Notifications show their task's name, and lose the task on delete.
+        bump_version('tasks', 'notifications')
+
+
+def record_notification_change(*notification_ids, deleted=False):
+    kind = 'DELETE' if deleted else 'UPSERT'
+    NotificationChange.objects.bulk_create([
+        NotificationChange(notification_id=notification_id, kind=kind) for notification_id in notification_ids
+    ])
+
+
+def record_notification_changes_in(queryset):
+    """
+    Record a change for every notification ``queryset`` selects, in one
+    INSERT ... SELECT, ahead of a bulk UPDATE of the same queryset.
+    """
+    select, params = queryset.order_by().values('id').query.sql_with_params()
+    table = connection.ops.quote_name(NotificationChange._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (notification_id, kind, changed_at) "
+            f"SELECT id, 'UPSERT', %s FROM ({select}) changed",
+            [timezone.now(), *params]
+        )
+        return cursor.rowcount
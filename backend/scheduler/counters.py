@@ -0,0 +1,146 @@
+"""
+Unread notification counters, one row per (category, priority).
+
+Every path that creates, reads, un-reads or deletes notifications adjusts
+the matching row, so unread totals are a read of a couple of dozen rows
+instead of a COUNT over the notification table. ``reconcile`` rebuilds the
+rows from the table and runs periodically to correct any drift.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .caching import bump_version
+from .changes import record_notification_change, record_notification_changes_in
+from .models import Notification, NotificationCounter
+
+
+def adjust(groups):
+    """Apply ``{(category, priority): delta}`` to the counters."""
+    # Every write that changes a notification's unread state comes through
+    # here, so this is where notification listings are invalidated.
+    bump_version('notifications')
+    for (category, priority), delta in groups.items():
+        if not delta:
+            continue
+        updated = NotificationCounter.objects.filter(
+            category=category, priority=priority
+        ).update(unread=F('unread') + delta)
+        if not updated:
+            counter, _ = NotificationCounter.objects.get_or_create(category=category, priority=priority)
+            NotificationCounter.objects.filter(pk=counter.pk).update(unread=F('unread') + delta)
+
+
+def record_created(*notifications):
+    record_notification_change(*[notification.pk for notification in notifications])
+    adjust(Counter(
+        (notification.category, notification.priority)
+        for notification in notifications if not notification.is_read
+    ))
+
+
+def record_deleted(*notifications):
+    record_notification_change(*[notification.pk for notification in notifications], deleted=True)
+    groups = Counter()
+    groups.subtract(
+        (notification.category, notification.priority)
+        for notification in notifications if not notification.is_read
+    )
+    adjust(groups)
+
+
+def record_updated(previous, notification):
+    """Move ``notification``'s unread count from where ``previous`` (its row before the update) had it."""
+    record_notification_change(notification.pk)
+    groups = Counter()
+    if not previous.is_read:
+        groups[(previous.category, previous.priority)] -= 1
+    if not notification.is_read:
+        groups[(notification.category, notification.priority)] += 1
+    adjust(groups)
+
+
+def set_read(notification, is_read):
+    """Flip ``is_read`` on one notification, counting only a real change."""
+    with transaction.atomic():
+        changed = Notification.objects.filter(
+            pk=notification.pk, is_read=not is_read
+        ).update(is_read=is_read)
+        if changed:
+            record_notification_change(notification.pk)
+            adjust({(notification.category, notification.priority): -1 if is_read else 1})
+    notification.is_read = is_read
+    return bool(changed)
+
+
+def mark_all_read(queryset):
+    """
+    Mark every unread notification in ``queryset`` as read.
+
+    The update runs once per non-empty counter so each decrement matches the
+    rows that statement actually changed, even with concurrent writers.
+    """
+    total = 0
+    groups = NotificationCounter.objects.filter(unread__gt=0).values_list('category', 'priority')
+    with transaction.atomic():
+        for category, priority in list(groups):
+            unread = queryset.filter(is_read=False, category=category, priority=priority)
+            record_notification_changes_in(unread)
+            updated = unread.update(is_read=True)
+            adjust({(category, priority): -updated})
+            total += updated
+        # Rows under a counter that has drifted to zero; reconcile() fixes
+        # the counter itself.
+        record_notification_changes_in(queryset.filter(is_read=False))
+        total += queryset.filter(is_read=False).update(is_read=True)
+        bump_version('notifications')
+    return total
+
+
+def unread_count():
+    return sum(NotificationCounter.objects.values_list('unread', flat=True))
+
+
+def unread_breakdown():
+    by_category = {}
+    by_priority = {}
+    for category, priority, unread in NotificationCounter.objects.values_list('category', 'priority', 'unread'):
+        by_category[category] = by_category.get(category, 0) + unread
+        by_priority[priority] = by_priority.get(priority, 0) + unread
+    return {
+        'unread_count': sum(by_category.values()),
+        'by_category': by_category,
+        'by_priority': by_priority,
+    }
+
+
+def reconcile():
+    """Rebuild the counters from the notification table; returns the drift fixed."""
+    drift = 0
+    with transaction.atomic():
+        # Lock the counters before counting, so no write can adjust one
+        # between the aggregate and the rebuild and have it overwritten.
+        counters = {
+            (counter.category, counter.priority): counter
+            for counter in NotificationCounter.objects.select_for_update()
+        }
+        actual = {
+            (row['category'], row['priority']): row['unread']
+            for row in Notification.objects.filter(is_read=False)
+            .values('category', 'priority')
+            .annotate(unread=Count('id'))
+        }
+        for key in set(actual) | set(counters):
+            expected = actual.get(key, 0)
+            counter = counters.get(key)
+            if counter is None:
+                NotificationCounter.objects.create(category=key[0], priority=key[1], unread=expected)
+                drift += expected
+            elif counter.unread != expected:
+                drift += abs(counter.unread - expected)
+                counter.unread = expected
+                counter.save(update_fields=['unread', 'updated_at'])
+    if drift:
+        bump_version('notifications')
+    return drift
@@ -0,0 +1,180 @@
+"""
+Cron expressions compiled to bitmasks.
+
+Each of the five ``cron_*`` fields becomes an int with one bit per allowed
+value, so matching is a shift-and-mask and "next allowed value" is a
+lowest-set-bit lookup. Compiled expressions are cached, so the many tasks
+that share an expression share one ``CronExpression``.
+
+Matching follows ``celery.schedules.crontab``, which is what beat evaluates
+for the PeriodicTask rows: day-of-week 0 is Sunday, a time must match
+*both* day-of-month and day-of-week, and a descending range such as
+``fri-mon`` wraps around.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from django.utils import timezone
+
+DAY_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# field name -> (first value, last value, names for values starting at first)
+FIELDS = {
+    'cron_minute': (0, 59, None),
+    'cron_hour': (0, 23, None),
+    'cron_day_of_week': (0, 6, DAY_NAMES),
+    'cron_day_of_month': (1, 31, None),
+    'cron_month_of_year': (1, 12, MONTH_NAMES),
+}
+
+# How far ahead next_after() looks before deciding an expression such as
+# "30 February" can never fire.
+SEARCH_YEARS = 8
+
+
+class CronError(ValueError):
+    def __init__(self, field, message):
+        self.field = field
+        super().__init__(message)
+
+
+def _value(token, field, first, last, names):
+    token = token.strip().lower()
+    if names and token in names:
+        return names.index(token) + first
+    if not token.isdigit():
+        raise CronError(field, f"'{token}' is not a valid value.")
+    value = int(token)
+    if not first <= value <= last:
+        raise CronError(field, f"{value} is out of range {first}-{last}.")
+    return value
+
+
+def parse_field(expression, field):
+    """Compile one cron field to a bitmask of its allowed values."""
+    first, last, names = FIELDS[field]
+    expression = (expression or '*').strip()
+    mask = 0
+    for part in expression.split(','):
+        if not part:
+            raise CronError(field, f"'{expression}' has an empty list item.")
+        step = 1
+        if '/' in part:
+            part, _, step_token = part.partition('/')
+            if not step_token.isdigit() or int(step_token) == 0:
+                raise CronError(field, f"'{step_token}' is not a valid step.")
+            step = int(step_token)
+
+        if part == '*':
+            values = range(first, last + 1)
+        elif '-' in part:
+            start_token, _, end_token = part.partition('-')
+            start = _value(start_token, field, first, last, names)
+            end = _value(end_token, field, first, last, names)
+            if end < start:
+                # A descending range wraps past the last value, as in Celery:
+                # "fri-mon" is fri, sat, sun, mon.
+                values = list(range(start, last + 1)) + list(range(first, end + 1))
+            else:
+                values = range(start, end + 1)
+        elif step > 1:
+            raise CronError(field, f"'{part}/{step}' needs a range or '*' before the step.")
+        else:
+            values = [_value(part, field, first, last, names)]
+
+        for value in values[::step]:
+            mask |= 1 << value
+    return mask
+
+
+def _next_bit(mask, start):
+    """Smallest set bit at or above ``start``, or None."""
+    rest = mask >> start
+    if not rest:
+        return None
+    return start + (rest & -rest).bit_length() - 1
+
+
+class CronExpression:
+    __slots__ = ['minutes', 'hours', 'days_of_week', 'days_of_month', 'months']
+
+    def __init__(self, minutes, hours, days_of_week, days_of_month, months):
+        self.minutes = minutes
+        self.hours = hours
+        self.days_of_week = days_of_week
+        self.days_of_month = days_of_month
+        self.months = months
+
+    def _day_matches(self, day):
+        weekday = (day.weekday() + 1) % 7
+        return bool(self.days_of_month >> day.day & 1 and self.days_of_week >> weekday & 1)
+
+    def next_after(self, after, tz=None):
+        """
+        First matching minute strictly after ``after``, as an aware datetime.
+
+        Fields are read as wall-clock time in ``tz`` (the default timezone
+        unless given). Returns None if nothing matches within SEARCH_YEARS.
+        """
+        tz = tz or timezone.get_default_timezone()
+        local = after.astimezone(tz).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limit = local.year + SEARCH_YEARS
+
+        while local.year <= limit:
+            month = _next_bit(self.months, local.month)
+            if month is None:
+                local = datetime(local.year + 1, 1, 1)
+                continue
+            if month != local.month:
+                local = datetime(local.year, month, 1)
+
+            if _next_bit(self.days_of_month, local.day) is None:
+                local = datetime(local.year + local.month // 12, local.month % 12 + 1, 1)
+                continue
+            if not self._day_matches(local):
+                local = datetime(local.year, local.month, local.day) + timedelta(days=1)
+                continue
+
+            hour = _next_bit(self.hours, local.hour)
+            if hour is None:
+                local = datetime(local.year, local.month, local.day) + timedelta(days=1)
+                continue
+            if hour != local.hour:
+                local = local.replace(hour=hour, minute=0)
+
+            minute = _next_bit(self.minutes, local.minute)
+            if minute is None:
+                local = local.replace(minute=0) + timedelta(hours=1)
+                continue
+
+            candidate = local.replace(minute=minute).replace(tzinfo=tz)
+            # A wall-clock time skipped by a DST change can land before
+            # ``after`` once converted; keep searching from the next minute.
+            if candidate <= after:
+                local = local.replace(minute=minute) + timedelta(minutes=1)
+                continue
+            return candidate
+        return None
+
+
+@lru_cache(maxsize=1024)
+def compile_cron(minute='*', hour='*', day_of_week='*', day_of_month='*', month_of_year='*'):
+    """Compile and cache an expression; raises CronError naming the bad field."""
+    return CronExpression(
+        parse_field(minute, 'cron_minute'),
+        parse_field(hour, 'cron_hour'),
+        parse_field(day_of_week, 'cron_day_of_week'),
+        parse_field(day_of_month, 'cron_day_of_month'),
+        parse_field(month_of_year, 'cron_month_of_year'),
+    )
+
+
+def task_cron(task):
+    return compile_cron(
+        task.cron_minute or '*',
+        task.cron_hour or '*',
+        task.cron_day_of_week or '*',
+        task.cron_day_of_month or '*',
+        task.cron_month_of_year or '*',
+    )
@@ -0,0 +1,174 @@
+import json
+import logging
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class EventBroker:
+    """
+    Fan-out channel for notification and task status events.
+
+    ``publish`` is called from request and worker code; ``read`` blocks for up
+    to ``timeout`` seconds and returns ``(event_id, event)`` pairs published
+    after ``last_id`` (or after "now" when ``last_id`` is None), so a client
+    that reconnects with its last seen id picks up where it left off.
+    ``id_pattern`` is the form of the ids a broker hands out; anything else
+    a client sends back is not a position in its stream.
+    """
+
+    id_pattern = None
+
+    def is_valid_id(self, event_id):
+        return re.fullmatch(self.id_pattern, event_id, re.ASCII) is not None
+
+    def publish(self, event):
+        raise NotImplementedError
+
+    def read(self, last_id=None, timeout=15.0):
+        raise NotImplementedError
+
+    async def aread(self, last_id=None, timeout=15.0):
+        return await sync_to_async(self.read, thread_sensitive=False)(last_id, timeout)
+
+    def latest_id(self):
+        raise NotImplementedError
+
+
+class InMemoryEventBroker(EventBroker):
+    """Single-process broker for tests and local development."""
+
+    id_pattern = r'\d+'
+
+    def __init__(self, maxlen=1000):
+        self._events = deque(maxlen=maxlen)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def publish(self, event):
+        with self._condition:
+            self._sequence += 1
+            event_id = str(self._sequence)
+            self._events.append((event_id, event))
+            self._condition.notify_all()
+        return event_id
+
+    def read(self, last_id=None, timeout=15.0):
+        with self._condition:
+            after = int(last_id) if last_id is not None else self._sequence
+            if after > self._sequence:
+                # An id from before a restart: the client has missed
+                # everything this process published, so replay it.
+                after = 0
+            self._condition.wait_for(lambda: self._sequence > after, timeout=timeout)
+            return [(event_id, event) for event_id, event in self._events if int(event_id) > after]
+
+    def latest_id(self):
+        return str(self._sequence)
+
+
+class RedisEventBroker(EventBroker):
+    """
+    Redis Streams broker. Stream entry ids are monotonic, so they double as
+    the SSE event id that clients resume from.
+    """
+
+    id_pattern = r'\d+-\d+'
+
+    def __init__(self, url, stream='scheduler:events', maxlen=10000):
+        import redis
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.stream = stream
+        self.maxlen = maxlen
+        self._async_client = None
+
+    def publish(self, event):
+        event_id = self.client.xadd(
+            self.stream,
+            {'data': json.dumps(event, cls=DjangoJSONEncoder)},
+            maxlen=self.maxlen,
+            approximate=True
+        )
+        return event_id.decode()
+
+    def read(self, last_id=None, timeout=15.0):
+        response = self.client.xread(
+            {self.stream: last_id or '$'},
+            count=100,
+            block=int(timeout * 1000)
+        )
+        return self._decode(response)
+
+    async def aread(self, last_id=None, timeout=15.0):
+        # Streaming clients wait on the event loop rather than each holding a
+        # thread for the duration of a blocking XREAD.
+        if self._async_client is None:
+            import redis.asyncio
+
+            self._async_client = redis.asyncio.Redis.from_url(self.url)
+        response = await self._async_client.xread(
+            {self.stream: last_id or '$'},
+            count=100,
+            block=int(timeout * 1000)
+        )
+        return self._decode(response)
+
+    def _decode(self, response):
+        events = []
+        for _stream, entries in response or []:
+            for event_id, fields in entries:
+                events.append((event_id.decode(), json.loads(fields[b'data'])))
+        return events
+
+    def latest_id(self):
+        entries = self.client.xrevrange(self.stream, count=1)
+        return entries[0][0].decode() if entries else '0-0'
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    config = settings.NOTIFICATION_STREAM
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def publish(event):
+    def send():
+        try:
+            get_broker().publish(event)
+        except Exception:
+            logger.warning("Failed to publish %s event", event.get('type'), exc_info=True)
+
+    # Clients may fetch the row as soon as they see the event, so only
+    # announce writes once they are committed.
+    transaction.on_commit(send)
+
+
+def publish_notification(notification):
+    from .serializers import NotificationSerializer
+
+    publish({'type': 'notification', 'notification': NotificationSerializer(notification).data})
+
+
+def publish_task_status(task, deleted=False):
+    publish({
+        'type': 'task_deleted' if deleted else 'task_status',
+        'task': {
+            'id': task.id,
+            'name': task.name,
+            'status': task.status,
+            'is_active': task.is_active,
+            'last_execution': task.last_execution,
+            'total_executions': task.total_executions,
+        },
+    })
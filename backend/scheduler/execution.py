@@ -0,0 +1,241 @@
+"""
+The bookkeeping around one execution of a ScheduledTask, split into the
+phases before and after the handler runs so that the prefork task
+(``tasks.execute_scheduled_task``) and the async executor below share it.
+
+``run_many`` runs a batch of executions on one event loop, at most
+``concurrency`` at a time. Handlers are awaited on the loop; the database
+phases are synchronous and run through ``sync_to_async``, so they are kept
+off the loop and use a single connection.
+
+Each run holds the task's execution lease (see ``leases``) from before its
+bookkeeping starts until its outcome is recorded; what a run that finds the
+lease taken does depends on the task's overlap policy.
+
+Execution metrics are emitted once the outcome is committed, so a run whose
+bookkeeping rolls back is not counted.
+"""
+import asyncio
+import time
+import traceback
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django_celery_beat.models import PeriodicTasks
+
+from . import metrics
+from .caching import bump_version
+from .changes import record_task_change
+from .events import publish_task_status
+from .handlers import get_handler
+from .leases import ExecutionLease
+from .models import ExecutionLog, ScheduledTask
+from .notifications import flush_notifications, notify
+from .schedules import periodic_task_queryset
+
+
+def claim_execution(task):
+    """
+    Take the task's execution lease. Returns the lease, to be released once
+    the run is recorded, or None if another run holds it. Tasks that allow
+    overlapping runs get a lease that was never acquired.
+    """
+    lease = ExecutionLease(task.id)
+    if task.get_overlap_policy() == 'ALLOW' or lease.acquire():
+        return lease
+    return None
+
+
+def start_execution(task):
+    """
+    Record that a run of ``task`` started. Returns how late it started
+    against its scheduled time, or None for runs that were not due, such as
+    execute_now.
+
+    This commits on its own rather than with the outcome: the handler runs
+    in between, for as long as it takes, and a transaction held open across
+    it would keep the task row locked (and, on SQLite, every writer waiting)
+    for the whole run. Committing first also moves next_execution forward
+    and logs the TaskChange while the run is in progress, so beat and
+    recovery_scan don't fire the task again meanwhile.
+    """
+    started_at = timezone.now()
+    due = task.next_execution
+    start_lag = (started_at - due).total_seconds() if due and due <= started_at else None
+
+    # Only the bookkeeping columns are written, and the counter is
+    # incremented in the database so concurrent runs don't lose counts.
+    task.last_execution = started_at
+    task.total_executions = F('total_executions') + 1
+    task.next_execution = task.compute_next_execution(task.last_execution)
+    task.save(update_fields=['last_execution', 'total_executions', 'next_execution', 'updated_at'])
+    task.refresh_from_db(fields=['total_executions'])
+    record_task_change(task.id, execution=True)
+    publish_task_status(task)
+    return start_lag
+
+
+def record_skipped(task, retry_count, reason="Previous run still in progress"):
+    ExecutionLog.objects.create(task=task, status="SKIPPED", message=reason, retry_count=retry_count)
+    bump_version('tasks')
+    transaction.on_commit(partial(metrics.record_execution, "SKIPPED", task.priority))
+    return {"status": "skipped", "task_id": task.id, "reason": reason}
+
+
+@transaction.atomic
+def record_success(task, execution_time, retry_count, start_lag=None):
+    log = ExecutionLog.objects.create(
+        task=task,
+        status="SUCCESS",
+        message=f"Task executed successfully in {execution_time:.2f}s",
+        execution_time=execution_time,
+        retry_count=retry_count,
+        start_lag=start_lag
+    )
+    transaction.on_commit(partial(metrics.record_execution, "SUCCESS", task.priority, execution_time, start_lag))
+    bump_version('tasks')
+
+    notify(
+        title=f"✓ Task Executed: {task.name}",
+        message=f"Task '{task.name}' completed successfully at {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}.",
+        category='TASK_EXECUTED',
+        priority='MEDIUM',
+        task=task,
+        execution_log=log
+    )
+
+    if task.schedule_type == "ONE_TIME":
+        task.executed_once = True
+        task.is_active = False
+        task.status = 'COMPLETED'
+        task.next_execution = None
+        task.save(update_fields=['executed_once', 'is_active', 'status', 'next_execution', 'updated_at'])
+        record_task_change(task.id, execution=True)
+
+        periodic_task_queryset(task).update(enabled=False)
+
+        notify(
+            title=f"✓ Task Completed: {task.name}",
+            message=f"One-time task '{task.name}' has been completed.",
+            category='TASK_COMPLETED',
+            priority='LOW',
+            task=task
+        )
+        publish_task_status(task)
+
+    return {
+        "status": "success",
+        "task_id": task.id,
+        "execution_time": execution_time,
+        "total_executions": task.total_executions
+    }
+
+
+@transaction.atomic
+def record_failure(task_id, task, exc, execution_time, retry_count, start_lag=None):
+    log = ExecutionLog.objects.create(
+        task_id=task_id,
+        status="FAILED",
+        message=str(exc),
+        error_details={
+            "error": str(exc),
+            "traceback": "".join(traceback.format_exception(exc)),
+            "retry_count": retry_count
+        },
+        execution_time=execution_time,
+        retry_count=retry_count,
+        start_lag=start_lag
+    )
+    transaction.on_commit(partial(
+        metrics.record_execution, "FAILED", task.priority if task else None, execution_time, start_lag
+    ))
+    bump_version('tasks')
+
+    notify(
+        title=f"✗ Task Failed: {task.name if task else 'Unknown'}",
+        message=f"Task execution failed: {str(exc)}",
+        category='TASK_FAILED',
+        priority='HIGH',
+        task=task,
+        execution_log=log
+    )
+    return log
+
+
+@transaction.atomic
+def record_exhausted(task):
+    """Retries ran out: the task goes to FAILED and is no longer scheduled."""
+    task.status = 'FAILED'
+    task.is_active = False
+    task.next_execution = None
+    task.save(update_fields=['status', 'is_active', 'next_execution', 'updated_at'])
+    record_task_change(task.id)
+
+    periodic_task_queryset(task).update(enabled=False)
+    PeriodicTasks.update_changed()
+
+    notify(
+        title=f"✗ Task Disabled: {task.name}",
+        message=f"Task '{task.name}' failed after {task.max_retries} retries and has been disabled.",
+        category='TASK_FAILED',
+        priority='CRITICAL',
+        task=task
+    )
+    publish_task_status(task)
+
+
+async def execute(task_id, semaphore, on_failure=None, on_overlap=None):
+    """Async counterpart of ``execute_scheduled_task`` for one task."""
+    async with semaphore:
+        start_time = time.time()
+        task, start_lag, lease = None, None, None
+        try:
+            task = await sync_to_async(ScheduledTask.objects.get)(id=task_id)
+            if not task.is_active:
+                return {"status": "skipped", "task_id": task_id, "reason": "Task is inactive"}
+
+            lease = await sync_to_async(claim_execution)(task)
+            if lease is None:
+                return await sync_to_async(on_overlap or record_skipped)(task, 0)
+
+            start_lag = await sync_to_async(start_execution)(task)
+            await get_handler().arun(task)
+
+            return await sync_to_async(record_success)(task, time.time() - start_time, 0, start_lag)
+
+        except ScheduledTask.DoesNotExist:
+            return {"status": "failed", "task_id": task_id, "reason": "Task not found"}
+
+        except Exception as e:
+            await sync_to_async(record_failure)(task_id, task, e, time.time() - start_time, 0, start_lag)
+            if task is not None and on_failure:
+                await sync_to_async(on_failure)(task)
+            return {"status": "failed", "task_id": task_id, "reason": str(e)}
+
+        finally:
+            if lease is not None:
+                await sync_to_async(lease.release)()
+
+
+async def _run_many(task_ids, concurrency, on_failure, on_overlap):
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(*(
+            execute(task_id, semaphore, on_failure, on_overlap) for task_id in task_ids
+        ))
+    finally:
+        await sync_to_async(flush_notifications)()
+        await sync_to_async(close_old_connections)()
+
+
+def run_many(task_ids, concurrency, on_failure=None, on_overlap=None):
+    """
+    Execute ``task_ids`` on a fresh event loop and return one result per id.
+    ``on_failure(task)`` is called after a failed run is recorded, and
+    ``on_overlap(task, retry_count)`` instead of running a task whose lease
+    is held; by default such a run is recorded as skipped.
+    """
+    return asyncio.run(_run_many(task_ids, concurrency, on_failure, on_overlap))
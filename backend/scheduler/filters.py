@@ -6,6 +6,7 @@ class ScheduledTaskFilter(django_filters.FilterSet):
     
     schedule_type = django_filters.ChoiceFilter(choices=ScheduledTask.SCHEDULE_TYPE_CHOICES)
     status = django_filters.ChoiceFilter(choices=ScheduledTask.STATUS_CHOICES)
+    priority = django_filters.ChoiceFilter(choices=ScheduledTask.PRIORITY_CHOICES)
     is_active = django_filters.BooleanFilter()
     executed_once = django_filters.BooleanFilter()
     
@@ -16,7 +17,7 @@ class ScheduledTaskFilter(django_filters.FilterSet):
     
     class Meta:
         model = ScheduledTask
-        fields = ['schedule_type', 'status', 'is_active', 'executed_once']
+        fields = ['schedule_type', 'status', 'priority', 'is_active', 'executed_once']
         
 class NotificationFilter(django_filters.FilterSet):
     is_read = django_filters.BooleanFilter()
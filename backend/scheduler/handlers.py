@@ -0,0 +1,62 @@
+import asyncio
+import random
+import time
+from functools import lru_cache
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class TaskHandler:
+    """
+    The work a ScheduledTask stands for.
+
+    Subclass this for blocking work and implement ``run``; subclass
+    ``AsyncTaskHandler`` for I/O-bound work and implement ``arun``. Either
+    kind can be driven from a prefork worker (``run``) or from the async
+    executor (``arun``). The return value is ignored; raising marks the
+    execution as failed.
+    """
+
+    def run(self, task):
+        raise NotImplementedError
+
+    async def arun(self, task):
+        # Blocking handlers get a thread of their own so they don't stall
+        # the event loop.
+        return await sync_to_async(self.run, thread_sensitive=False)(task)
+
+
+class AsyncTaskHandler(TaskHandler):
+
+    async def arun(self, task):
+        raise NotImplementedError
+
+    def run(self, task):
+        return async_to_sync(self.arun)(task)
+
+
+class SimulatedWork(TaskHandler):
+    """Stand-in for real work: sleeps 0.5-2s and fails half the time."""
+
+    def run(self, task):
+        time.sleep(random.uniform(0.5, 2.0))
+        if random.random() < 0.5:
+            raise Exception("Simulated random task failure")
+        return {"result": "success"}
+
+
+class SimulatedIOWork(AsyncTaskHandler):
+    """``SimulatedWork`` as an awaitable wait, like an HTTP callback."""
+
+    async def arun(self, task):
+        await asyncio.sleep(random.uniform(0.5, 2.0))
+        if random.random() < 0.5:
+            raise Exception("Simulated random task failure")
+        return {"result": "success"}
+
+
+@lru_cache(maxsize=None)
+def get_handler():
+    return import_string(settings.TASK_EXECUTION['HANDLER'])()
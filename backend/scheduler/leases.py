@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseBackend:
+    """
+    Store for short-lived exclusive leases.
+
+    ``acquire`` returns a token if ``key`` was free (or its previous lease
+    expired) and None otherwise; ``release`` frees the lease only if it is
+    still held with ``token``, so a run that outlived its TTL cannot free a
+    lease someone else has taken since.
+    """
+
+    def acquire(self, key, ttl):
+        raise NotImplementedError
+
+    def release(self, key, token):
+        raise NotImplementedError
+
+
+class LocalLeaseBackend(LeaseBackend):
+    """Single-process leases for tests and local development."""
+
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            held = self._leases.get(key)
+            if held and held[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._leases[key] = (token, now + ttl)
+            return token
+
+    def release(self, key, token):
+        with self._lock:
+            if self._leases.get(key, (None,))[0] == token:
+                del self._leases[key]
+
+
+class DatabaseLeaseBackend(LeaseBackend):
+    """Leases as ExecutionLease rows, for deployments without Redis."""
+
+    def acquire(self, key, ttl):
+        from .models import ExecutionLease
+
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        expires_at = now + timedelta(seconds=ttl)
+        if ExecutionLease.objects.filter(key=key, expires_at__lte=now).update(token=token, expires_at=expires_at):
+            return token
+        try:
+            with transaction.atomic():
+                ExecutionLease.objects.create(key=key, token=token, expires_at=expires_at)
+        except IntegrityError:
+            return None
+        return token
+
+    def release(self, key, token):
+        from .models import ExecutionLease
+
+        ExecutionLease.objects.filter(key=key, token=token).delete()
+
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLeaseBackend(LeaseBackend):
+    """
+    ``SET NX PX`` leases. If Redis cannot be reached, leases are taken from
+    ``fallback`` (a backend path) instead of letting every run through.
+
+    Tokens from the fallback carry ``FALLBACK_PREFIX``, so a lease is
+    released where it was granted whatever state Redis is in by then.
+    """
+
+    FALLBACK_PREFIX = 'fallback:'
+
+    def __init__(self, url, prefix='scheduler:lease:', fallback=None):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.fallback = import_string(fallback)() if fallback else None
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+        self._errors = (redis.ConnectionError, redis.TimeoutError)
+
+    def acquire(self, key, ttl):
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.client.set(self.prefix + key, token, nx=True, px=int(ttl * 1000))
+        except self._errors:
+            if self.fallback is None:
+                raise
+            logger.warning("Redis unavailable, taking lease %s from the fallback backend", key)
+            token = self.fallback.acquire(key, ttl)
+            return self.FALLBACK_PREFIX + token if token else None
+        return token if acquired else None
+
+    def release(self, key, token):
+        if token.startswith(self.FALLBACK_PREFIX):
+            self.fallback.release(key, token[len(self.FALLBACK_PREFIX):])
+            return
+        try:
+            self._release(keys=[self.prefix + key], args=[token])
+        except self._errors:
+            if self.fallback is None:
+                raise
+            logger.warning("Redis unavailable, lease %s will be freed when it expires", key)
+
+
+@lru_cache(maxsize=None)
+def get_lease_backend():
+    config = settings.EXECUTION_LEASE
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+class ExecutionLease:
+    """The lease that keeps two runs of one ScheduledTask from overlapping."""
+
+    def __init__(self, task_id, ttl=None):
+        self.key = f"execution:{task_id}"
+        self.ttl = ttl or settings.EXECUTION_LEASE['TTL']
+        self.token = None
+
+    def acquire(self):
+        self.token = get_lease_backend().acquire(self.key, self.ttl)
+        return self.token is not None
+
+    def release(self):
+        if self.token is not None:
+            get_lease_backend().release(self.key, self.token)
+            self.token = None
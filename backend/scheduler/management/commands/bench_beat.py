@@ -0,0 +1,137 @@
+import json
+import math
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from django_celery_beat.models import IntervalSchedule, PeriodicTask, PeriodicTasks
+from django_celery_beat.schedulers import DatabaseScheduler
+
+from config.celery import app
+from scheduler.beat import HeapScheduler
+from scheduler.changes import record_task_change
+from scheduler.events import get_broker
+from scheduler.models import ScheduledTask
+from scheduler.schedules import EXECUTE_TASK, periodic_task_name
+
+# Keep every write's side effects in process, so ticks are not timed
+# against Redis (or its connection errors, where there is none).
+OFFLINE_SETTINGS = {
+    'NOTIFICATION_STREAM': {'BACKEND': 'scheduler.events.InMemoryEventBroker'},
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+}
+
+
+class OfflineDatabaseScheduler(DatabaseScheduler):
+    def apply_entry(self, entry, producer=None):
+        pass
+
+
+class OfflineHeapScheduler(HeapScheduler):
+    def apply_entry(self, entry, producer=None):
+        pass
+
+    def send_executions(self, tasks):
+        pass
+
+
+def seed(size):
+    now = timezone.now()
+    ScheduledTask.objects.bulk_create(
+        [
+            ScheduledTask(
+                name=f"bench-{i}", schedule_type='INTERVAL', interval_seconds=3600, last_execution=now
+            )
+            for i in range(size)
+        ],
+        batch_size=5000
+    )
+    interval = IntervalSchedule.objects.create(every=3600, period='seconds')
+    PeriodicTask.objects.bulk_create(
+        [
+            PeriodicTask(
+                name=periodic_task_name(task_id), task=EXECUTE_TASK, interval=interval,
+                args=json.dumps([task_id]), last_run_at=now
+            )
+            for task_id in ScheduledTask.objects.values_list('id', flat=True)
+        ],
+        batch_size=5000
+    )
+    PeriodicTasks.update_changed()
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[max(0, math.ceil(len(samples) * 0.95) - 1)] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def bench(scheduler_class, edit, ticks):
+    started = time.perf_counter()
+    scheduler = scheduler_class(app=app)
+    scheduler.tick()
+    setup = time.perf_counter() - started
+
+    samples = []
+    for _ in range(ticks):
+        edit()
+        started = time.perf_counter()
+        scheduler.tick()
+        samples.append(time.perf_counter() - started)
+    return {"setup_s": round(setup, 3), **summarize(samples)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare beat tick latency of DatabaseScheduler and HeapScheduler with one "
+        "task edit per tick. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--ticks', type=int, default=10)
+        parser.add_argument('--output', help="Write the JSON results to this file as well.")
+
+    def handle(self, *args, **options):
+        results = []
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(**OFFLINE_SETTINGS):
+                get_broker.cache_clear()
+                for size in options['sizes']:
+                    call_command('flush', interactive=False, verbosity=0)
+                    seed(size)
+                    task_ids = list(ScheduledTask.objects.values_list('id', flat=True))
+                    heap_edit = lambda: record_task_change(random.choice(task_ids))
+
+                    def database_edit():
+                        PeriodicTask.objects.filter(
+                            name=periodic_task_name(random.choice(task_ids))
+                        ).update(last_run_at=timezone.now() - timedelta(seconds=1))
+                        PeriodicTasks.update_changed()
+
+                    result = {
+                        "tasks": size,
+                        "DatabaseScheduler": bench(OfflineDatabaseScheduler, database_edit, options['ticks']),
+                        "HeapScheduler": bench(OfflineHeapScheduler, heap_edit, options['ticks']),
+                    }
+                    results.append(result)
+                    self.stderr.write(json.dumps(result))
+        finally:
+            get_broker.cache_clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output)
+        self.stdout.write(output)
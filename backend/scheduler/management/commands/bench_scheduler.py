@@ -0,0 +1,228 @@
+import json
+import math
+import platform
+import random
+import resource
+import subprocess
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from config.celery import app
+from scheduler.beat import HeapScheduler
+from scheduler.events import get_broker
+from scheduler.leases import get_lease_backend
+from scheduler.models import ExecutionLog, ScheduledTask
+from scheduler.notifications import flush_notifications, get_sink
+from scheduler.retries import get_retry_budget
+from scheduler.schedules import provision_periodic_tasks
+from scheduler.tasks import execute_scheduled_task, recovery_scan
+
+from .bench_beat import summarize
+
+# Everything runs in this process: events and cached responses stay in
+# memory, leases and the retry budget are local, and notifications are written as they happen so
+# their inserts count towards each execution.
+OFFLINE_SETTINGS = {
+    'NOTIFICATION_STREAM': {'BACKEND': 'scheduler.events.InMemoryEventBroker'},
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'NOTIFICATION_SINK': {'SYNCHRONOUS': True},
+    'EXECUTION_LEASE': {'BACKEND': 'scheduler.leases.LocalLeaseBackend', 'TTL': 900, 'QUEUE_DELAY': 30},
+    'RETRY': {
+        'MAX_DELAY': 3600,
+        'MIN_DELAY': 1,
+        'BUDGET': {'BACKEND': 'scheduler.retries.LocalRetryBudget', 'LIMIT': 1000, 'WINDOW': 60},
+    },
+    'TASK_EXECUTION': {'HANDLER': 'scheduler.handlers.SimulatedWork', 'MODE': 'prefork'},
+}
+
+CACHED_BACKENDS = [get_broker, get_sink, get_lease_backend, get_retry_budget]
+
+SCHEDULE_TYPES = ['ONE_TIME', 'CRON', 'INTERVAL']
+
+
+class OfflineHeapScheduler(HeapScheduler):
+    """HeapScheduler that collects what it would send instead of sending it."""
+
+    def __init__(self, *args, **kwargs):
+        self.sent = []
+        super().__init__(*args, **kwargs)
+
+    def apply_entry(self, entry, producer=None):
+        pass
+
+    def send_executions(self, tasks):
+        self.sent.extend(tasks)
+
+
+def deterministic_logic(fail_every):
+    """An execute_task_logic stand-in that fails every ``fail_every``-th task id."""
+    def run(task):
+        if fail_every and task.id % fail_every == 0:
+            raise Exception("Benchmark failure")
+        return {"result": "success"}
+    return run
+
+
+def seed(size, rng):
+    """
+    ``size`` tasks, a third of each schedule type, all due within the last
+    minute so the first beat tick fires them.
+    """
+    now = timezone.now()
+    tasks = []
+    for i in range(size):
+        schedule_type = SCHEDULE_TYPES[i % len(SCHEDULE_TYPES)]
+        due = now - timedelta(seconds=rng.uniform(0, 60))
+        task = ScheduledTask(
+            name=f"bench-{i}", schedule_type=schedule_type, max_retries=0, next_execution=due,
+            priority=rng.choice(['LOW', 'MEDIUM', 'HIGH'])
+        )
+        if schedule_type == 'ONE_TIME':
+            task.scheduled_time = due
+        elif schedule_type == 'INTERVAL':
+            task.interval_seconds = 3600
+            task.last_execution = due - timedelta(seconds=3600)
+        tasks.append(task)
+
+    started = time.perf_counter()
+    tasks = ScheduledTask.objects.bulk_create(tasks, batch_size=5000)
+    provision_periodic_tasks(tasks, batch_size=5000)
+    return time.perf_counter() - started
+
+
+def bench_beat(max_ticks):
+    started = time.perf_counter()
+    scheduler = OfflineHeapScheduler(app=app)
+    setup = time.perf_counter() - started
+
+    samples = []
+    for _ in range(max_ticks):
+        fired = len(scheduler.sent)
+        started = time.perf_counter()
+        scheduler.tick()
+        samples.append(time.perf_counter() - started)
+        if len(scheduler.sent) == fired:
+            break
+    return scheduler.sent, {"setup_s": round(setup, 3), "ticks": len(samples), **summarize(samples)}
+
+
+def bench_workers(executions):
+    queries = []
+    samples = []
+
+    def count_query(execute, sql, params, many, context):
+        queries[-1] += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        for task_id, priority in executions:
+            queries.append(0)
+            run_started = time.perf_counter()
+            execute_scheduled_task.apply(args=[task_id], kwargs={'priority': priority})
+            samples.append(time.perf_counter() - run_started)
+    elapsed = time.perf_counter() - started
+
+    lags = sorted(ExecutionLog.objects.filter(start_lag__isnull=False).values_list('start_lag', flat=True))
+    queries.sort()
+    return {
+        "executions": len(executions),
+        "executions_per_s": round(len(executions) / elapsed, 1) if elapsed else None,
+        **summarize(samples),
+        "queries_per_execution_p50": queries[len(queries) // 2],
+        "queries_per_execution_max": queries[-1],
+        "start_lag_p95_s": round(lags[max(0, math.ceil(len(lags) * 0.95) - 1)], 3) if lags else None,
+        "statuses": dict(
+            (status, ExecutionLog.objects.filter(status=status).count())
+            for status in ['SUCCESS', 'FAILED', 'SKIPPED']
+        ),
+    }
+
+
+def bench_recovery():
+    # What the scan would queue is counted, not executed.
+    with mock.patch('scheduler.tasks.dispatch_executions'):
+        started = time.perf_counter()
+        result = recovery_scan()
+    return {"duration_s": round(time.perf_counter() - started, 3), **result}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed ONE_TIME, CRON and INTERVAL tasks, then time beat ticks, worker executions "
+        "and a recovery scan in-process, and report throughput, query counts, start lag "
+        "and memory as JSON. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--executions', type=int, default=1000,
+                            help="How many of the fired executions to run per size.")
+        parser.add_argument('--ticks', type=int, default=200, help="Most beat ticks per size.")
+        parser.add_argument('--fail-every', type=int, default=10,
+                            help="Fail executions of every n-th task id; 0 for none.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON results to this file as well.")
+
+    def handle(self, *args, **options):
+        report = {
+            "revision": git_revision(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "started_at": timezone.now().isoformat(),
+            "options": {key: options[key] for key in ['sizes', 'executions', 'ticks', 'fail_every', 'seed']},
+            "results": [],
+        }
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(**OFFLINE_SETTINGS), \
+                    mock.patch('scheduler.tasks.execute_task_logic', deterministic_logic(options['fail_every'])):
+                for size in options['sizes']:
+                    for backend in CACHED_BACKENDS:
+                        backend.cache_clear()
+                    call_command('flush', interactive=False, verbosity=0)
+                    rng = random.Random(options['seed'])
+
+                    seed_seconds = seed(size, rng)
+                    fired, beat = bench_beat(options['ticks'])
+                    workers = bench_workers(fired[:options['executions']])
+                    flush_notifications()
+                    result = {
+                        "tasks": size,
+                        "seed_s": round(seed_seconds, 3),
+                        "beat": {**beat, "fired": len(fired)},
+                        "workers": workers,
+                        "recovery": bench_recovery(),
+                        # ru_maxrss is in KiB on Linux and never goes down, so
+                        # this is the peak up to and including this size.
+                        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                    }
+                    report["results"].append(result)
+                    self.stderr.write(json.dumps(result))
+        finally:
+            for backend in CACHED_BACKENDS:
+                backend.cache_clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output)
+        self.stdout.write(output)
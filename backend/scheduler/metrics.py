@@ -0,0 +1,103 @@
+"""
+Prometheus metrics for executions, retries, recovery_scan and the API.
+
+Each prefork child and web worker is its own process, so metrics are only
+correct across them in prometheus_client's multiprocess mode: start every
+process with ``PROMETHEUS_MULTIPROC_DIR`` pointing at the same directory,
+emptied before the processes start. ``/metrics`` then adds up the files
+all processes write. Without it each process reports only its own values.
+
+Recording is a few in-memory (or mmap) increments, well under a
+millisecond per execution; set ``METRICS['ENABLED']`` to False to skip it.
+"""
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+LAG_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+EXECUTIONS = Counter(
+    'scheduler_executions_total', "Executions by outcome.", ['status', 'priority']
+)
+EXECUTION_SECONDS = Histogram(
+    'scheduler_execution_seconds', "Execution time of finished runs.", ['priority'], buckets=DURATION_BUCKETS
+)
+START_LAG_SECONDS = Histogram(
+    'scheduler_start_lag_seconds', "Seconds between the scheduled time and the start of a run.",
+    ['priority'], buckets=LAG_BUCKETS
+)
+RETRIES = Counter(
+    'scheduler_retries_total', "What happened after a failed run: scheduled, over_budget or exhausted.",
+    ['outcome']
+)
+RECOVERY_TASKS = Counter(
+    'scheduler_recovery_tasks_total', "Tasks recovery_scan acted on, by kind.", ['kind']
+)
+RECOVERY_SECONDS = Histogram(
+    'scheduler_recovery_scan_seconds', "Duration of each recovery_scan phase.", ['phase'],
+    buckets=DURATION_BUCKETS
+)
+HTTP_REQUESTS = Counter(
+    'scheduler_http_requests_total', "API requests.", ['view', 'method', 'status']
+)
+HTTP_SECONDS = Histogram(
+    'scheduler_http_request_seconds', "API response time.", ['view'], buckets=DURATION_BUCKETS
+)
+HTTP_QUERIES = Histogram(
+    'scheduler_http_request_queries', "Database queries per API request.", ['view'], buckets=QUERY_BUCKETS
+)
+
+
+def enabled():
+    return settings.METRICS['ENABLED']
+
+
+def record_execution(status, priority, execution_time=None, start_lag=None):
+    if not enabled():
+        return
+    priority = priority or 'UNKNOWN'
+    EXECUTIONS.labels(status, priority).inc()
+    if execution_time is not None:
+        EXECUTION_SECONDS.labels(priority).observe(execution_time)
+    if start_lag is not None:
+        START_LAG_SECONDS.labels(priority).observe(start_lag)
+
+
+def record_retry(outcome):
+    if enabled():
+        RETRIES.labels(outcome).inc()
+
+
+def record_recovery_scan(result):
+    if not enabled():
+        return
+    for kind in ['backfilled_tasks', 'recovered_tasks', 'stuck_tasks', 'rebuilt_schedules']:
+        RECOVERY_TASKS.labels(kind).inc(result[kind])
+    for phase, seconds in result['timings'].items():
+        RECOVERY_SECONDS.labels(phase.removesuffix('_seconds')).observe(seconds)
+
+
+def record_request(view, method, status, duration, queries):
+    if not enabled():
+        return
+    HTTP_REQUESTS.labels(view, method, status).inc()
+    HTTP_SECONDS.labels(view).observe(duration)
+    HTTP_QUERIES.labels(view).observe(queries)
+
+
+def metrics_view(request):
+    """Text exposition for Prometheus to scrape."""
+    if not enabled():
+        raise Http404
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,49 @@
+import time
+
+from django.db import connection
+
+from . import metrics
+from .notifications import flush_notifications
+
+
+class NotificationSinkMiddleware:
+    """Write notifications queued by a request before its response goes out."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        flush_notifications()
+        return response
+
+
+class MetricsMiddleware:
+    """Count requests, their response time and their database queries per view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.enabled():
+            return self.get_response(request)
+
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        match = request.resolver_match
+        metrics.record_request(
+            match.view_name if match else 'unresolved',
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            queries
+        )
+        return response
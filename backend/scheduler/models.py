@@ -1,8 +1,13 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+from django_celery_beat.models import PeriodicTask
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from datetime import timedelta
 import json
 
+from .cron import CronError, task_cron
+
 
 class ScheduledTask(models.Model):
     SCHEDULE_TYPE_CHOICES = [
@@ -19,11 +24,27 @@ class ScheduledTask(models.Model):
         ('PENDING', 'Pending'),
     ]
 
+    PRIORITY_CHOICES = [
+        ('LOW', 'Low'),
+        ('MEDIUM', 'Medium'),
+        ('HIGH', 'High'),
+    ]
+
+    OVERLAP_POLICY_CHOICES = [
+        ('SKIP', 'Skip while a run is in progress'),
+        ('QUEUE', 'Wait for the run in progress'),
+        ('ALLOW', 'Allow overlapping runs'),
+    ]
+
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, help_text="Detailed description of the task")
     
     schedule_type = models.CharField(max_length=20, choices=SCHEDULE_TYPE_CHOICES, default='ONE_TIME')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
+    priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='MEDIUM',
+                                help_text="Selects the Celery queue executions are sent to")
+    overlap_policy = models.CharField(max_length=10, choices=OVERLAP_POLICY_CHOICES, default='SKIP',
+                                      help_text="What a run does when another run of the task holds the lease")
     
     scheduled_time = models.DateTimeField(null=True, blank=True)
     
@@ -42,34 +63,95 @@ class ScheduledTask(models.Model):
     total_executions = models.IntegerField(default=0)
     last_execution = models.DateTimeField(null=True, blank=True)
     next_execution = models.DateTimeField(null=True, blank=True)
+    periodic_task = models.OneToOneField(PeriodicTask, on_delete=models.SET_NULL, null=True, blank=True,
+                                         related_name='scheduled_task')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.CharField(max_length=255, blank=True, null=True)
     
     max_retries = models.IntegerField(default=3)
-    retry_delay = models.IntegerField(default=60, help_text="Delay in seconds between retries")
+    retry_delay = models.IntegerField(default=60, help_text="Delay in seconds before the first retry; doubles for each one after")
+    retry_max_delay = models.IntegerField(null=True, blank=True,
+                                          help_text="Cap on the retry delay in seconds; defaults to RETRY['MAX_DELAY']")
+    retry_jitter = models.BooleanField(default=True,
+                                       help_text="Draw each retry delay at random between zero and its backoff value")
+    notification_digest_window = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Seconds over which successful runs share one notification; defaults to "
+                  "NOTIFICATION_COALESCING, 0 notifies every run"
+    )
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'scheduled_time']),
             models.Index(fields=['schedule_type']),
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['next_execution']),
         ]
 
     def can_be_modified(self):
         if self.schedule_type == "ONE_TIME":
             return not self.executed_once and timezone.now() < self.scheduled_time
-        return self.status in ['ACTIVE', 'PAUSED']
+        return self.status in ['ACTIVE', 'PAUSED', 'FAILED']
+
+    def can_be_resumed(self):
+        # A recurring task that ran out of retries is resumed like a paused
+        # one; a one-time task that failed is done.
+        return self.status == 'PAUSED' or (self.status == 'FAILED' and self.schedule_type != "ONE_TIME")
+
+    def compute_next_execution(self, now=None):
+        """When this task should fire next, or None if it is not scheduled to."""
+        now = now or timezone.now()
+        if not self.is_active or self.status not in ['ACTIVE', 'PENDING']:
+            return None
+        if self.schedule_type == "ONE_TIME":
+            return None if self.executed_once else self.scheduled_time
+        if self.schedule_type == "INTERVAL":
+            if not self.interval_seconds:
+                return None
+            return (self.last_execution or now) + timedelta(seconds=self.interval_seconds)
+        if self.schedule_type == "CRON":
+            try:
+                return task_cron(self).next_after(now)
+            except CronError:
+                return None
+        return None
+
+    def get_overlap_policy(self):
+        # A one-time task must never run twice, whatever the field says.
+        return 'SKIP' if self.schedule_type == "ONE_TIME" else self.overlap_policy
 
     def can_be_deleted(self):
-        return self.status not in ['COMPLETED', 'FAILED'] or \
-               (self.schedule_type == "ONE_TIME" and not self.executed_once)
+        if self.schedule_type == "ONE_TIME":
+            return self.status not in ['COMPLETED', 'FAILED'] or not self.executed_once
+        return self.status != 'COMPLETED'
 
     def __str__(self):
         return f"{self.name} ({self.get_schedule_type_display()})"
 
 
+class TaskChange(models.Model):
+    # Append-only: the autoincrement id is the change sequence readers
+    # resume from.
+    KIND_CHOICES = [
+        ('UPSERT', 'Created or updated'),
+        ('EXECUTION', 'Execution bookkeeping'),
+        ('DELETE', 'Deleted'),
+    ]
+
+    task_id = models.BigIntegerField(db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='UPSERT')
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} task {self.task_id}"
+
+
 class ExecutionLog(models.Model):
     STATUS_CHOICES = [
         ('SUCCESS', 'Success'),
@@ -86,11 +168,14 @@ class ExecutionLog(models.Model):
     error_details = models.JSONField(default=dict, blank=True)
     execution_time = models.FloatField(null=True, blank=True, help_text="Execution time in seconds")
     retry_count = models.IntegerField(default=0)
+    start_lag = models.FloatField(null=True, blank=True,
+                                  help_text="Seconds between the scheduled time and the start of the run")
     
     class Meta:
         ordering = ['-executed_at']
         indexes = [
             models.Index(fields=['task', '-executed_at']),
+            models.Index(fields=['executed_at']),
             models.Index(fields=['status']),
         ]
 
@@ -98,6 +183,56 @@ class ExecutionLog(models.Model):
         return f"{self.task.name} - {self.status} @ {self.executed_at}"
 
 
+class ExecutionLogRollup(models.Model):
+    GRANULARITY_CHOICES = [
+        ('HOUR', 'Hourly'),
+        ('DAY', 'Daily'),
+    ]
+
+    # NULL for the fleet-wide rollup of the bucket.
+    task = models.ForeignKey(ScheduledTask, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='execution_rollups')
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+
+    total_count = models.IntegerField(default=0)
+    success_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    retry_count = models.IntegerField(default=0)
+    skipped_count = models.IntegerField(default=0)
+    timeout_count = models.IntegerField(default=0)
+    retried_executions = models.IntegerField(default=0, help_text="Executions with retry_count > 0")
+
+    min_execution_time = models.FloatField(null=True, blank=True)
+    avg_execution_time = models.FloatField(null=True, blank=True)
+    max_execution_time = models.FloatField(null=True, blank=True)
+    p95_execution_time = models.FloatField(null=True, blank=True)
+    execution_time_sum = models.FloatField(default=0)
+    execution_time_histogram = models.JSONField(default=dict, blank=True,
+                                                help_text="Execution time counts per log-spaced bin")
+
+    class Meta:
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['task', 'granularity', 'bucket_start'],
+                name='unique_execution_log_rollup'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        name = self.task.name if self.task_id else "All tasks"
+        return f"{name} - {self.granularity} @ {self.bucket_start}"
+
+
+# When a notification last happened: a digest's latest occurrence, otherwise
+# its creation. Notification listings are ordered by it.
+LAST_ACTIVITY = Coalesce('last_occurred_at', 'created_at', output_field=models.DateTimeField())
+
+
 class Notification(models.Model):
     PRIORITY_CHOICES = [
         ('LOW', 'Low'),
@@ -126,6 +261,12 @@ class Notification(models.Model):
     
     is_read = models.BooleanField(default=False)
     is_archived = models.BooleanField(default=False)
+
+    # Set on digests: notifications that repeated occurrences of the same
+    # event are folded into (see NOTIFICATION_COALESCING).
+    occurrences = models.PositiveIntegerField(default=1)
+    first_occurred_at = models.DateTimeField(null=True, blank=True)
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     expires_at = models.DateTimeField(null=True, blank=True)
@@ -135,11 +276,66 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['is_read', '-created_at']),
             models.Index(fields=['task', '-created_at']),
+            models.Index(LAST_ACTIVITY.desc(), models.F('id').desc(), name='notification_last_activity'),
         ]
 
     def __str__(self):
         return f"{self.title} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
     def mark_as_read(self):
-        self.is_read = True
-        self.save(update_fields=['is_read'])
\ No newline at end of file
+        from .counters import set_read
+        set_read(self, True)
+
+class NotificationCounter(models.Model):
+    category = models.CharField(max_length=50, choices=Notification.CATEGORY_CHOICES)
+    priority = models.CharField(max_length=20, choices=Notification.PRIORITY_CHOICES)
+    unread = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'priority'], name='unique_notification_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.category}/{self.priority}: {self.unread} unread"
+
+
+class ChangeLogPurge(models.Model):
+    # The highest id retention has deleted from each change log (by model
+    # label): a cursor below it may have missed changes.
+    log = models.CharField(max_length=100, unique=True)
+    purged_through = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.log} purged through #{self.purged_through}"
+
+
+class NotificationChange(models.Model):
+    # Append-only, like TaskChange: the id is the cursor of
+    # /api/notifications/changes/.
+    KIND_CHOICES = [
+        ('UPSERT', 'Created or updated'),
+        ('DELETE', 'Deleted'),
+    ]
+
+    notification_id = models.BigIntegerField(db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='UPSERT')
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} notification {self.notification_id}"
+
+
+class ExecutionLease(models.Model):
+    # Rows for scheduler.leases.DatabaseLeaseBackend; a row whose expires_at
+    # has passed is free to be taken over.
+    key = models.CharField(max_length=100, unique=True)
+    token = models.CharField(max_length=32)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} until {self.expires_at}"
@@ -0,0 +1,232 @@
+import threading
+from datetime import timedelta
+from functools import lru_cache, partial
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from . import counters
+from .caching import bump_version
+from .changes import record_notification_change
+from .events import publish_notification
+from .models import ExecutionLog, Notification, ScheduledTask
+
+
+def digest_window(notification):
+    """
+    The coalescing window, in seconds, of ``notification``, or None if it is
+    always written as a row of its own. Only notifications about a recurring
+    task in a category listed in NOTIFICATION_COALESCING are coalesced; the
+    task's ``notification_digest_window`` overrides the category's window.
+    """
+    rule = settings.NOTIFICATION_COALESCING.get(notification.category)
+    if rule is None:
+        return None
+    task = notification.task
+    if task is None or task.schedule_type == 'ONE_TIME':
+        return None
+    window = task.notification_digest_window
+    return (rule['WINDOW'] if window is None else window) or None
+
+
+class NotificationSink:
+    """
+    Write-behind buffer for notifications.
+
+    Notifications added inside a transaction are queued when it commits (and
+    dropped if it rolls back); the queue is written with one ``bulk_create``
+    once it holds ``max_batch`` rows or its oldest row is ``max_delay``
+    seconds old. ``synchronous`` writes every notification straight away,
+    inside the caller's transaction, which is what tests want.
+
+    Notifications with a ``digest_window`` are coalesced on write: a run of
+    them for the same task and category, uninterrupted by any other
+    notification about the task, becomes one digest row whose
+    ``occurrences`` and ``last_occurred_at`` grow until the window after
+    its first occurrence has passed or it is read. Everything else, such as
+    failures and status changes, is written as it comes and ends the run.
+    """
+
+    def __init__(self, max_batch=500, max_delay=1.0, synchronous=False):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.synchronous = synchronous
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, notification):
+        if digest_window(notification):
+            notification.first_occurred_at = notification.last_occurred_at = timezone.now()
+        if self.synchronous:
+            self.write([notification])
+        elif connection.in_atomic_block:
+            transaction.on_commit(partial(self._enqueue, notification))
+        else:
+            self._enqueue(notification)
+        return notification
+
+    def _enqueue(self, notification):
+        with self._lock:
+            self._buffer.append(notification)
+            full = len(self._buffer) >= self.max_batch
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if batch:
+            self.write(batch)
+        return len(batch)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def write(self, batch):
+        try:
+            self._write(batch)
+        except IntegrityError:
+            # A task (and its logs) can be deleted while its notifications
+            # wait in the buffer; keep the notification, drop the reference.
+            self._drop_dangling_references(batch)
+            self._write(batch)
+
+    def _write(self, batch):
+        with transaction.atomic():
+            rows, digests = self._coalesce(batch)
+            self._extend_digests(digests)
+            # Digests added to a stored row have taken its primary key.
+            rows = [notification for notification in rows if notification.pk is None]
+            Notification.objects.bulk_create(rows)
+            counters.record_created(*rows)
+            for notification in rows:
+                publish_notification(notification)
+
+    def _coalesce(self, batch):
+        """
+        Fold the batch's runs of coalesced notifications into their first
+        notification. Returns the notifications to write, in order, and
+        those of them that may instead extend a stored digest row: runs
+        with nothing about their task before them in the batch.
+        """
+        rows, digests = [], []
+        open_runs = {}
+        interrupted = set()
+        for notification in batch:
+            window = digest_window(notification)
+            if window is None:
+                rows.append(notification)
+                interrupted.add(notification.task_id)
+                for key in [key for key in open_runs if key[0] == notification.task_id]:
+                    del open_runs[key]
+                continue
+
+            key = (notification.task_id, notification.category)
+            digest = open_runs.get(key)
+            if digest is not None and \
+                    notification.last_occurred_at - digest.first_occurred_at < timedelta(seconds=window):
+                digest.occurrences += 1
+                digest.last_occurred_at = notification.last_occurred_at
+                digest.execution_log = notification.execution_log
+                digest.message = notification.message
+                continue
+
+            notification.occurrences = 1
+            notification.last_occurred_at = notification.first_occurred_at
+            open_runs[key] = notification
+            rows.append(notification)
+            if digest is None and notification.task_id not in interrupted:
+                digests.append(notification)
+        return rows, digests
+
+    def _extend_digests(self, digests):
+        """
+        Add each digest to its task's open digest row, if there is one and
+        nothing about the task has been written since, and give it that
+        row's primary key.
+        """
+        if not digests:
+            return
+        latest = Notification.objects.filter(task_id=OuterRef('task_id'), id__gt=OuterRef('id'))
+        stored = {
+            (row.task_id, row.category): row
+            for row in Notification.objects.filter(
+                task_id__in={digest.task_id for digest in digests},
+                category__in={digest.category for digest in digests},
+                first_occurred_at__isnull=False,
+                is_read=False,
+                is_archived=False,
+            ).filter(~Exists(latest)).only('id', 'task_id', 'category', 'first_occurred_at')
+        }
+
+        extended = []
+        for digest in digests:
+            row = stored.get((digest.task_id, digest.category))
+            window = timedelta(seconds=digest_window(digest))
+            updated = row is not None and digest.last_occurred_at - row.first_occurred_at < window and \
+                Notification.objects.filter(id=row.id, is_read=False).update(
+                    occurrences=F('occurrences') + digest.occurrences,
+                    last_occurred_at=digest.last_occurred_at,
+                    execution_log=digest.execution_log,
+                    message=digest.message
+                )
+            if updated:
+                digest.pk = row.id
+                extended.append(row.id)
+
+        if extended:
+            record_notification_change(*extended)
+            bump_version('notifications')
+            for notification in Notification.objects.filter(id__in=extended).select_related('task'):
+                publish_notification(notification)
+
+    def _drop_dangling_references(self, batch):
+        task_ids = set(ScheduledTask.objects.filter(
+            id__in={n.task_id for n in batch if n.task_id}
+        ).values_list('id', flat=True))
+        log_ids = set(ExecutionLog.objects.filter(
+            id__in={n.execution_log_id for n in batch if n.execution_log_id}
+        ).values_list('id', flat=True))
+        for notification in batch:
+            notification.pk = None
+            if notification.task_id and notification.task_id not in task_ids:
+                notification.task = None
+            if notification.execution_log_id and notification.execution_log_id not in log_ids:
+                notification.execution_log = None
+
+
+@lru_cache(maxsize=None)
+def get_sink():
+    config = settings.NOTIFICATION_SINK
+    return NotificationSink(
+        max_batch=config.get('MAX_BATCH', 500),
+        max_delay=config.get('MAX_DELAY', 1.0),
+        synchronous=config.get('SYNCHRONOUS', False)
+    )
+
+
+def notify(**fields):
+    return get_sink().add(Notification(**fields))
+
+
+def flush_notifications():
+    return get_sink().flush()
+
+
+@worker_process_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    flush_notifications()
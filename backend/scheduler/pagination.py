@@ -0,0 +1,195 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+Cursor = namedtuple('Cursor', ['value', 'pk', 'reverse'])
+
+
+def positive_int(value, cutoff=None):
+    """Parse a positive integer query parameter, capped at ``cutoff``; raises ValueError."""
+    value = int(value)
+    if value <= 0:
+        raise ValueError(value)
+    if cutoff:
+        return min(value, cutoff)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(ordering field, id)``.
+
+    Each page is fetched with a ``WHERE (field, id) < (last_field, last_id)``
+    range predicate instead of an OFFSET, so deep pages cost the same as the
+    first one as long as the ordering field is indexed. The ordering field is
+    taken from the view's OrderingFilter (falling back to ``ordering``) and
+    ``id`` is always appended as a tiebreaker.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 1000)
+    cursor_query_param = 'cursor'
+    ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.field_name, self.descending = self.get_ordering(request, queryset, view)
+        # Ordering by an annotation (such as a search rank) pages on its value.
+        self.annotation = queryset.query.annotations.get(self.field_name)
+        if self.annotation is not None:
+            self.field = self.annotation.output_field
+        else:
+            self.field = queryset.model._meta.get_field(self.field_name)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor.reverse if self.cursor else False
+        descending = self.descending != reverse
+
+        queryset = queryset.order_by(*self._order_by(descending))
+        if self.cursor is not None:
+            queryset = queryset.filter(self._after(self.cursor, descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return positive_int(
+                    request.query_params[self.page_size_query_param],
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = self.ordering
+        ordering_filters = [
+            backend for backend in getattr(view, 'filter_backends', [])
+            if hasattr(backend, 'get_ordering')
+        ]
+        if ordering_filters:
+            ordering = ordering_filters[0]().get_ordering(request, queryset, view) or ordering
+
+        if not isinstance(ordering, str):
+            ordering = ordering[0]
+
+        field_name = ordering.lstrip('-')
+        if field_name == 'pk':
+            field_name = queryset.model._meta.pk.name
+        return field_name, ordering.startswith('-')
+
+    def _order_by(self, descending):
+        key = F(self.field_name)
+        if self.field.null:
+            key = key.desc(nulls_last=True) if descending else key.asc(nulls_first=True)
+        else:
+            key = key.desc() if descending else key.asc()
+        return [key, '-pk' if descending else 'pk']
+
+    def _after(self, cursor, descending):
+        # NULLs sort after every value when descending and before every value
+        # when ascending, so a page boundary inside the NULL block only has to
+        # compare ids.
+        field = self.field_name
+        if descending:
+            if cursor.value is None:
+                return Q(**{f'{field}__isnull': True, 'pk__lt': cursor.pk})
+            condition = Q(**{f'{field}__lt': cursor.value}) | Q(**{field: cursor.value, 'pk__lt': cursor.pk})
+            if self.field.null:
+                condition |= Q(**{f'{field}__isnull': True})
+            return condition
+
+        if cursor.value is None:
+            return Q(**{f'{field}__isnull': True, 'pk__gt': cursor.pk}) | Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__gt': cursor.value}) | Q(**{field: cursor.value, 'pk__gt': cursor.pk})
+
+    def _position(self, obj):
+        if self.annotation is not None:
+            value = getattr(obj, self.field_name)
+            return None if value is None else str(value)
+        if getattr(obj, self.field.attname) is None:
+            return None
+        return self.field.value_to_string(obj)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(Cursor(self._position(last), last.pk, False))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        first = self.page[0]
+        return self.encode_cursor(Cursor(self._position(first), first.pk, True))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            # Coerced here so a cursor whose value doesn't fit the ordering
+            # field is rejected like any other malformed cursor.
+            value = None if payload['v'] is None else self.field.to_python(payload['v'])
+            return Cursor(value, int(payload['id']), bool(payload.get('r')))
+        except (TypeError, ValueError, KeyError, binascii.Error, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        payload = {'v': cursor.value, 'id': cursor.pk}
+        if cursor.reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
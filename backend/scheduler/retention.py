@@ -0,0 +1,325 @@
+"""
+Retention for the tables that grow with every execution or edit.
+
+``rollup_logs`` folds raw ExecutionLog rows into per-task and fleet-wide
+(``task=None``) hourly and daily ExecutionLogRollup rows, ``purge_logs`` deletes raw logs once they are past
+their retention age *and* covered by a daily rollup,
+``purge_notifications`` deletes expired and long-archived notifications,
+``purge_task_changes`` and ``purge_notification_changes`` trim the change
+logs, and ``purge_leases``
+drops expired ExecutionLease rows.
+Deletes run in short chunks so no statement holds locks for long.
+"""
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import counters
+from .changes import advance_purge_horizon
+from .models import (
+    ExecutionLease, ExecutionLog, ExecutionLogRollup, Notification, NotificationChange, TaskChange
+)
+
+BUCKETS = {
+    'HOUR': timedelta(hours=1),
+    'DAY': timedelta(days=1),
+}
+
+STATUS_FIELDS = {
+    'SUCCESS': 'success_count',
+    'FAILED': 'failed_count',
+    'RETRY': 'retry_count',
+    'SKIPPED': 'skipped_count',
+    'TIMEOUT': 'timeout_count',
+}
+
+COUNT_FIELDS = [
+    'total_count', 'success_count', 'failed_count', 'retry_count', 'skipped_count',
+    'timeout_count', 'retried_executions',
+]
+
+ROLLUP_FIELDS = COUNT_FIELDS + [
+    'min_execution_time', 'avg_execution_time', 'max_execution_time', 'p95_execution_time',
+    'execution_time_sum', 'execution_time_histogram',
+]
+
+# Execution times are also counted into log-spaced histogram bins, bin i
+# holding times up to HISTOGRAM_BASE * HISTOGRAM_FACTOR ** i seconds, so that
+# rollups can be merged and percentiles read off the result to within 10%.
+HISTOGRAM_BASE = 0.001
+HISTOGRAM_FACTOR = 1.1
+
+
+def truncate(value, granularity):
+    value = value.astimezone(timezone.get_current_timezone())
+    if granularity == 'DAY':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def histogram_bin(seconds):
+    if seconds <= HISTOGRAM_BASE:
+        return 0
+    return math.ceil(math.log(seconds / HISTOGRAM_BASE, HISTOGRAM_FACTOR))
+
+
+def histogram_percentile(histogram, fraction, maximum=None):
+    """Upper bound of the bin holding the nearest-rank percentile, capped at ``maximum``."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = max(1, math.ceil(fraction * total))
+    seen = 0
+    # JSON object keys are strings, so bins are stored as str(index).
+    for index in sorted(histogram, key=int):
+        seen += histogram[index]
+        if seen >= rank:
+            bound = HISTOGRAM_BASE * HISTOGRAM_FACTOR ** int(index)
+            return bound if maximum is None else min(bound, maximum)
+
+
+def empty_rollup(task_id, granularity, bucket_start):
+    return ExecutionLogRollup(
+        task_id=task_id, granularity=granularity, bucket_start=bucket_start,
+        execution_time_sum=0, execution_time_histogram={}
+    )
+
+
+def merge_rollup(target, rollup):
+    """Add ``rollup``'s counts and execution times into ``target``."""
+    for field in COUNT_FIELDS:
+        setattr(target, field, getattr(target, field) + getattr(rollup, field))
+
+    if rollup.min_execution_time is not None:
+        if target.min_execution_time is None:
+            target.min_execution_time = rollup.min_execution_time
+            target.max_execution_time = rollup.max_execution_time
+        else:
+            target.min_execution_time = min(target.min_execution_time, rollup.min_execution_time)
+            target.max_execution_time = max(target.max_execution_time, rollup.max_execution_time)
+
+    histogram = target.execution_time_histogram
+    for index, count in rollup.execution_time_histogram.items():
+        histogram[index] = histogram.get(index, 0) + count
+    target.execution_time_sum += rollup.execution_time_sum
+
+    timed = sum(histogram.values())
+    target.avg_execution_time = target.execution_time_sum / timed if timed else None
+    target.p95_execution_time = histogram_percentile(histogram, 0.95, target.max_execution_time)
+    return target
+
+
+def build_rollup(task_id, granularity, bucket_start, rows):
+    """Roll up ``(status, execution_time, retry_count)`` rows of one bucket."""
+    rollup = empty_rollup(task_id, granularity, bucket_start)
+    times = []
+    for status, execution_time, retries in rows:
+        rollup.total_count += 1
+        field = STATUS_FIELDS.get(status)
+        if field:
+            setattr(rollup, field, getattr(rollup, field) + 1)
+        if retries:
+            rollup.retried_executions += 1
+        if execution_time is not None:
+            times.append(execution_time)
+
+    if times:
+        times.sort()
+        rollup.min_execution_time = times[0]
+        rollup.max_execution_time = times[-1]
+        rollup.execution_time_sum = sum(times)
+        rollup.avg_execution_time = rollup.execution_time_sum / len(times)
+        rollup.p95_execution_time = percentile(times, 0.95)
+        for execution_time in times:
+            key = str(histogram_bin(execution_time))
+            rollup.execution_time_histogram[key] = rollup.execution_time_histogram.get(key, 0) + 1
+    return rollup
+
+
+def _save_rollups(rollups, batch_size=None):
+    ExecutionLogRollup.objects.bulk_create(
+        rollups,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['task', 'granularity', 'bucket_start'],
+        update_fields=ROLLUP_FIELDS
+    )
+
+
+def rollup_logs(granularity, now=None, batch_size=500):
+    """
+    Roll up every complete bucket since the last one stored, oldest first.
+
+    Each bucket's logs are streamed ordered by task, so only one task's
+    execution times are held in memory while its p95 is computed, and each
+    task's rollup is merged into the bucket's fleet rollup. The rollups are
+    computed outside any transaction and then written, fleet row included,
+    in one short transaction per bucket: a stored bucket is always complete,
+    which makes the latest one the point to resume from, and the write lock
+    is never held while logs are scanned.
+    """
+    now = now or timezone.now()
+    step = BUCKETS[granularity]
+    end = truncate(now, granularity)
+
+    last = ExecutionLogRollup.objects.filter(granularity=granularity).aggregate(last=Max('bucket_start'))['last']
+    logs = ExecutionLog.objects.filter(executed_at__lt=end)
+    start = None if last is None else last + step
+
+    created = 0
+    while True:
+        pending = logs if start is None else logs.filter(executed_at__gte=start)
+        first = pending.aggregate(first=Min('executed_at'))['first']
+        if first is None:
+            break
+        bucket = truncate(first, granularity)
+        start = bucket + step
+        rollups, fleet = _rollup_bucket(
+            logs.filter(executed_at__gte=bucket, executed_at__lt=start), granularity, bucket
+        )
+        with transaction.atomic():
+            _save_rollups(rollups, batch_size)
+            # NULL never conflicts in the unique constraint, so fleet rows
+            # are replaced rather than upserted.
+            ExecutionLogRollup.objects.filter(
+                task__isnull=True, granularity=granularity, bucket_start=bucket
+            ).delete()
+            fleet.save()
+        created += len(rollups)
+    return created
+
+
+def _rollup_bucket(logs, granularity, bucket_start):
+    """The per-task rollups of one bucket's ``logs``, and their fleet rollup."""
+    rows = logs.order_by('task_id', 'executed_at').values_list(
+        'task_id', 'status', 'execution_time', 'retry_count'
+    ).iterator(chunk_size=2000)
+
+    rollups = []
+    fleet = empty_rollup(None, granularity, bucket_start)
+    current = None
+    task_rows = []
+
+    def close_task():
+        rollup = build_rollup(current, granularity, bucket_start, task_rows)
+        merge_rollup(fleet, rollup)
+        rollups.append(rollup)
+
+    for task_id, status, execution_time, retries in rows:
+        if task_id != current:
+            if task_rows:
+                close_task()
+            current, task_rows = task_id, []
+        task_rows.append((status, execution_time, retries))
+    if task_rows:
+        close_task()
+    return rollups, fleet
+
+
+def _delete_in_chunks(queryset, chunk_size, on_chunk=None):
+    deleted = 0
+    while True:
+        rows = list(queryset.order_by('pk')[:chunk_size])
+        if not rows:
+            return deleted
+        with transaction.atomic():
+            if on_chunk:
+                on_chunk(rows)
+            queryset.model.objects.filter(pk__in=[row.pk for row in rows]).delete()
+        deleted += len(rows)
+
+
+def purge_logs(now=None, chunk_size=None):
+    """Delete raw logs past LOG_MAX_AGE_DAYS that a daily rollup already covers."""
+    now = now or timezone.now()
+    config = settings.RETENTION
+    cutoff = now - timedelta(days=config['LOG_MAX_AGE_DAYS'])
+
+    last_daily = ExecutionLogRollup.objects.filter(granularity='DAY').aggregate(last=Max('bucket_start'))['last']
+    if last_daily is None:
+        return 0
+    cutoff = min(cutoff, last_daily + BUCKETS['DAY'])
+
+    return _delete_in_chunks(
+        ExecutionLog.objects.filter(executed_at__lt=cutoff).only('pk'),
+        chunk_size or config['DELETE_CHUNK_SIZE']
+    )
+
+
+def purge_notifications(now=None, chunk_size=None):
+    """Delete expired notifications and archived ones past their grace period."""
+    now = now or timezone.now()
+    config = settings.RETENTION
+    archived_cutoff = now - timedelta(days=config['ARCHIVED_NOTIFICATION_MAX_AGE_DAYS'])
+
+    expired = Notification.objects.filter(
+        Q(expires_at__lte=now) | Q(is_archived=True, created_at__lt=archived_cutoff)
+    ).only('pk', 'category', 'priority', 'is_read')
+
+    return _delete_in_chunks(
+        expired,
+        chunk_size or config['DELETE_CHUNK_SIZE'],
+        on_chunk=lambda rows: counters.record_deleted(*rows)
+    )
+
+
+def purge_task_changes(now=None, chunk_size=None):
+    """Delete change-log rows older than TASK_CHANGE_MAX_AGE_DAYS."""
+    now = now or timezone.now()
+    config = settings.RETENTION
+    cutoff = now - timedelta(days=config['TASK_CHANGE_MAX_AGE_DAYS'])
+    return _delete_in_chunks(
+        TaskChange.objects.filter(changed_at__lt=cutoff),
+        chunk_size or config['DELETE_CHUNK_SIZE'],
+        on_chunk=lambda rows: advance_purge_horizon(TaskChange, [row.pk for row in rows])
+    )
+
+
+def purge_notification_changes(now=None, chunk_size=None):
+    """Delete change-log rows older than NOTIFICATION_CHANGE_MAX_AGE_DAYS."""
+    now = now or timezone.now()
+    config = settings.RETENTION
+    cutoff = now - timedelta(days=config['NOTIFICATION_CHANGE_MAX_AGE_DAYS'])
+    return _delete_in_chunks(
+        NotificationChange.objects.filter(changed_at__lt=cutoff),
+        chunk_size or config['DELETE_CHUNK_SIZE'],
+        on_chunk=lambda rows: advance_purge_horizon(NotificationChange, [row.pk for row in rows])
+    )
+
+
+def purge_leases(now=None):
+    """Delete database leases that expired without being released."""
+    now = now or timezone.now()
+    # One conditional DELETE, so a lease taken over since it expired survives.
+    deleted, _ = ExecutionLease.objects.filter(expires_at__lt=now).delete()
+    return deleted
+
+
+def apply_retention(now=None):
+    now = now or timezone.now()
+    result = {}
+    for name, step in [
+        ('hourly_rollups', lambda: rollup_logs('HOUR', now)),
+        ('daily_rollups', lambda: rollup_logs('DAY', now)),
+        ('logs_purged', lambda: purge_logs(now)),
+        ('notifications_purged', lambda: purge_notifications(now)),
+        ('task_changes_purged', lambda: purge_task_changes(now)),
+        ('notification_changes_purged', lambda: purge_notification_changes(now)),
+        ('leases_purged', lambda: purge_leases(now)),
+    ]:
+        started = time.monotonic()
+        result[name] = step()
+        result[f"{name}_seconds"] = round(time.monotonic() - started, 3)
+    return result
@@ -0,0 +1,120 @@
+"""
+When, and whether, a failed execution is retried.
+
+Delays grow exponentially from the task's ``retry_delay`` up to a cap, with
+full jitter: the actual delay is drawn uniformly from zero to that bound, so
+tasks that failed together (say, in a downstream outage) don't come back
+together. Independently, a ``RetryBudget`` limits how many retries are sent
+per window across all workers; a retry the budget refuses is dropped and
+the task is left to its next scheduled run (or to recovery_scan, for a
+one-time task).
+"""
+import logging
+import random
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(task, retry_count):
+    """Seconds to wait before retry number ``retry_count + 1`` of ``task``."""
+    config = settings.RETRY
+    cap = task.retry_max_delay or config['MAX_DELAY']
+    bound = min(cap, task.retry_delay * 2 ** retry_count)
+    if task.retry_jitter:
+        bound = random.uniform(0, bound)
+    # Never zero, so the retry can't race the failed run's lease release.
+    return max(config['MIN_DELAY'], bound)
+
+
+class RetryBudget:
+    """
+    At most ``limit`` retries per ``window`` seconds. ``spend`` returns
+    whether one more retry fits in the current window and counts it if so.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def spend(self):
+        raise NotImplementedError
+
+
+class LocalRetryBudget(RetryBudget):
+    """Per-process budget, for tests and as a fallback."""
+
+    def __init__(self, limit, window):
+        super().__init__(limit, window)
+        self._lock = threading.Lock()
+        self._window_start = 0
+        self._spent = 0
+
+    def spend(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._spent = 0
+            if self._spent >= self.limit:
+                return False
+            self._spent += 1
+            return True
+
+
+class RedisRetryBudget(RetryBudget):
+    """
+    A fixed-window counter shared by all workers. While Redis is unreachable
+    each process falls back to a budget of its own.
+    """
+
+    def __init__(self, limit, window, url, key='scheduler:retry-budget'):
+        import redis
+
+        super().__init__(limit, window)
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self.fallback = LocalRetryBudget(limit, window)
+        self._errors = (redis.ConnectionError, redis.TimeoutError)
+
+    def spend(self):
+        key = f"{self.key}:{int(time.time() // self.window)}"
+        try:
+            pipe = self.client.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, self.window)
+            spent, _ = pipe.execute()
+        except self._errors:
+            logger.warning("Redis unavailable, using a per-process retry budget")
+            return self.fallback.spend()
+        return spent <= self.limit
+
+
+@lru_cache(maxsize=None)
+def get_retry_budget():
+    config = settings.RETRY['BUDGET']
+    return import_string(config['BACKEND'])(config['LIMIT'], config['WINDOW'], **config.get('OPTIONS', {}))
+
+
+def next_retry(task, retry_count):
+    """
+    The countdown for the next retry of ``task`` after attempt number
+    ``retry_count`` failed, or None if it won't be retried. ``exhausted``
+    is True when that is because the task is out of retries.
+    """
+    if retry_count >= task.max_retries:
+        metrics.record_retry('exhausted')
+        return None, True
+    if not get_retry_budget().spend():
+        logger.warning("Retry budget exhausted, not retrying task %s", task.id)
+        metrics.record_retry('over_budget')
+        return None, False
+    metrics.record_retry('scheduled')
+    return retry_delay(task, retry_count), False
@@ -0,0 +1,195 @@
+"""
+Provisioning of django-celery-beat rows for ScheduledTask.
+
+Crontab and interval definitions are shared: every task with the same
+definition points at one schedule row, so beat's reload cost follows the
+number of distinct schedules rather than the number of edits ever made.
+Schedule rows that no PeriodicTask references any more are removed by
+``collect_orphan_schedules``.
+
+``provision_periodic_tasks`` is the set-based form of ``sync_periodic_task``
+for freshly created tasks: schedule rows are resolved and created per
+distinct definition and the PeriodicTask rows are bulk inserted.
+"""
+import json
+from collections import defaultdict
+from datetime import tzinfo
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django_celery_beat.models import (
+    ClockedSchedule,
+    CrontabSchedule,
+    IntervalSchedule,
+    PeriodicTask,
+    PeriodicTasks,
+    crontab_schedule_celery_timezone
+)
+
+from .models import ScheduledTask
+
+EXECUTE_TASK = "scheduler.tasks.execute_scheduled_task"
+SCHEDULE_FIELDS = ['interval', 'crontab', 'solar', 'clocked']
+
+
+def periodic_task_name(task_id):
+    return f"scheduled-task-{task_id}"
+
+
+def schedule_definition(task):
+    """Return ``(PeriodicTask field, schedule model, lookup fields)`` for a task."""
+    if task.schedule_type == "ONE_TIME":
+        return 'clocked', ClockedSchedule, {'clocked_time': task.scheduled_time}
+    if task.schedule_type == "CRON":
+        return 'crontab', CrontabSchedule, {
+            'minute': task.cron_minute or '*',
+            'hour': task.cron_hour or '*',
+            'day_of_week': task.cron_day_of_week or '*',
+            'day_of_month': task.cron_day_of_month or '*',
+            'month_of_year': task.cron_month_of_year or '*',
+            'timezone': crontab_schedule_celery_timezone(),
+        }
+    return 'interval', IntervalSchedule, {'every': task.interval_seconds, 'period': 'seconds'}
+
+
+def get_schedule(model, **fields):
+    # No unique constraint exists on these tables, so older duplicates may be
+    # around; always settle on the oldest matching row.
+    schedule = model.objects.filter(**fields).order_by('pk').first()
+    if schedule is None:
+        schedule = model.objects.create(**fields)
+    return schedule
+
+
+def _schedule_key(fields):
+    # Timezones come back from the database as ZoneInfo but are looked up by
+    # name; aware datetimes already compare (and hash) by instant.
+    return tuple(sorted(
+        (name, str(value) if isinstance(value, tzinfo) else value) for name, value in fields.items()
+    ))
+
+
+def get_schedules(model, lookups, chunk_size=200):
+    """
+    Set-based ``get_schedule``: map the key of every lookup to its schedule
+    row, creating the missing ones with one ``bulk_create``.
+    """
+    wanted = {_schedule_key(lookup): lookup for lookup in lookups}
+    names = next(iter(wanted.values())).keys() if wanted else []
+    found = {}
+    pending = list(wanted.values())
+    for start in range(0, len(pending), chunk_size):
+        query = Q()
+        for lookup in pending[start:start + chunk_size]:
+            query |= Q(**lookup)
+        # Newest first, so the oldest duplicate is the one left in ``found``.
+        for schedule in model.objects.filter(query).order_by('-pk'):
+            found[_schedule_key({name: getattr(schedule, name) for name in names})] = schedule
+
+    missing = [key for key in wanted if key not in found]
+    created = model.objects.bulk_create([model(**wanted[key]) for key in missing])
+    found.update(zip(missing, created))
+    return found
+
+
+def describe(task):
+    return {
+        "ONE_TIME": f"One-time task: {task.name}",
+        "CRON": f"Cron task: {task.name}",
+        "INTERVAL": f"Interval task: {task.name}",
+    }[task.schedule_type]
+
+
+def periodic_task_fields(task, field, schedule):
+    fields = {name: None for name in SCHEDULE_FIELDS}
+    fields.update({
+        'task': EXECUTE_TASK,
+        field: schedule,
+        'one_off': field == 'clocked',
+        'args': json.dumps([task.id]),
+        'kwargs': json.dumps({'priority': task.priority}),
+        'enabled': task.is_active,
+        'description': describe(task),
+    })
+    return fields
+
+
+def periodic_task_queryset(task):
+    """The PeriodicTask that fires ``task``, by stored FK when it has one."""
+    if task.periodic_task_id:
+        return PeriodicTask.objects.filter(pk=task.periodic_task_id)
+    return PeriodicTask.objects.filter(name=periodic_task_name(task.id))
+
+
+@transaction.atomic
+def sync_periodic_task(task):
+    """Create or update, in place, the PeriodicTask that fires ``task``."""
+    field, model, lookup = schedule_definition(task)
+    schedule = get_schedule(model, **lookup)
+    periodic_task, _ = PeriodicTask.objects.update_or_create(
+        name=periodic_task_name(task.id),
+        defaults=periodic_task_fields(task, field, schedule)
+    )
+    if task.periodic_task_id != periodic_task.pk:
+        task.periodic_task = periodic_task
+        ScheduledTask.objects.filter(pk=task.pk).update(periodic_task=periodic_task)
+    return periodic_task
+
+
+def collect_orphan_schedules(chunk_size=1000):
+    """Delete schedule rows no PeriodicTask points at; returns the count per table."""
+    deleted = {}
+    for model, field in ((CrontabSchedule, 'crontab'), (IntervalSchedule, 'interval'), (ClockedSchedule, 'clocked')):
+        deleted[model.__name__] = 0
+        referenced = PeriodicTask.objects.filter(**{field: OuterRef('pk')})
+        last_pk = 0
+        while True:
+            ids = list(model.objects.filter(
+                ~Exists(referenced), pk__gt=last_pk
+            ).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            try:
+                with transaction.atomic():
+                    # One DELETE that re-checks the reference itself, so a row
+                    # picked up by a task since the scan is skipped rather
+                    # than cascading to its PeriodicTask; nothing is loaded.
+                    orphans = model.objects.filter(~Exists(referenced), pk__in=ids)
+                    count = orphans._raw_delete(orphans.db)
+            except IntegrityError:
+                continue
+            deleted[model.__name__] += count
+    return deleted
+
+
+@transaction.atomic
+def provision_periodic_tasks(tasks, batch_size=500):
+    """Create the PeriodicTask rows for many new tasks in a fixed number of queries."""
+    if not tasks:
+        return []
+    definitions = [schedule_definition(task) for task in tasks]
+    lookups = defaultdict(list)
+    for _field, model, lookup in definitions:
+        lookups[model].append(lookup)
+    schedules = {model: get_schedules(model, model_lookups) for model, model_lookups in lookups.items()}
+
+    periodic_tasks = []
+    for task, (field, model, lookup) in zip(tasks, definitions):
+        schedule = schedules[model][_schedule_key(lookup)]
+        periodic_tasks.append(PeriodicTask(
+            name=periodic_task_name(task.id), **periodic_task_fields(task, field, schedule)
+        ))
+    PeriodicTask.objects.bulk_create(
+        periodic_tasks,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=SCHEDULE_FIELDS + ['task', 'one_off', 'args', 'kwargs', 'enabled', 'description']
+    )
+    for task, periodic_task in zip(tasks, periodic_tasks):
+        task.periodic_task = periodic_task
+    ScheduledTask.objects.bulk_update(tasks, ['periodic_task'], batch_size=batch_size)
+    # bulk_create sends no signals, so beat has to be told about the new rows.
+    PeriodicTasks.update_changed()
+    return periodic_tasks
@@ -0,0 +1,273 @@
+"""
+Full-text search behind the ``?search=`` parameter.
+
+Tasks (name, description), execution logs (message) and notifications
+(title, message) each have a full-text index the database keeps up to date
+on write: an external-content FTS5 table maintained by triggers on SQLite,
+a trigger-maintained ``tsvector`` column with a GIN index on PostgreSQL.
+Both are created, and backfilled if they were missing, after every
+``migrate``. On any other database ``?search=`` falls back to DRF's
+``icontains`` search over the view's ``search_fields``.
+
+The query language is the same on both:
+
+- ``backup nightly``: rows containing both words, in any field;
+- ``back*``: words starting with ``back``;
+- ``"nightly backup"``: the words next to each other, in that order.
+
+Matching is by whole word (or word prefix) after lower-casing, not by
+substring. Where a view searches a single index, results are ordered by
+relevance unless ``?ordering=`` is given; matches in the first field of an
+index (a task's name, a notification's title) weigh more.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import ExecutionLog, Notification, ScheduledTask
+
+RANK = 'search_rank'
+
+# Field weights use PostgreSQL's letters; ts_rank's default weight for each
+# letter is reused for bm25 on SQLite.
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+SearchIndex = namedtuple('SearchIndex', ['model', 'fields'])
+
+INDEXES = {
+    'tasks': SearchIndex(ScheduledTask, [('name', 'A'), ('description', 'B')]),
+    'logs': SearchIndex(ExecutionLog, [('message', 'A')]),
+    'notifications': SearchIndex(Notification, [('title', 'A'), ('message', 'B')]),
+}
+
+Clause = namedtuple('Clause', ['words', 'prefix'])
+
+
+def parse_query(text):
+    """
+    Split ``text`` into clauses, all of which must match: a quoted phrase
+    or a bare term, which matches as a prefix if it ends with ``*``.
+    """
+    clauses = []
+    for phrase, term in re.findall(r'"([^"]*)"?|(\S+)', text or ''):
+        words = re.findall(r'\w+', (phrase or term).lower())
+        if words:
+            clauses.append(Clause(words, prefix=term.endswith('*')))
+    return clauses
+
+
+def _columns(index):
+    return [(index.model._meta.get_field(name).column, weight) for name, weight in index.fields]
+
+
+class SearchBackend:
+    """
+    A full-text index of each of INDEXES, with ``match`` returning the ids
+    of the rows that match a parsed query and ``rank`` an expression over
+    the outer row that is higher for better matches.
+    """
+
+    def install(self, connection):
+        raise NotImplementedError
+
+    def match(self, index, clauses):
+        raise NotImplementedError
+
+    def rank(self, index, clauses):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+
+    tokenizer = 'unicode61 remove_diacritics 2'
+
+    def _table(self, index):
+        return f"{index.model._meta.db_table}_fts"
+
+    def install(self, connection):
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for index in INDEXES.values():
+                table = index.model._meta.db_table
+                fts = self._table(index)
+                columns = [column for column, _weight in _columns(index)]
+                names = ", ".join(quote(column) for column in columns)
+                new = ", ".join(f"new.{quote(column)}" for column in columns)
+                old = ", ".join(f"old.{quote(column)}" for column in columns)
+                triggers = {
+                    f"{fts}_insert": f"""
+                        AFTER INSERT ON {quote(table)} BEGIN
+                            INSERT INTO {quote(fts)} (rowid, {names}) VALUES (new.id, {new});
+                        END""",
+                    f"{fts}_delete": f"""
+                        AFTER DELETE ON {quote(table)} BEGIN
+                            INSERT INTO {quote(fts)} ({quote(fts)}, rowid, {names}) VALUES ('delete', old.id, {old});
+                        END""",
+                    # Only changes to indexed columns, so counters and status
+                    # updates don't touch the index.
+                    f"{fts}_update": f"""
+                        AFTER UPDATE OF {names} ON {quote(table)} BEGIN
+                            INSERT INTO {quote(fts)} ({quote(fts)}, rowid, {names}) VALUES ('delete', old.id, {old});
+                            INSERT INTO {quote(fts)} (rowid, {names}) VALUES (new.id, {new});
+                        END""",
+                }
+
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+                    [fts, *triggers]
+                )
+                existing = {name for name, in cursor.fetchall()}
+                if len(existing) == len(triggers) + 1:
+                    continue
+
+                # Triggers are dropped whenever a migration rebuilds the
+                # table, so rows written since may be missing: rebuild.
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {quote(fts)} USING fts5({names}, "
+                    f"content='{table}', content_rowid='id', tokenize='{self.tokenizer}')"
+                )
+                for name, body in triggers.items():
+                    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {quote(name)} {body}")
+                cursor.execute(f"INSERT INTO {quote(fts)} ({quote(fts)}) VALUES ('rebuild')")
+
+    def compile(self, clauses):
+        return " AND ".join(
+            '"' + " ".join(clause.words) + '"' + ("*" if clause.prefix else "")
+            for clause in clauses
+        )
+
+    def match(self, index, clauses):
+        fts = self._table(index)
+        return RawSQL(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [self.compile(clauses)])
+
+    def rank(self, index, clauses):
+        fts = self._table(index)
+        weights = ", ".join(str(WEIGHTS[weight]) for _column, weight in _columns(index))
+        # bm25() is lower for better matches.
+        return RawSQL(
+            f'(SELECT -bm25("{fts}", {weights}) FROM "{fts}" '
+            f'WHERE "{fts}" MATCH %s AND rowid = "{index.model._meta.db_table}"."id")',
+            [self.compile(clauses)],
+            output_field=FloatField()
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+
+    config = 'simple'
+    column = 'search_vector'
+
+    def _vector(self, index, row):
+        return " || ".join(
+            f"setweight(to_tsvector('{self.config}', coalesce({row}\"{column}\", '')), '{weight}')"
+            for column, weight in _columns(index)
+        )
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            for index in INDEXES.values():
+                table = index.model._meta.db_table
+                function = f"{table}_{self.column}"
+                columns = ", ".join(f'"{column}"' for column, _weight in _columns(index))
+                # A trigger rather than a generated column, so migrations can
+                # still alter the indexed columns.
+                cursor.execute(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{self.column}" tsvector')
+                cursor.execute(f"""
+                    CREATE OR REPLACE FUNCTION "{function}"() RETURNS trigger AS $$
+                    BEGIN
+                        NEW."{self.column}" := {self._vector(index, 'NEW.')};
+                        RETURN NEW;
+                    END
+                    $$ LANGUAGE plpgsql
+                """)
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{function}" ON "{table}"')
+                cursor.execute(
+                    f'CREATE TRIGGER "{function}" BEFORE INSERT OR UPDATE OF {columns} ON "{table}" '
+                    f'FOR EACH ROW EXECUTE FUNCTION "{function}"()'
+                )
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{function}_gin" ON "{table}" USING GIN ("{self.column}")'
+                )
+                cursor.execute(
+                    f'UPDATE "{table}" SET "{self.column}" = {self._vector(index, "")} '
+                    f'WHERE "{self.column}" IS NULL'
+                )
+
+    def compile(self, clauses):
+        return " & ".join(
+            "(" + " <-> ".join(f"'{word}'" for word in clause.words) + (":*" if clause.prefix else "") + ")"
+            for clause in clauses
+        )
+
+    def match(self, index, clauses):
+        table = index.model._meta.db_table
+        return RawSQL(
+            f"SELECT \"id\" FROM \"{table}\" WHERE \"{self.column}\" @@ to_tsquery('{self.config}', %s)",
+            [self.compile(clauses)]
+        )
+
+    def rank(self, index, clauses):
+        table = index.model._meta.db_table
+        return RawSQL(
+            f"ts_rank(\"{table}\".\"{self.column}\", to_tsquery('{self.config}', %s))",
+            [self.compile(clauses)],
+            output_field=FloatField()
+        )
+
+
+@lru_cache(maxsize=None)
+def get_search_backend(vendor):
+    """The backend for a database vendor, or None if it has none."""
+    path = settings.SEARCH['BACKENDS'].get(vendor)
+    return import_string(path)() if path else None
+
+
+def install_search_indexes(sender, using, **kwargs):
+    """post_migrate receiver creating, or repairing, the full-text indexes."""
+    connection = connections[using]
+    backend = get_search_backend(connection.vendor)
+    if backend is not None:
+        backend.install(connection)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    ``?search=`` over the indexes a view lists in ``search_indexes``, as
+    ``(index name, id field)`` pairs; a row matches if any of them does.
+    A view with a single index gets its results annotated with a rank.
+    Without a backend for the database, this is DRF's SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        backend = get_search_backend(connections[queryset.db].vendor)
+        indexes = getattr(view, 'search_indexes', None)
+        if backend is None or not indexes:
+            return super().filter_queryset(request, queryset, view)
+
+        clauses = parse_query(request.query_params.get(self.search_param, ''))
+        if not clauses:
+            return queryset
+
+        matches = None
+        for name, field in indexes:
+            match = queryset.filter(**{f'{field}__in': backend.match(INDEXES[name], clauses)})
+            matches = match if matches is None else matches | match
+        if len(indexes) == 1:
+            matches = matches.annotate(**{RANK: backend.rank(INDEXES[indexes[0][0]], clauses)})
+        return matches
+
+
+class SearchOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter that defaults to relevance order for ranked searches."""
+
+    def get_ordering(self, request, queryset, view):
+        if RANK in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            return [f'-{RANK}']
+        return super().get_ordering(request, queryset, view)
@@ -1,15 +1,17 @@
 
+from datetime import timedelta
 from rest_framework import serializers
-from django_celery_beat.models import (
-    ClockedSchedule,
-    CrontabSchedule,
-    PeriodicTask,
-    IntervalSchedule
-)
+from django.conf import settings
 from django.db import transaction
-import json
 from django.utils import timezone
+from .changes import record_task_change
+from .cron import CronError, compile_cron
 from .models import ScheduledTask, ExecutionLog, Notification
+from .notifications import notify
+from .retention import BUCKETS
+from .schedules import provision_periodic_tasks, sync_periodic_task
+
+CRON_FIELDS = ['cron_minute', 'cron_hour', 'cron_day_of_week', 'cron_day_of_month', 'cron_month_of_year']
 
 
 class ExecutionLogSerializer(serializers.ModelSerializer):
@@ -21,7 +23,7 @@ class ExecutionLogSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'task', 'task_name', 'executed_at', 'status', 
             'message', 'error_details', 'execution_time', 
-            'formatted_execution_time', 'retry_count'
+            'formatted_execution_time', 'retry_count', 'start_lag'
         ]
         read_only_fields = ['executed_at', 'task_name']
 
@@ -39,15 +41,76 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'message', 'category', 'priority', 
             'task', 'task_name', 'execution_log', 'is_read', 
-            'is_archived', 'created_at', 'expires_at', 'time_ago'
+            'is_archived', 'occurrences', 'first_occurred_at', 'last_occurred_at',
+            'created_at', 'expires_at', 'time_ago'
+        ]
+        read_only_fields = [
+            'created_at', 'time_ago', 'task_name', 'occurrences', 'first_occurred_at', 'last_occurred_at'
         ]
-        read_only_fields = ['created_at', 'time_ago', 'task_name']
 
     def get_time_ago(self, obj):
         from django.utils.timesince import timesince
         return timesince(obj.created_at) + " ago"
 
 
+class StatsQuerySerializer(serializers.Serializer):
+    """Query parameters of the stats endpoints; the window defaults to the last STATS_DEFAULT_WINDOW hours."""
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    granularity = serializers.ChoiceField(choices=['HOUR', 'DAY'], default='HOUR')
+
+    def validate(self, data):
+        data.setdefault('end', timezone.now())
+        data.setdefault('start', data['end'] - timedelta(hours=settings.STATS_DEFAULT_WINDOW))
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError({"start": "start must be before end."})
+        if (data['end'] - data['start']) / BUCKETS[data['granularity']] > settings.STATS_MAX_BUCKETS:
+            raise serializers.ValidationError({
+                "start": f"The window spans more than {settings.STATS_MAX_BUCKETS} buckets; use a coarser granularity."
+            })
+        return data
+
+
+class ScheduledTaskListSerializer(serializers.ListSerializer):
+    """
+    Bulk create for ``POST /api/tasks/bulk/``. Every item has been validated
+    before anything is written; tasks, schedule rows, PeriodicTasks and the
+    change log are then inserted per batch rather than per task.
+    """
+
+    @transaction.atomic
+    def create(self, validated_data):
+        request = self.context.get('request')
+        created_by = None
+        if request and hasattr(request, 'user') and request.user.is_authenticated:
+            created_by = request.user.username
+
+        tasks = []
+        for item in validated_data:
+            task = ScheduledTask(**item)
+            if created_by:
+                task.created_by = created_by
+            task.next_execution = task.compute_next_execution()
+            tasks.append(task)
+
+        batch_size = settings.BULK_TASKS['BATCH_SIZE']
+        ScheduledTask.objects.bulk_create(tasks, batch_size=batch_size)
+        provision_periodic_tasks(tasks, batch_size=batch_size)
+        record_task_change(*[task.id for task in tasks])
+
+        notify(
+            title=f"Tasks Created: {len(tasks)}",
+            message=f"{len(tasks)} scheduled tasks have been created and scheduled.",
+            category='SYSTEM',
+            priority='LOW'
+        )
+
+        for task in tasks:
+            # New tasks have no logs; saves a query per task in the response.
+            task.recent_execution_logs = []
+        return tasks
+
+
 class ScheduledTaskSerializer(serializers.ModelSerializer):
     next_run_time = serializers.SerializerMethodField()
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -55,23 +118,26 @@ class ScheduledTaskSerializer(serializers.ModelSerializer):
     recent_logs = serializers.SerializerMethodField()
     can_be_modified = serializers.BooleanField(read_only=True)
     can_be_deleted = serializers.BooleanField(read_only=True)
+    can_be_resumed = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = ScheduledTask
         fields = [
             'id', 'name', 'description', 'schedule_type', 'schedule_type_display',
-            'status', 'status_display', 'scheduled_time', 'cron_minute', 'cron_hour',
+            'status', 'status_display', 'priority', 'overlap_policy', 'scheduled_time', 'cron_minute', 'cron_hour',
             'cron_day_of_week', 'cron_day_of_month', 'cron_month_of_year',
             'interval_seconds', 'executed_once', 'total_executions',
             'last_execution', 'next_execution', 'next_run_time', 'created_at',
             'updated_at', 'created_by', 'max_retries', 'retry_delay',
-            'can_be_modified', 'can_be_deleted', 'recent_logs'
+            'retry_max_delay', 'retry_jitter', 'notification_digest_window',
+            'can_be_modified', 'can_be_deleted', 'can_be_resumed', 'recent_logs'
         ]
         read_only_fields = [
             'executed_once', 'total_executions', 'last_execution', 
             'next_execution', 'created_at', 'updated_at',
-            'can_be_modified', 'can_be_deleted'
+            'can_be_modified', 'can_be_deleted', 'can_be_resumed'
         ]
+        list_serializer_class = ScheduledTaskListSerializer
 
     def get_next_run_time(self, obj):
         if obj.schedule_type == 'ONE_TIME':
@@ -83,7 +149,9 @@ class ScheduledTaskSerializer(serializers.ModelSerializer):
         return None
 
     def get_recent_logs(self, obj):
-        logs = obj.execution_logs.all()[:5]
+        logs = getattr(obj, 'recent_execution_logs', None)
+        if logs is None:
+            logs = obj.execution_logs.all()[:settings.RECENT_LOGS_LIMIT]
         return ExecutionLogSerializer(logs, many=True).data
 
     def validate(self, data):
@@ -120,18 +188,31 @@ class ScheduledTaskSerializer(serializers.ModelSerializer):
                     "interval_seconds": "Interval must be at least 60 seconds."
                 })
 
+        if schedule_type == "CRON" or any(field in data for field in CRON_FIELDS):
+            self.validate_cron(data)
+
         return data
 
+    def validate_cron(self, data):
+        values = [data.get(field, getattr(self.instance, field, None)) or '*' for field in CRON_FIELDS]
+        try:
+            compile_cron(*values)
+        except CronError as exc:
+            raise serializers.ValidationError({exc.field: str(exc)})
+
     @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             validated_data['created_by'] = request.user.username
         
-        instance = ScheduledTask.objects.create(**validated_data)
+        instance = ScheduledTask(**validated_data)
+        instance.next_execution = instance.compute_next_execution()
+        instance.save()
         self._create_periodic_task(instance)
+        record_task_change(instance.id)
         
-        Notification.objects.create(
+        notify(
             title=f"Task Created: {instance.name}",
             message=f"Scheduled task '{instance.name}' has been created and scheduled.",
             category='SYSTEM',
@@ -150,61 +231,16 @@ class ScheduledTaskSerializer(serializers.ModelSerializer):
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        instance.next_execution = instance.compute_next_execution()
         instance.save()
 
         self._update_periodic_task(instance)
+        record_task_change(instance.id)
 
         return instance
 
     def _create_periodic_task(self, instance):
-        task_name = f"scheduled-task-{instance.id}"
-        
-        PeriodicTask.objects.filter(name=task_name).delete()
-
-        if instance.schedule_type == "ONE_TIME":
-            schedule = ClockedSchedule.objects.create(
-                clocked_time=instance.scheduled_time
-            )
-            PeriodicTask.objects.create(
-                name=task_name,
-                task="scheduler.tasks.execute_scheduled_task",
-                clocked=schedule,
-                one_off=True,
-                args=json.dumps([instance.id]),
-                enabled=instance.is_active,
-                description=f"One-time task: {instance.name}"
-            )
-
-        elif instance.schedule_type == "CRON":
-            schedule = CrontabSchedule.objects.create(
-                minute=instance.cron_minute or '*',
-                hour=instance.cron_hour or '*',
-                day_of_week=instance.cron_day_of_week or '*',
-                day_of_month=instance.cron_day_of_month or '*',
-                month_of_year=instance.cron_month_of_year or '*',
-            )
-            PeriodicTask.objects.create(
-                name=task_name,
-                task="scheduler.tasks.execute_scheduled_task",
-                crontab=schedule,
-                args=json.dumps([instance.id]),
-                enabled=instance.is_active,
-                description=f"Cron task: {instance.name}"
-            )
-
-        elif instance.schedule_type == "INTERVAL":
-            schedule = IntervalSchedule.objects.create(
-                every=instance.interval_seconds,
-                period='seconds'
-            )
-            PeriodicTask.objects.create(
-                name=task_name,
-                task="scheduler.tasks.execute_scheduled_task",
-                interval=schedule,
-                args=json.dumps([instance.id]),
-                enabled=instance.is_active,
-                description=f"Interval task: {instance.name}"
-            )
+        return sync_periodic_task(instance)
 
     def _update_periodic_task(self, instance):
-        self._create_periodic_task(instance) 
\ No newline at end of file
+        return sync_periodic_task(instance)
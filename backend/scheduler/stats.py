@@ -0,0 +1,99 @@
+"""
+Execution statistics over a time window, served from ExecutionLogRollup.
+
+A window is answered from the stored rollups of its complete buckets plus
+rollups built on the fly from the logs written since ``rollup_logs`` last
+ran, so the work per request depends on the window and the retention
+schedule, not on how much history has been kept. Percentiles come from the
+rollups' execution time histograms and are accurate to within their bin
+width.
+"""
+from django.db.models import Max
+
+from .models import ExecutionLog, ExecutionLogRollup
+from .retention import BUCKETS, build_rollup, empty_rollup, histogram_percentile, merge_rollup, truncate
+
+
+def _ratio(part, total):
+    return round(part / total, 4) if total else None
+
+
+def summarize(rollup):
+    histogram = rollup.execution_time_histogram
+    total = rollup.total_count
+    return {
+        'executions': total,
+        'success': rollup.success_count,
+        'failed': rollup.failed_count,
+        'retry': rollup.retry_count,
+        'skipped': rollup.skipped_count,
+        'timeout': rollup.timeout_count,
+        'retried_executions': rollup.retried_executions,
+        'success_rate': _ratio(rollup.success_count, total),
+        'failure_rate': _ratio(rollup.failed_count, total),
+        'retry_rate': _ratio(rollup.retried_executions, total),
+        'execution_time': {
+            'mean': rollup.avg_execution_time,
+            'min': rollup.min_execution_time,
+            'max': rollup.max_execution_time,
+            'p50': histogram_percentile(histogram, 0.50, rollup.max_execution_time),
+            'p95': histogram_percentile(histogram, 0.95, rollup.max_execution_time),
+            'p99': histogram_percentile(histogram, 0.99, rollup.max_execution_time),
+        },
+    }
+
+
+def _recent_rollups(task_id, granularity, since, end):
+    logs = ExecutionLog.objects.filter(executed_at__gte=since, executed_at__lt=end)
+    if task_id is not None:
+        logs = logs.filter(task_id=task_id)
+
+    rows = {}
+    for executed_at, status, execution_time, retries in logs.order_by().values_list(
+        'executed_at', 'status', 'execution_time', 'retry_count'
+    ).iterator(chunk_size=2000):
+        rows.setdefault(truncate(executed_at, granularity), []).append((status, execution_time, retries))
+    return {
+        bucket_start: build_rollup(task_id, granularity, bucket_start, bucket_rows)
+        for bucket_start, bucket_rows in rows.items()
+    }
+
+
+def execution_stats(start, end, granularity, task_id=None):
+    """
+    Totals and per-bucket figures for the ``granularity`` buckets that
+    overlap ``[start, end)``, for one task or, with ``task_id=None``, for
+    all of them.
+    """
+    first_bucket = truncate(start, granularity)
+    last_rolled_up = ExecutionLogRollup.objects.filter(granularity=granularity).aggregate(
+        last=Max('bucket_start')
+    )['last']
+    rolled_up_until = last_rolled_up + BUCKETS[granularity] if last_rolled_up else first_bucket
+
+    buckets = {
+        rollup.bucket_start: rollup
+        for rollup in ExecutionLogRollup.objects.filter(
+            task_id=task_id,
+            granularity=granularity,
+            bucket_start__gte=first_bucket,
+            bucket_start__lt=min(end, rolled_up_until)
+        )
+    }
+    if end > rolled_up_until:
+        buckets.update(_recent_rollups(task_id, granularity, max(first_bucket, rolled_up_until), end))
+
+    total = empty_rollup(task_id, granularity, first_bucket)
+    series = []
+    for bucket_start in sorted(buckets):
+        merge_rollup(total, buckets[bucket_start])
+        series.append({'bucket_start': bucket_start, **summarize(buckets[bucket_start])})
+
+    return {
+        'task': task_id,
+        'granularity': granularity,
+        'start': first_bucket,
+        'end': end,
+        'summary': summarize(total),
+        'buckets': series,
+    }
@@ -1,15 +1,31 @@
-from celery import shared_task
+from celery import group, shared_task
+from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 from django_celery_beat.models import PeriodicTask
+from datetime import timedelta
+from itertools import islice
 import time
-import traceback
-from .models import ScheduledTask, ExecutionLog, Notification
+from . import counters, metrics, retention
+from .changes import record_task_change
+from .execution import (
+    claim_execution, record_exhausted, record_failure, record_skipped, record_success, run_many,
+    start_execution
+)
+from .handlers import get_handler
+from .models import ScheduledTask
+from .notifications import flush_notifications, notify
+from .retries import next_retry
+from .schedules import collect_orphan_schedules, periodic_task_name, sync_periodic_task
 
 
 @shared_task(bind=True, max_retries=3, soft_time_limit=300, time_limit=600)
-def execute_scheduled_task(self, task_id):
+def execute_scheduled_task(self, task_id, priority=None):
+    # ``priority`` is only read by config.celery.route_task to pick the queue.
     start_time = time.time()
     retry_count = self.request.retries
+    start_lag = None
+    lease = None
     
     try:
         task = ScheduledTask.objects.get(id=task_id)
@@ -17,145 +33,230 @@ def execute_scheduled_task(self, task_id):
         if not task.is_active:
             return {"status": "skipped", "reason": "Task is inactive"}
         
-        task.last_execution = timezone.now()
-        task.total_executions += 1
-        task.save()
+        lease = claim_execution(task)
+        if lease is None:
+            return handle_overlap(task, retry_count)
         
+        start_lag = start_execution(task)
         execution_result = execute_task_logic(task)
         
         execution_time = time.time() - start_time
         
-        log = ExecutionLog.objects.create(
-            task=task,
-            status="SUCCESS",
-            message=f"Task executed successfully in {execution_time:.2f}s",
-            execution_time=execution_time,
-            retry_count=retry_count
-        )
-        
-        Notification.objects.create(
-            title=f"✓ Task Executed: {task.name}",
-            message=f"Task '{task.name}' completed successfully at {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}.",
-            category='TASK_EXECUTED',
-            priority='MEDIUM',
-            task=task,
-            execution_log=log
-        )
-        
-        if task.schedule_type == "ONE_TIME":
-            task.executed_once = True
-            task.is_active = False
-            task.status = 'COMPLETED'
-            task.save()
-            
-            PeriodicTask.objects.filter(name=f"scheduled-task-{task.id}").update(enabled=False)
-            
-            Notification.objects.create(
-                title=f"✓ Task Completed: {task.name}",
-                message=f"One-time task '{task.name}' has been completed.",
-                category='TASK_COMPLETED',
-                priority='LOW',
-                task=task
-            )
-        
-        return {
-            "status": "success",
-            "task_id": task_id,
-            "execution_time": execution_time,
-            "total_executions": task.total_executions
-        }
+        return record_success(task, execution_time, retry_count, start_lag)
         
     except ScheduledTask.DoesNotExist:
         return {"status": "failed", "reason": "Task not found"}
         
     except Exception as e:
         execution_time = time.time() - start_time
+        task = locals().get('task')
         
-        log = ExecutionLog.objects.create(
-            task_id=task_id,
-            status="FAILED",
-            message=str(e),
-            error_details={
-                "error": str(e),
-                "traceback": traceback.format_exc(),
-                "retry_count": retry_count
-            },
-            execution_time=execution_time,
-            retry_count=retry_count
-        )
-        
-        Notification.objects.create(
-            title=f"✗ Task Failed: {task.name if 'task' in locals() else 'Unknown'}",
-            message=f"Task execution failed: {str(e)}",
-            category='TASK_FAILED',
-            priority='HIGH',
-            task=task if 'task' in locals() else None,
-            execution_log=log
-        )
+        record_failure(task_id, task, e, execution_time, retry_count, start_lag)
         
-        try:
-            task = ScheduledTask.objects.get(id=task_id)
-            if retry_count < task.max_retries:
-                countdown = task.retry_delay * (retry_count + 1)
-                self.retry(exc=e, countdown=countdown)
-        except:
-            pass
+        if task is None:
+            raise
         
-        raise e
+        countdown, exhausted = next_retry(task, retry_count)
+        if countdown is not None:
+            raise self.retry(exc=e, countdown=countdown, max_retries=task.max_retries)
+        if exhausted:
+            record_exhausted(task)
+        raise
+    
+    finally:
+        if lease is not None:
+            lease.release()
+
+
+def handle_overlap(task, retry_count):
+    """Deal with a run that found another run of ``task`` holding the lease."""
+    if task.get_overlap_policy() == 'QUEUE':
+        countdown = settings.EXECUTION_LEASE['QUEUE_DELAY']
+        # A queued re-run stays in the mode it came from: in async mode it
+        # is a batch of one.
+        if settings.TASK_EXECUTION['MODE'] == 'async':
+            execute_scheduled_tasks.apply_async(([task.id],), {'priority': task.priority}, countdown=countdown)
+        else:
+            execute_scheduled_task.apply_async((task.id,), {'priority': task.priority}, countdown=countdown)
+        return {"status": "queued", "task_id": task.id, "reason": "Previous run still in progress"}
+    return record_skipped(task, retry_count)
+
+
+def _retry_after_batch_failure(task):
+    # The batch counts as the first attempt; later attempts leave async mode
+    # for the regular per-task retry path, whose Celery retry count is what
+    # bounds them (a batch message carries no per-task count).
+    countdown, exhausted = next_retry(task, 0)
+    if countdown is not None:
+        execute_scheduled_task.apply_async(
+            (task.id,), {'priority': task.priority}, countdown=countdown, retries=1
+        )
+    elif exhausted:
+        record_exhausted(task)
+
+
+@shared_task(soft_time_limit=300, time_limit=600)
+def execute_scheduled_tasks(task_ids, priority=None):
+    """Run a batch of executions concurrently on one event loop (async mode)."""
+    results = run_many(
+        task_ids, settings.TASK_EXECUTION['ASYNC_CONCURRENCY'], _retry_after_batch_failure, handle_overlap
+    )
+    return {
+        "executed": len(results),
+        "succeeded": sum(1 for result in results if result["status"] == "success"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+    }
+
+
+def dispatch_executions(tasks):
+    """
+    Queue executions for ``(task_id, priority)`` pairs: one message per task,
+    or per batch of same-priority tasks in async mode.
+    """
+    config = settings.TASK_EXECUTION
+    if config['MODE'] == 'async':
+        by_priority = {}
+        for task_id, priority in tasks:
+            by_priority.setdefault(priority, []).append(task_id)
+        group(
+            execute_scheduled_tasks.s(chunk, priority=priority)
+            for priority, task_ids in by_priority.items()
+            for chunk in _chunks(task_ids, config['ASYNC_BATCH_SIZE'])
+        ).apply_async()
+    else:
+        group(execute_scheduled_task.s(task_id, priority=priority) for task_id, priority in tasks).apply_async()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _claim_overdue(task_ids, now, stale_before):
+    """
+    Move a chunk of overdue ONE_TIME tasks to PENDING and return the ids this
+    call actually claimed. The UPDATE re-checks the claimable state, so a
+    concurrent scan that already claimed a task leaves it alone, and the
+    read-back on our own claim timestamp tells the two scans apart.
+    """
+    claimable = Q(status='ACTIVE') | Q(status='PENDING', updated_at__lt=stale_before)
+    ScheduledTask.objects.filter(claimable, pk__in=task_ids).update(status='PENDING', updated_at=now)
+    claimed = list(ScheduledTask.objects.filter(
+        pk__in=task_ids, status='PENDING', updated_at=now
+    ).only('id', 'name', 'priority'))
+    record_task_change(*[task.id for task in claimed], execution=True)
+    return claimed
+
+
+def _backfill_next_execution(now, chunk_size):
+    """Fill in next_execution for schedulable tasks saved before it was maintained."""
+    missing = ScheduledTask.objects.filter(
+        next_execution__isnull=True,
+        is_active=True,
+        status__in=['ACTIVE', 'PENDING']
+    ).exclude(schedule_type="ONE_TIME", executed_once=True)
+
+    filled = 0
+    for chunk in _chunks(missing.iterator(chunk_size=chunk_size), chunk_size):
+        for task in chunk:
+            task.next_execution = task.compute_next_execution(now)
+        changed = [task for task in chunk if task.next_execution is not None]
+        ScheduledTask.objects.bulk_update(changed, ['next_execution'])
+        record_task_change(*[task.id for task in changed], execution=True)
+        filled += len(changed)
+    return filled
 
 
 @shared_task
 def recovery_scan():
     now = timezone.now()
+    config = settings.RECOVERY
+    chunk_size = config['CHUNK_SIZE']
+    stale_before = now - timedelta(seconds=config['CLAIM_TTL'])
+    timings = {}
+    
+    started = time.monotonic()
+    backfilled_count = _backfill_next_execution(now, chunk_size)
+    timings["backfill_seconds"] = round(time.monotonic() - started, 3)
     
+    started = time.monotonic()
     overdue_tasks = ScheduledTask.objects.filter(
+        Q(status='ACTIVE') | Q(status='PENDING', updated_at__lt=stale_before),
         schedule_type="ONE_TIME",
-        scheduled_time__lte=now,
+        next_execution__lte=now,
         executed_once=False,
-        is_active=True,
-        status='ACTIVE'
-    )
+        is_active=True
+    ).values_list('id', flat=True)
     
     recovered_count = 0
-    for task in overdue_tasks:
-        execute_scheduled_task.delay(task.id)
-        recovered_count += 1
+    for chunk in _chunks(overdue_tasks.iterator(chunk_size=chunk_size), chunk_size):
+        claimed = _claim_overdue(chunk, now, stale_before)
+        if not claimed:
+            continue
+        dispatch_executions([(task.id, task.priority) for task in claimed])
+        recovered_count += len(claimed)
         
-        Notification.objects.create(
-            title=f"Task Recovery: {task.name}",
-            message=f"Task '{task.name}' was missed and has been triggered for recovery.",
-            category='RECOVERY',
-            priority='HIGH',
-            task=task
-        )
+        for task in claimed:
+            notify(
+                title=f"Task Recovery: {task.name}",
+                message=f"Task '{task.name}' was missed and has been triggered for recovery.",
+                category='RECOVERY',
+                priority='HIGH',
+                task=task
+            )
+        flush_notifications()
+    timings["overdue_seconds"] = round(time.monotonic() - started, 3)
     
+    started = time.monotonic()
+    # A recurring task is stuck once beat is well past its next_execution
+    # without the execution having moved it forward.
     stuck_tasks = ScheduledTask.objects.filter(
         schedule_type__in=['CRON', 'INTERVAL'],
+        next_execution__lt=now - timedelta(seconds=config['STUCK_GRACE']),
         is_active=True,
         status='ACTIVE'
-    ).exclude(
-        next_execution__isnull=False,
-        next_execution__gt=now
     )
     
-    for task in stuck_tasks:
-        from .serializers import ScheduledTaskSerializer
-        serializer = ScheduledTaskSerializer()
-        serializer._update_periodic_task(task)
+    stuck_count = 0
+    rebuilt_count = 0
+    for chunk in _chunks(stuck_tasks.iterator(chunk_size=chunk_size), chunk_size):
+        stuck_count += len(chunk)
+        scheduled = set(PeriodicTask.objects.filter(
+            name__in=[periodic_task_name(task.id) for task in chunk],
+            enabled=True
+        ).values_list('name', flat=True))
+        for task in chunk:
+            if periodic_task_name(task.id) not in scheduled:
+                sync_periodic_task(task)
+                rebuilt_count += 1
+    timings["stuck_seconds"] = round(time.monotonic() - started, 3)
     
-    return {
+    result = {
+        "backfilled_tasks": backfilled_count,
         "recovered_tasks": recovered_count,
-        "stuck_tasks": stuck_tasks.count()
+        "stuck_tasks": stuck_count,
+        "rebuilt_schedules": rebuilt_count,
+        "timings": timings
     }
+    metrics.record_recovery_scan(result)
+    return result
+
+
+@shared_task
+def reconcile_notification_counters():
+    return {"drift": counters.reconcile()}
+
+
+@shared_task
+def apply_retention():
+    return retention.apply_retention()
+
+
+@shared_task
+def collect_orphan_schedule_rows():
+    return collect_orphan_schedules()
 
 
 def execute_task_logic(task):
-    import random
-    import time
-    
-    time.sleep(random.uniform(0.5, 2.0))
-    
-    if random.random() < 0.5:
-        raise Exception("Simulated random task failure")
-    
-    return {"result": "success"}
\ No newline at end of file
+    return get_handler().run(task)
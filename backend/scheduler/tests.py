@@ -1,3 +1,1367 @@
-from django.test import TestCase
+import asyncio
+import base64
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from celery import Celery
+from celery.exceptions import Retry
+from celery.schedules import crontab
+from celery.utils.time import remaining
+from config.celery import app, route_task
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_celery_beat.models import IntervalSchedule, PeriodicTask
+from prometheus_client import REGISTRY
+
+from . import counters, retention
+from .beat import HeapScheduler
+from .changes import change_watermark, purge_horizon, read_change_rows
+from .cron import CronError, compile_cron, parse_field
+from .events import get_broker
+from .execution import record_success, run_many
+from .handlers import AsyncTaskHandler, get_handler
+from .leases import ExecutionLease, RedisLeaseBackend, get_lease_backend
+from .management.commands.bench_scheduler import OfflineHeapScheduler
+from .metrics import record_execution
+from .models import (
+    ExecutionLog, ExecutionLogRollup, Notification, NotificationChange, NotificationCounter, ScheduledTask, TaskChange
+)
+from .notifications import NotificationSink, get_sink
+from .retention import purge_task_changes, rollup_logs
+from .retries import get_retry_budget, retry_delay
+from .schedules import collect_orphan_schedules, periodic_task_name, sync_periodic_task
+from .tasks import _claim_overdue, execute_scheduled_task, execute_scheduled_tasks, handle_overlap, recovery_scan
+from .views import notification_stream
+
+
+@override_settings(
+    NOTIFICATION_SINK={'SYNCHRONOUS': True},
+    RETRY={
+        'MAX_DELAY': 3600,
+        'MIN_DELAY': 1,
+        'BUDGET': {'BACKEND': 'scheduler.retries.LocalRetryBudget', 'LIMIT': 2, 'WINDOW': 60},
+    },
+)
+class ExecuteScheduledTaskQueryTests(TestCase):
+    """
+    The execution path has a fixed query budget. Notifications are written
+    synchronously here, so their inserts are part of the count; savepoints
+    only exist because TestCase wraps each test in a transaction.
+    """
+
+    def setUp(self):
+        for getter in (get_sink, get_lease_backend, get_retry_budget):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+        NotificationCounter.objects.bulk_create([
+            NotificationCounter(category=category, priority=priority)
+            for category, _ in Notification.CATEGORY_CHOICES
+            for priority, _ in Notification.PRIORITY_CHOICES
+        ])
+
+    def create_task(self, **fields):
+        task = ScheduledTask.objects.create(**{'name': "task", 'max_retries': 0, **fields})
+        sync_periodic_task(task)
+        return task
+
+    def run_task(self, task, max_queries, side_effect=None):
+        with mock.patch('scheduler.tasks.execute_task_logic', side_effect=side_effect), \
+                CaptureQueriesContext(connection) as queries:
+            result = execute_scheduled_task.apply(args=[task.id])
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        self.assertLessEqual(len(statements), max_queries, "\n".join(statements))
+        return result
+
+    def test_success(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        result = self.run_task(task, max_queries=9)
+
+        self.assertEqual(result.get()['status'], 'success')
+        task.refresh_from_db()
+        self.assertEqual(task.total_executions, 1)
+        self.assertIsNotNone(task.next_execution)
+        self.assertEqual(task.execution_logs.get().status, 'SUCCESS')
+
+    def test_failure(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60, max_retries=1)
+        with mock.patch.object(execute_scheduled_task, 'retry', side_effect=Retry()) as retry:
+            result = self.run_task(task, max_queries=8, side_effect=Exception("boom"))
+
+        self.assertEqual(result.state, 'RETRY')
+        self.assertEqual(ExecutionLog.objects.get(task=task).status, 'FAILED')
+        countdown = retry.call_args.kwargs['countdown']
+        self.assertTrue(1 <= countdown <= task.retry_delay)
+
+    def test_repeated_successes_share_a_digest(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60, max_retries=1)
+        self.run_task(task, max_queries=9)
+        self.run_task(task, max_queries=9)
+        digest = Notification.objects.get(task=task)
+        self.assertEqual(digest.occurrences, 2)
+        self.assertEqual(digest.execution_log, ExecutionLog.objects.latest('id'))
+        self.assertGreater(digest.last_occurred_at, digest.first_occurred_at)
+        self.assertEqual(counters.unread_count(), 1)
+
+        # A failure comes through at once and ends the digest.
+        with mock.patch.object(execute_scheduled_task, 'retry', side_effect=Retry()):
+            self.run_task(task, max_queries=9, side_effect=Exception("boom"))
+        self.run_task(task, max_queries=9)
+        self.assertEqual(
+            list(Notification.objects.filter(task=task).order_by('id').values_list('category', 'occurrences')),
+            [('TASK_EXECUTED', 2), ('TASK_FAILED', 1), ('TASK_EXECUTED', 1)]
+        )
+
+        # So does reading it, or the window running out.
+        Notification.objects.filter(task=task).update(is_read=True)
+        self.run_task(task, max_queries=9)
+        Notification.objects.filter(task=task, is_read=False).update(
+            first_occurred_at=timezone.now() - timedelta(hours=2)
+        )
+        self.run_task(task, max_queries=9)
+        self.assertEqual(Notification.objects.filter(task=task, category='TASK_EXECUTED').count(), 4)
+
+    def test_extended_digest_moves_to_the_top(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        self.run_task(task, max_queries=9)
+        digest = Notification.objects.get(task=task)
+        others = [
+            Notification.objects.create(title=f"other {index}", message="m", category='SYSTEM') for index in range(3)
+        ]
+
+        def page(url):
+            response = self.client.get(url)
+            return [row['id'] for row in response.json()['results']], response.json()['next']
+
+        first, next_url = page('/api/notifications/?page_size=2')
+        self.assertEqual(first, [others[2].id, others[1].id])
+
+        # The digest is extended while the client pages through the list.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_task(task, max_queries=9)
+        extended = Notification.objects.get(pk=digest.pk)
+        self.assertEqual(extended.occurrences, 2)
+        self.assertEqual(extended.created_at, digest.created_at)
+
+        # It has moved above the cursor: the next page doesn't repeat it and
+        # a fresh first page leads with it.
+        second, next_url = page(next_url)
+        self.assertEqual(second, [others[0].id])
+        self.assertIsNone(next_url)
+        first, _ = page('/api/notifications/?page_size=2')
+        self.assertEqual(first, [digest.id, others[2].id])
+
+    def test_digest_window_per_task(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60, notification_digest_window=0)
+        self.run_task(task, max_queries=8)
+        self.run_task(task, max_queries=8)
+        self.assertEqual(list(Notification.objects.values_list('occurrences', flat=True)), [1, 1])
+
+    def test_batched_successes_are_folded(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        other = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        sink = NotificationSink(max_batch=100, max_delay=60)
+
+        def executed(task):
+            return Notification(title="executed", message="m", category='TASK_EXECUTED', task=task)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for notification in [executed(task), executed(other), executed(task),
+                                 Notification(title="failed", message="m", category='TASK_FAILED', task=task),
+                                 executed(task), executed(task)]:
+                sink.add(notification)
+        sink.flush()
+        self.assertEqual(
+            list(Notification.objects.order_by('id').values_list('task', 'category', 'occurrences')),
+            [(task.id, 'TASK_EXECUTED', 2), (other.id, 'TASK_EXECUTED', 1),
+             (task.id, 'TASK_FAILED', 1), (task.id, 'TASK_EXECUTED', 2)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sink.add(executed(task))
+            sink.add(executed(other))
+        sink.flush()
+        self.assertEqual(
+            list(Notification.objects.order_by('id').values_list('occurrences', flat=True)), [2, 2, 1, 3]
+        )
+
+    def test_exhausted_retries_disable_task(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        result = self.run_task(task, max_queries=16, side_effect=Exception("boom"))
+
+        self.assertTrue(result.failed())
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'FAILED')
+        self.assertFalse(task.is_active)
+        self.assertIsNone(task.next_execution)
+        self.assertFalse(task.periodic_task.enabled)
+
+    def test_retry_delay_backs_off_exponentially_up_to_cap(self):
+        task = ScheduledTask(retry_delay=60, retry_jitter=False)
+        self.assertEqual([retry_delay(task, n) for n in range(4)], [60, 120, 240, 480])
+        task.retry_max_delay = 200
+        self.assertEqual(retry_delay(task, 3), 200)
+        task.retry_jitter = True
+        self.assertTrue(all(1 <= retry_delay(task, 3) <= 200 for _ in range(100)))
+
+    def test_retry_budget_drops_retries_over_limit(self):
+        budget = get_retry_budget()
+        self.assertEqual([budget.spend() for _ in range(3)], [True, True, False])
+
+    def test_one_time_completion(self):
+        task = self.create_task(schedule_type='ONE_TIME', scheduled_time=timezone.now() + timedelta(hours=1))
+        # The load, start_execution's three statements (committed before the
+        # handler runs), and the outcome: log, completion, its TaskChange,
+        # the PeriodicTask and two notifications of three statements each.
+        result = self.run_task(task, max_queries=14)
+
+        self.assertEqual(result.get()['total_executions'], 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'COMPLETED')
+        self.assertIsNone(task.next_execution)
+        self.assertFalse(task.periodic_task.enabled)
+
+    def test_concurrent_increments_are_not_lost(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        stale = ScheduledTask.objects.get(pk=task.pk)
+        self.run_task(task, max_queries=9)
+
+        # A second run that loaded the row before the first one finished.
+        with mock.patch.object(ScheduledTask.objects, 'get', return_value=stale), \
+                mock.patch('scheduler.tasks.execute_task_logic'):
+            execute_scheduled_task.apply(args=[task.id])
+
+        task.refresh_from_db()
+        self.assertEqual(task.total_executions, 2)
+
+    def test_overlapping_run_is_skipped(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60)
+        lease = ExecutionLease(task.id)
+        self.assertTrue(lease.acquire())
+
+        result = self.run_task(task, max_queries=2)
+
+        self.assertEqual(result.get()['status'], 'skipped')
+        task.refresh_from_db()
+        self.assertEqual(task.total_executions, 0)
+        self.assertEqual(task.execution_logs.get().status, 'SKIPPED')
+
+        lease.release()
+        self.run_task(task, max_queries=9)
+        task.refresh_from_db()
+        self.assertEqual(task.total_executions, 1)
+
+    def test_queue_policy_resends_overlapping_run(self):
+        task = self.create_task(schedule_type='INTERVAL', interval_seconds=60, overlap_policy='QUEUE')
+        self.assertTrue(ExecutionLease(task.id).acquire())
+
+        with mock.patch.object(execute_scheduled_task, 'apply_async') as apply_async:
+            result = self.run_task(task, max_queries=14)
+
+        self.assertEqual(result.get()['status'], 'queued')
+        apply_async.assert_called_once_with((task.id,), {'priority': task.priority}, countdown=30)
+        self.assertFalse(task.execution_logs.exists())
+
+
+class ScriptedHandler(AsyncTaskHandler):
+    """Fails the tasks whose name starts with "fail"."""
+
+    async def arun(self, task):
+        if task.name.startswith("fail"):
+            raise Exception("boom")
+
+
+@override_settings(
+    NOTIFICATION_SINK={'SYNCHRONOUS': True},
+    TASK_EXECUTION={'HANDLER': 'scheduler.tests.ScriptedHandler', 'MODE': 'async', 'ASYNC_CONCURRENCY': 2},
+)
+class AsyncExecutionTests(TransactionTestCase):
+    """
+    run_many does its database work from sync_to_async threads, which
+    don't share a TestCase's open transaction, hence TransactionTestCase.
+    """
+
+    def setUp(self):
+        for getter in (get_broker, get_handler, get_sink, get_lease_backend):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+
+    def create_task(self, name, **fields):
+        return ScheduledTask.objects.create(**{
+            'name': name, 'schedule_type': 'INTERVAL', 'interval_seconds': 60, 'max_retries': 0, **fields
+        })
+
+    def test_outcomes(self):
+        succeeds = self.create_task("succeeds")
+        once = self.create_task("once", schedule_type='ONE_TIME', scheduled_time=timezone.now())
+        fails = self.create_task("fails")
+        inactive = self.create_task("inactive", is_active=False)
+        busy = self.create_task("busy")
+        lease = ExecutionLease(busy.id)
+        self.assertTrue(lease.acquire())
+        self.addCleanup(lease.release)
+
+        failed = []
+        results = run_many(
+            [succeeds.id, once.id, fails.id, inactive.id, busy.id, 0], 2, on_failure=failed.append
+        )
+
+        self.assertEqual([(result['status'], result.get('reason')) for result in results], [
+            ('success', None),
+            ('success', None),
+            ('failed', "boom"),
+            ('skipped', "Task is inactive"),
+            ('skipped', "Previous run still in progress"),
+            ('failed', "Task not found"),
+        ])
+        self.assertEqual(failed, [fails])
+        self.assertEqual(
+            dict(ExecutionLog.objects.values_list('task_id', 'status')),
+            {succeeds.id: 'SUCCESS', once.id: 'SUCCESS', fails.id: 'FAILED', busy.id: 'SKIPPED'}
+        )
+        self.assertEqual(
+            sorted(Notification.objects.values_list('task__name', 'category')),
+            [('fails', 'TASK_FAILED'), ('once', 'TASK_COMPLETED'), ('once', 'TASK_EXECUTED'),
+             ('succeeds', 'TASK_EXECUTED')]
+        )
+
+        once.refresh_from_db()
+        self.assertEqual((once.status, once.is_active, once.executed_once), ('COMPLETED', False, True))
+        self.assertEqual(
+            dict(ScheduledTask.objects.values_list('name', 'total_executions')),
+            {'succeeds': 1, 'once': 1, 'fails': 1, 'inactive': 0, 'busy': 0}
+        )
+        # Every lease the runs took was released.
+        self.assertTrue(ExecutionLease(succeeds.id).acquire())
+        self.assertTrue(ExecutionLease(fails.id).acquire())
+
+    def test_queued_rerun_stays_in_async_mode(self):
+        task = self.create_task("queued", overlap_policy='QUEUE', priority='HIGH')
+        with mock.patch.object(execute_scheduled_tasks, 'apply_async') as send:
+            self.assertEqual(handle_overlap(task, 0)['status'], 'queued')
+        send.assert_called_once_with(([task.id],), {'priority': 'HIGH'}, countdown=30)
+
+
+class RedisLeaseBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        # Nothing listens on port 1, so every Redis call fails to connect.
+        self.backend = RedisLeaseBackend('redis://127.0.0.1:1/0', fallback='scheduler.leases.LocalLeaseBackend')
+
+    def test_fallback_lease_is_released_by_the_fallback(self):
+        with self.assertLogs('scheduler.leases', 'WARNING'):
+            token = self.backend.acquire('key', 60)
+        self.assertIsNotNone(token)
+        self.assertIsNone(self.backend.fallback.acquire('key', 60))
+
+        # Redis is back by the time the run finishes.
+        with mock.patch.object(self.backend, '_release') as release:
+            self.backend.release('key', token)
+        release.assert_not_called()
+        self.assertIsNotNone(self.backend.fallback.acquire('key', 60))
+
+    def test_redis_lease_is_not_released_by_the_fallback(self):
+        held = self.backend.fallback.acquire('key', 60)
+        with self.assertLogs('scheduler.leases', 'WARNING'):
+            self.backend.release('key', held)
+        self.assertIsNone(self.backend.fallback.acquire('key', 60))
+
+
+class ExecutionStatsTests(TestCase):
+
+    def setUp(self):
+        self.task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+        self.now = timezone.now()
+        for hours_ago in range(48):
+            logs = ExecutionLog.objects.bulk_create([
+                ExecutionLog(
+                    task=self.task,
+                    status='FAILED' if n == 0 else 'SUCCESS',
+                    execution_time=(n + 1) / 10,
+                    retry_count=1 if n == 0 else 0
+                )
+                for n in range(10)
+            ])
+            ExecutionLog.objects.filter(pk__in=[log.pk for log in logs]).update(
+                executed_at=self.now - timedelta(hours=hours_ago)
+            )
+
+    def test_rollups_and_recent_logs_give_the_same_figures(self):
+        url = f'/api/tasks/{self.task.id}/stats/'
+        params = {'granularity': 'DAY', 'start': (self.now - timedelta(hours=47)).isoformat()}
+        before = self.client.get(url, params).json()
+        rollup_logs('HOUR', self.now)
+        rollup_logs('DAY', self.now)
+        after = self.client.get(url, params).json()
+        del before['end'], after['end']
+        self.assertEqual(before, after)
+        self.assertEqual(after['summary']['executions'], 480)
+
+    def test_summary(self):
+        rollup_logs('HOUR', self.now)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/stats/', {'start': (self.now - timedelta(hours=24)).isoformat()})
+        self.assertLessEqual(len(queries), 3)
+
+        summary = response.json()['summary']
+        self.assertEqual(summary['executions'], 250)
+        self.assertEqual(summary['failed'], 25)
+        self.assertEqual(summary['retry_rate'], 0.1)
+        self.assertAlmostEqual(summary['execution_time']['mean'], 0.55)
+        self.assertAlmostEqual(summary['execution_time']['p50'], 0.5, delta=0.05)
+        self.assertEqual(summary['execution_time']['p99'], 1.0)
+        self.assertEqual(len(response.json()['buckets']), 25)
+
+    def test_interrupted_rollup_resumes_after_the_last_complete_bucket(self):
+        other = ScheduledTask.objects.create(name="other", schedule_type='INTERVAL', interval_seconds=60)
+        ExecutionLog.objects.filter(pk__in=ExecutionLog.objects.filter(task=self.task).values('pk')[:40]).update(
+            task=other
+        )
+        original = retention._save_rollups
+        calls = []
+
+        def fail_third_bucket(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("interrupted")
+            return original(*args, **kwargs)
+
+        with mock.patch('scheduler.retention._save_rollups', side_effect=fail_third_bucket), \
+                self.assertRaises(RuntimeError):
+            rollup_logs('HOUR', self.now, batch_size=1)
+        # The two buckets written before the failure are whole, fleet row included.
+        stored = ExecutionLogRollup.objects.filter(task__isnull=True)
+        self.assertEqual(stored.count(), 2)
+        for fleet in stored:
+            self.assertEqual(fleet.total_count, ExecutionLog.objects.filter(
+                executed_at__gte=fleet.bucket_start, executed_at__lt=fleet.bucket_start + timedelta(hours=1)
+            ).count())
+
+        rollup_logs('HOUR', self.now)
+        tasks = ExecutionLogRollup.objects.filter(task__isnull=False)
+        # All but the current, incomplete hour, each counted once.
+        self.assertEqual(sum(tasks.values_list('total_count', flat=True)), 470)
+        self.assertEqual(sum(stored.values_list('total_count', flat=True)), 470)
+        self.assertEqual(stored.all().count(), 47)
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+
+    def days_ago(self, days):
+        return self.now - timedelta(days=days)
+
+    def create_logs(self, *days_ago):
+        logs = {}
+        for days in days_ago:
+            log = ExecutionLog.objects.create(task=self.task, status='SUCCESS', execution_time=0.1)
+            ExecutionLog.objects.filter(pk=log.pk).update(executed_at=self.days_ago(days))
+            logs[days] = log.pk
+        return logs
+
+    def daily_rollup(self, days_ago):
+        bucket_start = self.days_ago(days_ago).replace(hour=0, minute=0, second=0, microsecond=0)
+        retention.empty_rollup(None, 'DAY', bucket_start).save()
+
+    def test_deletes_in_chunks(self):
+        for index in range(5):
+            Notification.objects.create(title=f"n{index}", message="m", category='SYSTEM')
+        chunks = []
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = retention._delete_in_chunks(
+                Notification.objects.all(), 2, on_chunk=lambda rows: chunks.append(len(rows))
+            )
+        self.assertEqual(deleted, 5)
+        self.assertEqual(chunks, [2, 2, 1])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 3)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_logs_are_kept_until_a_daily_rollup_covers_them(self):
+        logs = self.create_logs(40, 35, 20)
+        self.assertEqual(retention.purge_logs(self.now), 0)
+
+        # Only what the last daily rollup covers goes, even past LOG_MAX_AGE_DAYS.
+        self.daily_rollup(37)
+        self.assertEqual(retention.purge_logs(self.now, chunk_size=1), 1)
+        self.assertFalse(ExecutionLog.objects.filter(pk=logs[40]).exists())
+
+        self.daily_rollup(1)
+        self.assertEqual(retention.purge_logs(self.now), 1)
+        self.assertEqual(list(ExecutionLog.objects.values_list('pk', flat=True)), [logs[20]])
+
+    def test_expired_and_old_archived_notifications_are_purged(self):
+        def create(title, **fields):
+            notification = Notification.objects.create(title=title, message="m", category='SYSTEM', **fields)
+            counters.record_created(notification)
+            return notification
+
+        create("expired", expires_at=self.days_ago(1))
+        old_archived = create("old archived", is_read=True, is_archived=True)
+        recent_archived = create("recent archived", is_read=True, is_archived=True)
+        create("unexpired", expires_at=self.now + timedelta(days=1))
+        create("unread")
+        Notification.objects.filter(pk=old_archived.pk).update(created_at=self.days_ago(8))
+        Notification.objects.filter(pk=recent_archived.pk).update(created_at=self.days_ago(6))
+        self.assertEqual(counters.unread_count(), 3)
+
+        self.assertEqual(retention.purge_notifications(self.now, chunk_size=1), 2)
+        self.assertCountEqual(
+            Notification.objects.values_list('title', flat=True), ["recent archived", "unexpired", "unread"]
+        )
+        self.assertEqual(counters.unread_count(), 2)
+
+    def test_change_log_purges_advance_the_horizon(self):
+        for purge, model, field, url in [
+            (retention.purge_task_changes, TaskChange, 'task_id', '/api/tasks/changes/'),
+            (retention.purge_notification_changes, NotificationChange, 'notification_id',
+             '/api/notifications/changes/'),
+        ]:
+            with self.subTest(model=model.__name__):
+                ids = [model.objects.create(**{field: 1}).id for _ in range(4)]
+                model.objects.filter(id__lte=ids[2]).update(changed_at=self.days_ago(8))
+                model.objects.filter(id=ids[3]).update(changed_at=self.days_ago(6))
+
+                self.assertEqual(purge(self.now, chunk_size=2), 3)
+                self.assertEqual(list(model.objects.values_list('id', flat=True)), [ids[3]])
+                self.assertEqual(purge_horizon(model), ids[2])
+
+                # A cursor from before the horizon may have missed changes.
+                self.assertEqual(self.client.get(url, {'since': ids[0]}).status_code, 410)
+                self.assertEqual(self.client.get(url, {'since': ids[2]}).status_code, 200)
+
+
+class MetricsTests(TestCase):
+
+    def test_exposition(self):
+        record_execution('SUCCESS', 'HIGH', execution_time=0.2, start_lag=1.5)
+        self.client.get('/api/stats/')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('scheduler_executions_total{priority="HIGH",status="SUCCESS"}', body)
+        self.assertIn('scheduler_start_lag_seconds_bucket{le="2.0",priority="HIGH"}', body)
+        self.assertIn('scheduler_http_request_queries_count{view="stats"}', body)
+
+    @override_settings(NOTIFICATION_SINK={'SYNCHRONOUS': True})
+    def test_executions_are_counted_on_commit(self):
+        get_sink.cache_clear()
+        self.addCleanup(get_sink.cache_clear)
+        task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60, priority='LOW')
+
+        def executions():
+            return REGISTRY.get_sample_value(
+                'scheduler_executions_total', {'status': 'SUCCESS', 'priority': 'LOW'}
+            ) or 0
+
+        before = executions()
+        with self.captureOnCommitCallbacks() as callbacks:
+            record_success(task, 0.1, 0)
+        self.assertEqual(executions(), before)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(executions(), before + 1)
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        self.task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+
+    def test_unchanged_poll_is_served_from_cache(self):
+        first = self.client.get('/api/tasks/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/tasks/')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get('/api/tasks/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_writes_invalidate(self):
+        first = self.client.get('/api/tasks/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/tasks/{self.task.id}/pause/')
+
+        second = self.client.get('/api/tasks/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(second.json()['results'][0]['status'], 'PAUSED')
+
+    def test_unread_count_follows_reads(self):
+        notification = Notification.objects.create(title="t", message="m", category='SYSTEM', priority='LOW')
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.record_created(notification)
+        self.assertEqual(self.client.get('/api/notifications/unread_count/').json()['unread_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/notifications/{notification.id}/mark_as_read/')
+        self.assertEqual(self.client.get('/api/notifications/unread_count/').json()['unread_count'], 0)
+
+    def test_full_update_moves_counters(self):
+        notification = Notification.objects.create(title="t", message="m", category='SYSTEM', priority='LOW')
+        counters.record_created(notification)
+        listing = self.client.get('/api/notifications/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f'/api/notifications/{notification.id}/',
+                {'title': "t", 'message': "m", 'category': 'REMINDER', 'priority': 'HIGH', 'is_read': False},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        breakdown = self.client.get('/api/notifications/unread_count/').json()
+        self.assertEqual((breakdown['by_category'].get('SYSTEM'), breakdown['by_category']['REMINDER']), (0, 1))
+        self.assertEqual(counters.reconcile(), 0)
+        self.assertEqual(NotificationChange.objects.filter(notification_id=notification.id).count(), 2)
+        self.assertNotEqual(self.client.get('/api/notifications/')['ETag'], listing['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                f'/api/notifications/{notification.id}/',
+                {'title': "t", 'message': "m", 'category': 'REMINDER', 'priority': 'HIGH', 'is_read': True},
+                content_type='application/json'
+            )
+        self.assertEqual(counters.unread_count(), 0)
+        self.assertEqual(counters.reconcile(), 0)
+
+
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+
+    def test_malformed_cursor_is_not_found(self):
+        for payload in [b'{"v": "garbage", "id": 1}', b'{"v": "2025-01-01T00:00:00Z", "id": "x"}', b'not json']:
+            cursor = base64.urlsafe_b64encode(payload).decode()
+            self.assertEqual(self.client.get('/api/tasks/', {'cursor': cursor}).status_code, 404)
+
+        cursor = base64.urlsafe_b64encode(b'{"v": "2999-01-01T00:00:00+00:00", "id": 1}').decode()
+        self.assertEqual(self.client.get('/api/tasks/', {'cursor': cursor}).json()['results'][0]['id'], self.task.id)
+
+    def test_status_counts(self):
+        ScheduledTask.objects.create(name="paused", schedule_type='INTERVAL', interval_seconds=60, status='PAUSED')
+        self.assertEqual(
+            self.client.get('/api/tasks/status_counts/').json(),
+            {'total': 2, 'by_status': {'ACTIVE': 1, 'PAUSED': 1}}
+        )
+
+
+class ChangesTests(TestCase):
+
+    def setUp(self):
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+
+    def test_task_changes_since_cursor(self):
+        cursor = self.client.get('/api/tasks/changes/').json()['cursor']
+        kept = ScheduledTask.objects.create(name="kept", schedule_type='INTERVAL', interval_seconds=60)
+        gone = ScheduledTask.objects.create(name="gone", schedule_type='INTERVAL', interval_seconds=60)
+
+        self.client.post(f'/api/tasks/{kept.id}/pause/')
+        self.client.post(f'/api/tasks/{gone.id}/pause/')
+        self.client.delete(f'/api/tasks/{gone.id}/')
+
+        page = self.client.get('/api/tasks/changes/', {'since': cursor}).json()
+        self.assertEqual([task['id'] for task in page['results']], [kept.id])
+        self.assertEqual(page['results'][0]['status'], 'PAUSED')
+        self.assertEqual(page['deleted'], [gone.id])
+        self.assertFalse(page['has_more'])
+
+        again = self.client.get('/api/tasks/changes/', {'since': page['cursor']}).json()
+        self.assertEqual((again['results'], again['deleted']), ([], []))
+        self.assertEqual(again['cursor'], page['cursor'])
+
+        limited = self.client.get('/api/tasks/changes/', {'since': cursor, 'limit': 1}).json()
+        self.assertTrue(limited['has_more'])
+        self.assertEqual(limited['cursor'], cursor + 1)
+
+    def test_notification_changes(self):
+        cursor = self.client.get('/api/notifications/changes/').json()['cursor']
+        notification = Notification.objects.create(title="t", message="m", category='SYSTEM', priority='LOW')
+        counters.record_created(notification)
+        self.client.post('/api/notifications/mark_all_as_read/')
+
+        page = self.client.get('/api/notifications/changes/', {'since': cursor}).json()
+        self.assertEqual([(row['id'], row['is_read']) for row in page['results']], [(notification.id, True)])
+
+        self.client.delete(f'/api/notifications/{notification.id}/')
+        page = self.client.get('/api/notifications/changes/', {'since': page['cursor']}).json()
+        self.assertEqual((page['results'], page['deleted']), ([], [notification.id]))
+
+    def test_purged_cursor_is_gone(self):
+        task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+        for _ in range(3):
+            self.client.post(f'/api/tasks/{task.id}/pause/')
+            self.client.post(f'/api/tasks/{task.id}/resume/')
+        first = TaskChange.objects.order_by('id').first().id
+        TaskChange.objects.filter(id__lt=first + 3).update(changed_at=timezone.now() - timedelta(days=30))
+        purge_task_changes()
+
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': first}).status_code, 410)
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': first + 2}).status_code, 200)
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': -5}).status_code, 400)
+
+        # With the whole log purged, old cursors are still refused and new
+        # ones start past the purged ids.
+        TaskChange.objects.update(changed_at=timezone.now() - timedelta(days=30))
+        purge_task_changes()
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': first + 2}).status_code, 410)
+        cursor = self.client.get('/api/tasks/changes/').json()['cursor']
+        self.assertEqual(cursor, first + 5)
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': cursor}).status_code, 200)
+
+    def test_watermark_takes_no_write_transaction(self):
+        TaskChange.objects.create(task_id=1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(change_watermark(TaskChange), TaskChange.objects.get().id)
+        self.assertFalse([query for query in queries if 'SAVEPOINT' in query['sql'] or 'LOCK' in query['sql']])
+
+    def test_rows_sharing_a_position_are_read_together(self):
+        # As on PostgreSQL, where the rows of one transaction share its id.
+        for position in [1, 1, 1, 2, 3]:
+            TaskChange.objects.create(task_id=position)
+        by_task = mock.patch(
+            'scheduler.changes.with_positions', lambda model: model.objects.annotate(position=F('task_id'))
+        )
+        with by_task:
+            rows, cursor, has_more = read_change_rows(TaskChange, 'task_id', 0, 2)
+            self.assertEqual(([row[0] for row in rows], cursor, has_more), ([1, 1, 1], 1, True))
+            rows, cursor, has_more = read_change_rows(TaskChange, 'task_id', 0, 4)
+            self.assertEqual(([row[0] for row in rows], cursor, has_more), ([1, 1, 1, 2], 2, True))
+            rows, cursor, has_more = read_change_rows(TaskChange, 'task_id', 2, 4)
+            self.assertEqual(([row[0] for row in rows], cursor, has_more), ([3], 3, False))
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.backup = ScheduledTask.objects.create(
+            name="nightly backup", description="Copy the database", schedule_type='INTERVAL', interval_seconds=60
+        )
+        self.report = ScheduledTask.objects.create(
+            name="weekly report", description="Mentions a backup in passing", schedule_type='INTERVAL',
+            interval_seconds=60
+        )
+        self.cleanup = ScheduledTask.objects.create(
+            name="cleanup", description="Backfill the caches", schedule_type='INTERVAL', interval_seconds=60
+        )
+
+    def search(self, path, query, **params):
+        response = self.client.get(path, {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_terms_are_ranked(self):
+        # A match in the name outranks one in the description.
+        self.assertEqual(self.search('/api/tasks/', 'backup'), [self.backup.id, self.report.id])
+        self.assertEqual(
+            self.search('/api/tasks/', 'backup', ordering='created_at'), [self.backup.id, self.report.id]
+        )
+        self.assertEqual(self.search('/api/tasks/', 'BACKUP nightly'), [self.backup.id])
+        self.assertEqual(self.search('/api/tasks/', 'back'), [])
+
+    def test_prefix_and_phrase(self):
+        self.assertEqual(
+            set(self.search('/api/tasks/', 'back*')), {self.backup.id, self.report.id, self.cleanup.id}
+        )
+        self.assertEqual(self.search('/api/tasks/', '"nightly backup"'), [self.backup.id])
+        self.assertEqual(self.search('/api/tasks/', '"backup nightly"'), [])
+        self.assertEqual(self.search('/api/tasks/', '""'), self.search('/api/tasks/', ''))
+
+    def test_ranked_results_page(self):
+        ScheduledTask.objects.bulk_create([
+            ScheduledTask(name=f"backup {i}", schedule_type='INTERVAL', interval_seconds=60) for i in range(5)
+        ])
+        response = self.client.get('/api/tasks/', {'search': 'backup', 'page_size': 3}).json()
+        ids = [row['id'] for row in response['results']]
+        while response['next']:
+            response = self.client.get(response['next']).json()
+            ids += [row['id'] for row in response['results']]
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+        self.assertEqual(ids[-1], self.report.id)
+
+    def test_index_follows_writes(self):
+        ScheduledTask.objects.filter(id=self.cleanup.id).update(name="archive sweep")
+        self.report.delete()
+        self.assertEqual(self.search('/api/tasks/', 'sweep'), [self.cleanup.id])
+        self.assertEqual(self.search('/api/tasks/', 'cleanup'), [])
+        self.assertEqual(self.search('/api/tasks/', 'report'), [])
+
+    def test_logs_match_message_or_task_name(self):
+        by_message = ExecutionLog.objects.create(task=self.cleanup, status='FAILED', message="disk full")
+        by_task = ExecutionLog.objects.create(task=self.backup, status='SUCCESS', message="done")
+        self.assertEqual(self.search('/api/logs/', 'disk'), [by_message.id])
+        self.assertEqual(self.search('/api/logs/', 'nightly'), [by_task.id])
+
+    def test_notifications(self):
+        notification = Notification.objects.create(
+            title="Disk almost full", message="Free some space", category='SYSTEM', priority='LOW'
+        )
+        Notification.objects.create(title="Other", message="Nothing", category='SYSTEM', priority='LOW')
+        self.assertEqual(self.search('/api/notifications/', 'spac*'), [notification.id])
+
+
+@override_settings(NOTIFICATION_SINK={'SYNCHRONOUS': True})
+class BulkTaskTests(TestCase):
+
+    def setUp(self):
+        for getter in (get_broker, get_sink):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/tasks/bulk/', [
+                {'name': f"task {n}", 'schedule_type': 'INTERVAL', 'interval_seconds': 60} for n in range(3)
+            ], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.tasks = list(ScheduledTask.objects.order_by('id'))
+
+    def events(self, action, params):
+        broker = get_broker()
+        since = broker.latest_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/tasks/{action}/?{params}')
+        self.assertEqual(response.status_code, 200)
+        return [
+            (event['type'], event['task']['id'])
+            for _event_id, event in broker.read(since, timeout=0) if event['type'].startswith('task_')
+        ]
+
+    def enabled(self):
+        return dict(PeriodicTask.objects.values_list('name', 'enabled'))
+
+    def test_bulk_create(self):
+        self.assertEqual([task.name for task in self.tasks], ["task 0", "task 1", "task 2"])
+        self.assertTrue(all(task.next_execution for task in self.tasks))
+        self.assertEqual(self.enabled(), {periodic_task_name(task.id): True for task in self.tasks})
+        self.assertEqual(
+            set(TaskChange.objects.values_list('task_id', flat=True)), {task.id for task in self.tasks}
+        )
+
+    def test_pause_and_resume_report_only_what_changed(self):
+        first, second, third = self.tasks
+        # Paused elsewhere after the ids were read, with its PeriodicTask
+        # left for that writer to update.
+        ScheduledTask.objects.filter(id=third.id).update(status='PAUSED', is_active=False)
+        with mock.patch('scheduler.bulk._id_chunks', return_value=iter([[task.id for task in self.tasks]])):
+            events = self.events('pause_all', 'status=ACTIVE')
+        self.assertEqual(sorted(events), [('task_status', first.id), ('task_status', second.id)])
+        self.assertEqual(self.enabled(), {
+            periodic_task_name(first.id): False,
+            periodic_task_name(second.id): False,
+            periodic_task_name(third.id): True,
+        })
+
+        self.assertEqual(
+            sorted(self.events('resume_all', 'status=PAUSED')),
+            [('task_status', task.id) for task in self.tasks]
+        )
+        self.assertTrue(all(self.enabled().values()))
+        self.assertFalse(ScheduledTask.objects.exclude(status='ACTIVE').exists())
+
+    def test_delete(self):
+        ScheduledTask.objects.filter(id=self.tasks[0].id).update(status='COMPLETED')
+        self.assertEqual(
+            sorted(self.events('delete_all', 'schedule_type=INTERVAL')),
+            [('task_deleted', task.id) for task in self.tasks[1:]]
+        )
+        self.assertEqual(list(ScheduledTask.objects.values_list('id', flat=True)), [self.tasks[0].id])
+        self.assertEqual(list(self.enabled()), [periodic_task_name(self.tasks[0].id)])
+
+        self.assertEqual(self.client.post('/api/tasks/delete_all/').status_code, 400)
+
+
+@override_settings(NOTIFICATION_STREAM={
+    'BACKEND': 'scheduler.events.InMemoryEventBroker', 'RETRY_MS': 3000, 'HEARTBEAT': 0.01,
+})
+class NotificationStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        get_broker().publish({'type': 'notification', 'notification': {'id': 1}})
+
+    def first_event(self, last_id):
+        async def read():
+            request = AsyncRequestFactory().get('/api/notifications/stream/', headers={'Last-Event-ID': last_id})
+            response = await notification_stream(request)
+            stream = aiter(response.streaming_content)
+            await anext(stream)
+            return (await anext(stream)).decode()
+        return asyncio.run(read())
+
+    def test_resumes_from_last_event_id(self):
+        self.assertTrue(self.first_event('0').startswith("id: 1\nevent: notification\n"))
+
+    def test_last_event_id_from_before_a_restart_replays_the_stream(self):
+        self.assertTrue(self.first_event('42').startswith("id: 1\nevent: notification\n"))
+
+    def test_unknown_last_event_id_starts_from_now(self):
+        for last_id in ['abc', '1-0', '', ' 0']:
+            self.assertEqual(self.first_event(last_id), ": keep-alive\n\n")
+
+
+@override_settings(NOTIFICATION_SINK={'SYNCHRONOUS': True})
+class FailedTaskTests(TestCase):
+
+    def setUp(self):
+        for getter in (get_broker, get_sink, get_lease_backend):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+
+    def exhausted_task(self, name="task"):
+        task = ScheduledTask.objects.create(name=name, schedule_type='INTERVAL', interval_seconds=60, max_retries=0)
+        sync_periodic_task(task)
+        with mock.patch('scheduler.tasks.execute_task_logic', side_effect=Exception("boom")):
+            execute_scheduled_task.apply(args=[task.id])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.is_active), ('FAILED', False))
+        self.assertFalse(PeriodicTask.objects.get(name=periodic_task_name(task.id)).enabled)
+        return task
+
+    def test_exhausted_task_resumes_and_runs_again(self):
+        task = self.exhausted_task()
+        self.assertTrue(self.client.get(f'/api/tasks/{task.id}/').json()['can_be_resumed'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/api/tasks/{task.id}/resume/').status_code, 200)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.is_active), ('ACTIVE', True))
+        self.assertIsNotNone(task.next_execution)
+        self.assertTrue(PeriodicTask.objects.get(name=periodic_task_name(task.id)).enabled)
+
+        with mock.patch('scheduler.tasks.execute_task_logic'):
+            self.assertEqual(execute_scheduled_task.apply(args=[task.id]).get()['status'], 'success')
+        task.refresh_from_db()
+        self.assertEqual(task.total_executions, 2)
+        self.assertEqual(task.execution_logs.latest('id').status, 'SUCCESS')
+
+    def test_exhausted_task_can_be_edited_and_deleted(self):
+        task = self.exhausted_task()
+        response = self.client.patch(
+            f'/api/tasks/{task.id}/', {'interval_seconds': 120}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/tasks/{task.id}/').status_code, 200)
+        self.assertFalse(ScheduledTask.objects.filter(id=task.id).exists())
+
+    def test_bulk_resume_and_delete(self):
+        resumed, deleted = self.exhausted_task("resumed"), self.exhausted_task("deleted")
+        once = ScheduledTask.objects.create(
+            name="once", schedule_type='ONE_TIME', scheduled_time=timezone.now(), status='FAILED',
+            is_active=False, executed_once=True
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/tasks/resume_all/?search=resumed')
+        resumed.refresh_from_db()
+        self.assertEqual(resumed.status, 'ACTIVE')
+        self.assertTrue(PeriodicTask.objects.get(name=periodic_task_name(resumed.id)).enabled)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/tasks/delete_all/?status=FAILED')
+            self.client.post('/api/tasks/resume_all/?status=FAILED')
+        self.assertEqual(list(ScheduledTask.objects.order_by('id').values_list('name', flat=True)), ["resumed", "once"])
+        once.refresh_from_db()
+        self.assertEqual(once.status, 'FAILED')
+
+
+@override_settings(
+    NOTIFICATION_SINK={'SYNCHRONOUS': True},
+    RECOVERY={'CHUNK_SIZE': 2, 'CLAIM_TTL': 900, 'STUCK_GRACE': 300},
+)
+class RecoveryScanTests(TestCase):
+
+    def setUp(self):
+        for getter in (get_broker, get_sink):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+        dispatch = mock.patch('scheduler.tasks.dispatch_executions')
+        self.dispatch = dispatch.start()
+        self.addCleanup(dispatch.stop)
+
+    def overdue_task(self, name="overdue", **fields):
+        past = timezone.now() - timedelta(hours=1)
+        return ScheduledTask.objects.create(
+            name=name, schedule_type='ONE_TIME', scheduled_time=past, next_execution=past, **fields
+        )
+
+    def stuck_task(self, name="stuck"):
+        return ScheduledTask.objects.create(
+            name=name, schedule_type='INTERVAL', interval_seconds=60,
+            next_execution=timezone.now() - timedelta(hours=1),
+        )
+
+    def dispatched_ids(self):
+        return [task_id for call in self.dispatch.call_args_list for task_id, _ in call.args[0]]
+
+    def test_back_to_back_scans_claim_once(self):
+        tasks = [self.overdue_task(f"overdue {index}") for index in range(3)]
+
+        self.assertEqual(recovery_scan()['recovered_tasks'], 3)
+        self.assertEqual(recovery_scan()['recovered_tasks'], 0)
+        self.assertCountEqual(self.dispatched_ids(), [task.id for task in tasks])
+        self.assertEqual(ScheduledTask.objects.filter(status='PENDING').count(), 3)
+        self.assertEqual(Notification.objects.filter(category='RECOVERY').count(), 3)
+
+    def test_claim_is_not_taken_twice(self):
+        task = self.overdue_task()
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=900)
+
+        self.assertEqual([claimed.id for claimed in _claim_overdue([task.id], now, stale_before)], [task.id])
+        later = now + timedelta(seconds=1)
+        self.assertEqual(_claim_overdue([task.id], later, later - timedelta(seconds=900)), [])
+
+    def test_stale_claim_is_reclaimed_after_ttl(self):
+        stale = self.overdue_task("stale")
+        fresh = self.overdue_task("fresh")
+        now = timezone.now()
+        ScheduledTask.objects.filter(pk=stale.pk).update(status='PENDING', updated_at=now - timedelta(seconds=901))
+        ScheduledTask.objects.filter(pk=fresh.pk).update(status='PENDING', updated_at=now - timedelta(seconds=60))
+
+        self.assertEqual(recovery_scan()['recovered_tasks'], 1)
+        self.assertEqual(self.dispatched_ids(), [stale.id])
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'PENDING')
+        self.assertGreater(stale.updated_at, now - timedelta(seconds=60))
+
+    def test_missing_or_disabled_schedules_are_rebuilt(self):
+        missing = self.stuck_task("missing")
+        disabled = self.stuck_task("disabled")
+        sync_periodic_task(disabled)
+        PeriodicTask.objects.filter(name=periodic_task_name(disabled.id)).update(enabled=False)
+        healthy = self.stuck_task("healthy")
+        sync_periodic_task(healthy)
+
+        result = recovery_scan()
+        self.assertEqual((result['stuck_tasks'], result['rebuilt_schedules']), (3, 2))
+        for task in (missing, disabled, healthy):
+            self.assertTrue(PeriodicTask.objects.get(name=periodic_task_name(task.id)).enabled)
+
+    def test_result_counts_and_timings(self):
+        ScheduledTask.objects.create(name="unscheduled", schedule_type='INTERVAL', interval_seconds=60)
+        self.overdue_task()
+        self.stuck_task()
+
+        result = recovery_scan()
+        self.assertEqual(
+            {key: value for key, value in result.items() if key != 'timings'},
+            {'backfilled_tasks': 1, 'recovered_tasks': 1, 'stuck_tasks': 1, 'rebuilt_schedules': 1},
+        )
+        self.assertEqual(set(result['timings']), {'backfill_seconds', 'overdue_seconds', 'stuck_seconds'})
+        self.assertTrue(all(seconds >= 0 for seconds in result['timings'].values()))
+        self.assertIsNotNone(ScheduledTask.objects.get(name="unscheduled").next_execution)
+
+
+class RoutingTests(SimpleTestCase):
+
+    def test_executions_are_routed_by_priority(self):
+        for name in ['scheduler.tasks.execute_scheduled_task', 'scheduler.tasks.execute_scheduled_tasks']:
+            for priority, queue in [
+                ('HIGH', 'executions.high'), ('MEDIUM', 'celery'), ('LOW', 'executions.bulk'), (None, 'celery'),
+            ]:
+                with self.subTest(name=name, priority=priority):
+                    self.assertEqual(route_task(name, [1], {'priority': priority}, {}), {'queue': queue})
+        self.assertEqual(route_task('scheduler.tasks.execute_scheduled_task', [1], None, {}), {'queue': 'celery'})
+
+    def test_other_tasks_go_to_the_maintenance_queue(self):
+        self.assertEqual(route_task('scheduler.tasks.recovery_scan', [], {}, {}), {'queue': 'maintenance'})
+        self.assertEqual(route_task('scheduler.tasks.apply_retention', [], {}, {}), {'queue': 'maintenance'})
+        self.assertIsNone(route_task('celery.backend_cleanup', [], {}, {}))
+
+    def test_sent_executions_use_the_routed_queue(self):
+        route = app.amqp.router.route({}, 'scheduler.tasks.execute_scheduled_task', [1], {'priority': 'HIGH'})
+        self.assertEqual(route['queue'].name, 'executions.high')
+
+
+class ScheduleTests(TestCase):
+
+    def test_orphans_are_deleted_in_one_statement(self):
+        task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+        sync_periodic_task(task)
+        orphans = IntervalSchedule.objects.bulk_create([
+            IntervalSchedule(every=every, period=IntervalSchedule.SECONDS) for every in (7, 11, 13)
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted = collect_orphan_schedules()
+        self.assertEqual(deleted['IntervalSchedule'], len(orphans))
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 1)
+        self.assertFalse(IntervalSchedule.objects.filter(pk__in=[orphan.pk for orphan in orphans]).exists())
+        self.assertTrue(IntervalSchedule.objects.filter(periodictask__name__isnull=False).exists())
+
+
+class CronTests(SimpleTestCase):
+    """
+    ``celery.schedules.crontab`` is what beat evaluates, so it is the
+    reference for which minutes an expression matches.
+    """
+
+    FIELDS = ['cron_minute', 'cron_hour', 'cron_day_of_week', 'cron_day_of_month', 'cron_month_of_year']
+    FIXED = [
+        ('*', '*', '*', '*', '*'),
+        ('0', '9', '*', '*', '*'),
+        ('*/15', '*', '*', '*', '*'),
+        ('30', '2', '1-5', '*', '*'),
+        ('0', '0', '*', '13', '*'),
+        ('0', '0', 'fri', '13', '*'),
+        ('0', '12', 'fri-mon', '*', '*'),
+        ('5', '22-2/2', '*', '*', '*'),
+        ('0', '0', '*', '1', 'nov-feb'),
+        ('0', '0', '*', '29', '2'),
+        ('10-50/20', '*/5', 'sat,sun', '1-7', '*'),
+    ]
+
+    def _crontab(self, fields, zone, now):
+        app = Celery(set_as_current=False)
+        app.conf.timezone = zone
+        return crontab(*fields, nowfun=lambda: now.astimezone(app.timezone), app=app)
+
+    def _celery_next(self, fields, after, zone):
+        local = after.astimezone(ZoneInfo(zone))
+        last_run_at, delta, now = self._crontab(fields, zone, after).remaining_delta(local)
+        return now + remaining(last_run_at, delta, now)
+
+    def _random_field(self, rng, first, last):
+        kind = rng.randrange(4)
+        if kind == 0:
+            return '*'
+        if kind == 1:
+            return f'*/{rng.randint(2, (last - first) // 2 + 1)}'
+        if kind == 2:
+            return f'{rng.randint(first, last)}-{rng.randint(first, last)}/{rng.randint(1, 3)}'
+        return ','.join(str(rng.randint(first, last)) for _ in range(rng.randint(1, 3)))
+
+    def _random_cases(self, count):
+        rng = random.Random(10)
+        start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        for _ in range(count):
+            fields = (
+                self._random_field(rng, 0, 59),
+                self._random_field(rng, 0, 23),
+                self._random_field(rng, 0, 6),
+                self._random_field(rng, 1, 31) if rng.random() < 0.3 else '*',
+                self._random_field(rng, 1, 12) if rng.random() < 0.3 else '*',
+            )
+            yield fields, start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+
+    def assertMatchesCelery(self, fields, after, zone):
+        tz = ZoneInfo(zone)
+        found = compile_cron(*fields).next_after(after, tz)
+        self.assertGreater(found, after)
+        local = found.astimezone(tz)
+        schedule = self._crontab(fields, zone, after)
+        self.assertIn(local.minute, schedule.minute)
+        self.assertIn(local.hour, schedule.hour)
+        self.assertIn(local.isoweekday() % 7, schedule.day_of_week)
+        self.assertIn(local.day, schedule.day_of_month)
+        self.assertIn(local.month, schedule.month_of_year)
+        # Celery's estimate adds a wall-clock delta at the starting UTC
+        # offset, so it is an hour out across a DST change; the DST tests
+        # below pin those cases instead.
+        if local.utcoffset() == after.astimezone(tz).utcoffset():
+            self.assertEqual(found, self._celery_next(fields, after, zone))
+
+    def test_fields_match_celery(self):
+        for fields in self.FIXED:
+            schedule = crontab(*fields)
+            allowed = [
+                schedule.minute, schedule.hour, schedule.day_of_week, schedule.day_of_month, schedule.month_of_year
+            ]
+            for expression, field, values in zip(fields, self.FIELDS, allowed):
+                with self.subTest(field=field, expression=expression):
+                    self.assertEqual(parse_field(expression, field), sum(1 << value for value in values))
+
+    def test_fixed_expressions_match_celery(self):
+        after = datetime(2026, 1, 30, 23, 59, 30, tzinfo=dt_timezone.utc)
+        for zone in ['UTC', 'Europe/Berlin']:
+            for fields in self.FIXED:
+                with self.subTest(zone=zone, fields=fields):
+                    self.assertMatchesCelery(fields, after, zone)
+
+    def test_random_expressions_match_celery(self):
+        for zone in ['UTC', 'America/New_York', 'Europe/Berlin']:
+            for fields, after in self._random_cases(300):
+                with self.subTest(zone=zone, fields=fields, after=after):
+                    self.assertMatchesCelery(fields, after, zone)
+
+    def test_wall_clock_survives_dst_changes(self):
+        tz = ZoneInfo('America/New_York')
+        daily = compile_cron('0', '9')
+        # 2026-03-08 and 2026-11-01 are the spring-forward and fall-back days.
+        self.assertEqual(
+            daily.next_after(datetime(2026, 3, 7, 14, 0, tzinfo=dt_timezone.utc), tz),
+            datetime(2026, 3, 8, 9, 0, tzinfo=tz),
+        )
+        self.assertEqual(
+            daily.next_after(datetime(2026, 10, 31, 13, 0, tzinfo=dt_timezone.utc), tz),
+            datetime(2026, 11, 1, 9, 0, tzinfo=tz),
+        )
+
+    def test_skipped_and_repeated_times_fire_once(self):
+        tz = ZoneInfo('America/New_York')
+        # 02:30 does not exist on the spring-forward day; it runs at the
+        # same instant as 03:30 EDT rather than being skipped. Times in a
+        # gap or fold never compare equal across zones, hence astimezone().
+        skipped = compile_cron('30', '2')
+        found = skipped.next_after(datetime(2026, 3, 8, 5, 0, tzinfo=dt_timezone.utc), tz)
+        self.assertEqual(found.astimezone(dt_timezone.utc), datetime(2026, 3, 8, 7, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(skipped.next_after(found, tz), datetime(2026, 3, 9, 2, 30, tzinfo=tz))
+
+        # 01:30 happens twice on the fall-back day; only the first one runs.
+        repeated = compile_cron('30', '1')
+        found = repeated.next_after(datetime(2026, 11, 1, 4, 0, tzinfo=dt_timezone.utc), tz)
+        self.assertEqual(found.astimezone(dt_timezone.utc), datetime(2026, 11, 1, 5, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(repeated.next_after(found, tz), datetime(2026, 11, 2, 1, 30, tzinfo=tz))
+
+    def test_day_of_month_and_day_of_week_must_both_match(self):
+        friday_13th = compile_cron('0', '0', 'fri', '13')
+        after = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        found = friday_13th.next_after(after, dt_timezone.utc)
+        self.assertEqual(found, datetime(2026, 2, 13, tzinfo=dt_timezone.utc))
+        self.assertEqual(friday_13th.next_after(found, dt_timezone.utc), datetime(2026, 3, 13, tzinfo=dt_timezone.utc))
+        self.assertIsNone(compile_cron('0', '0', '*', '30', 'feb').next_after(after, dt_timezone.utc))
+
+    def test_wrap_around_ranges(self):
+        self.assertEqual(parse_field('fri-mon', 'cron_day_of_week'), 0b1100011)
+        self.assertEqual(parse_field('nov-feb', 'cron_month_of_year'), 0b1100000000110)
+        self.assertEqual(parse_field('22-2/2', 'cron_hour'), 1 << 22 | 1 << 0 | 1 << 2)
+
+    def test_invalid_fields(self):
+        cases = [
+            ('cron_minute', '60', "60 is out of range 0-59."),
+            ('cron_hour', '1-24', "24 is out of range 0-23."),
+            ('cron_day_of_month', '0', "0 is out of range 1-31."),
+            ('cron_day_of_week', 'funday', "'funday' is not a valid value."),
+            ('cron_month_of_year', 'jan-', "'' is not a valid value."),
+            ('cron_minute', '*/0', "'0' is not a valid step."),
+            ('cron_minute', '*/x', "'x' is not a valid step."),
+            ('cron_minute', '5/15', "'5/15' needs a range or '*' before the step."),
+            ('cron_hour', '1,,2', "'1,,2' has an empty list item."),
+        ]
+        for field, expression, message in cases:
+            with self.subTest(field=field, expression=expression):
+                with self.assertRaisesMessage(CronError, message) as caught:
+                    parse_field(expression, field)
+                self.assertEqual(caught.exception.field, field)
+
+
+class HeapSchedulerTests(TestCase):
+
+    def test_changes_past_the_watermark_are_applied_later(self):
+        scheduler = OfflineHeapScheduler(app=app)
+        task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+        TaskChange.objects.create(task_id=task.id)
+
+        # As if a transaction holding a lower change id had not committed.
+        with mock.patch('scheduler.changes.change_watermark', return_value=scheduler._last_change_id):
+            self.assertEqual(scheduler.apply_changes(), 0)
+        self.assertNotIn(task.id, scheduler._next_run)
+
+        self.assertEqual(scheduler.apply_changes(), 1)
+        self.assertIn(task.id, scheduler._next_run)
+
+    @override_settings(TASK_EXECUTION={
+        'HANDLER': 'scheduler.handlers.SimulatedWork', 'MODE': 'async', 'ASYNC_CONCURRENCY': 2, 'ASYNC_BATCH_SIZE': 2,
+    })
+    def test_due_tasks_are_sent_in_batches(self):
+        due = timezone.now() - timedelta(minutes=1)
+        tasks = [
+            ScheduledTask.objects.create(name=f"task {index}", schedule_type='ONE_TIME', scheduled_time=due,
+                                         priority=priority)
+            for index, priority in enumerate(['HIGH', 'HIGH', 'HIGH', 'LOW'])
+        ]
+        scheduler = HeapScheduler(app=app)
+
+        with mock.patch('scheduler.tasks.group') as group:
+            self.assertEqual(scheduler.fire_due(), 4)
+        batches = sorted((signature.kwargs['priority'], signature.args[0]) for signature in group.call_args.args[0])
+        ids = [task.id for task in tasks]
+        self.assertEqual(batches, [('HIGH', ids[:2]), ('HIGH', ids[2:3]), ('LOW', ids[3:])])
+
+    def test_purged_changes_reload_the_heap(self):
+        scheduler = OfflineHeapScheduler(app=app)
+        task = ScheduledTask.objects.create(name="task", schedule_type='INTERVAL', interval_seconds=60)
+        TaskChange.objects.create(task_id=task.id)
+        TaskChange.objects.update(changed_at=timezone.now() - timedelta(days=30))
+        purge_task_changes()
+
+        scheduler.apply_changes()
+        self.assertIn(task.id, scheduler._next_run)
+
+
+# Reads, then writes, in one transaction: the pattern that fails with
+# "database is locked" under deferred transactions.
+WRITER = """
+from django.db import connection, transaction
+for _ in range({writes}):
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT value FROM counter")
+            (value,) = cursor.fetchone()
+            cursor.execute("UPDATE counter SET value = %s", [value + 1])
+            cursor.execute("INSERT INTO writes (worker) VALUES (%s)", [{worker}])
+"""
+
+
+class ConcurrentWriterTests(SimpleTestCase):
+
+    def test_writer_processes_do_not_lock_each_other_out(self):
+        workers, writes = 6, 50
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'db.sqlite3'
+            with sqlite3.connect(path) as db:
+                db.execute("CREATE TABLE counter (value INTEGER)")
+                db.execute("CREATE TABLE writes (worker INTEGER)")
+                db.execute("INSERT INTO counter VALUES (0)")
+
+            env = {**os.environ, 'DATABASE_URL': f"sqlite:///{path}"}
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'shell', '-c',
+                     WRITER.format(writes=writes, worker=worker)],
+                    env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+                )
+                for worker in range(workers)
+            ]
+            for process in processes:
+                _, stderr = process.communicate(timeout=60)
+                self.assertEqual(process.returncode, 0, stderr)
+
+            with sqlite3.connect(path) as db:
+                self.assertEqual(db.execute("PRAGMA journal_mode").fetchone(), ('wal',))
+                self.assertEqual(db.execute("SELECT value FROM counter").fetchone(), (workers * writes,))
+                self.assertEqual(
+                    db.execute("SELECT worker, COUNT(*) FROM writes GROUP BY worker ORDER BY worker").fetchall(),
+                    [(worker, writes) for worker in range(workers)]
+                )
@@ -3,7 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ScheduledTaskViewSet,
     ExecutionLogViewSet,
-    NotificationViewSet
+    NotificationViewSet,
+    notification_stream,
+    stats
 )
 
 router = DefaultRouter()
@@ -12,5 +14,7 @@ router.register(r'logs', ExecutionLogViewSet, basename='log')
 router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
+    path('notifications/stream/', notification_stream, name='notification-stream'),
+    path('stats/', stats, name='stats'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,32 +1,155 @@
 
-from rest_framework import viewsets, status, filters
+import json
+from asgiref.sync import sync_to_async
+from rest_framework import viewsets, status, filters, serializers
 from rest_framework.response import Response
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
 from django_filters.rest_framework import DjangoFilterBackend
-from django_celery_beat.models import PeriodicTask
+from django_celery_beat.models import PeriodicTasks
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
+from . import bulk as bulk_actions, counters
+from .caching import bump_version, versioned
+from .changes import CursorExpired, read_changes, record_notification_changes_in, record_task_change
+from .events import get_broker, publish_task_status
 from .filters import NotificationFilter, ScheduledTaskFilter
-from .models import ScheduledTask, ExecutionLog, Notification
+from .models import LAST_ACTIVITY, ScheduledTask, ExecutionLog, Notification, NotificationChange, TaskChange
+from .notifications import notify
+from .pagination import positive_int
+from .schedules import periodic_task_queryset, sync_periodic_task
+from .search import FullTextSearchFilter, SearchOrderingFilter
+from .stats import execution_stats
 from .serializers import (
     ScheduledTaskSerializer,
     ExecutionLogSerializer,
-    NotificationSerializer
+    NotificationSerializer,
+    StatsQuerySerializer
 )
 
-class ScheduledTaskViewSet(viewsets.ModelViewSet):
-    queryset = ScheduledTask.objects.all().prefetch_related('execution_logs')
+class ChangesMixin:
+    """
+    ``GET <collection>/changes/?since=<cursor>``: the rows created, updated
+    or deleted after ``cursor``, read from a change log rather than the
+    table. Without ``since`` it only returns the current cursor, which a
+    client should take *before* loading the full list.
+    """
+    change_model = None
+    change_field = None
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        try:
+            since = request.query_params.get('since')
+            since = int(since) if since is not None else None
+            if since is not None and since < 0:
+                raise ValueError(since)
+            limit = positive_int(
+                request.query_params.get('limit', settings.REST_FRAMEWORK['PAGE_SIZE']),
+                settings.PAGINATION_MAX_PAGE_SIZE
+            )
+        except ValueError:
+            raise serializers.ValidationError({"detail": "since and limit must be non-negative integers."})
+
+        try:
+            page = read_changes(self.change_model, self.change_field, since, limit)
+        except CursorExpired:
+            return Response(
+                {"detail": "This cursor is too old; reload the full list."},
+                status=status.HTTP_410_GONE
+            )
+
+        rows = self.get_queryset().filter(id__in=page.upserted).order_by('id')
+        return Response({
+            'cursor': page.cursor,
+            'has_more': page.has_more,
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': page.deleted,
+        })
+
+
+class ScheduledTaskViewSet(ChangesMixin, viewsets.ModelViewSet):
+    queryset = ScheduledTask.objects.all()
     serializer_class = ScheduledTaskSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, SearchOrderingFilter]
     
     filterset_class = ScheduledTaskFilter
     
+    search_indexes = [('tasks', 'id')]
     search_fields = ['name', 'description']
     ordering_fields = ['created_at', 'scheduled_time', 'name', 'total_executions', 'status']
     ordering = ['-created_at']
 
+    change_model = TaskChange
+    change_field = 'task_id'
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset
+
+        # A sliced Prefetch is evaluated as one ROW_NUMBER() window query, so
+        # a page costs a fixed number of queries and holds at most
+        # page_size * limit log rows.
+        recent_logs = ExecutionLog.objects.order_by('-executed_at', '-id')[:self.get_recent_logs_limit()]
+        return queryset.prefetch_related(
+            Prefetch('execution_logs', queryset=recent_logs, to_attr='recent_execution_logs')
+        )
+
+    @versioned('tasks')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_recent_logs_limit(self):
+        try:
+            limit = int(self.request.query_params.get('recent_logs', settings.RECENT_LOGS_LIMIT))
+        except (TypeError, ValueError):
+            limit = settings.RECENT_LOGS_LIMIT
+        return max(0, min(limit, settings.RECENT_LOGS_MAX_LIMIT))
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.BULK_TASKS['MAX_ITEMS']
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def get_bulk_queryset(self):
+        # Collection actions take the list filters from the query string;
+        # refuse to act on the whole table when none are given.
+        if not any(self.request.query_params.get(name) for name in self.get_bulk_filter_params()):
+            raise serializers.ValidationError({
+                "detail": "Provide at least one filter to select the tasks to change."
+            })
+        return self.filter_queryset(ScheduledTask.objects.all())
+
+    def get_bulk_filter_params(self):
+        return [*ScheduledTaskFilter.base_filters, filters.SearchFilter.search_param]
+
+    @action(detail=False, methods=['post'])
+    def pause_all(self, request):
+        paused = bulk_actions.pause_tasks(self.get_bulk_queryset())
+        return Response({'detail': f"{paused} tasks paused."})
+
+    @action(detail=False, methods=['post'])
+    def resume_all(self, request):
+        resumed = bulk_actions.resume_tasks(self.get_bulk_queryset())
+        return Response({'detail': f"{resumed} tasks resumed."})
+
+    @action(detail=False, methods=['post'])
+    def execute_all(self, request):
+        queued = bulk_actions.execute_tasks(self.get_bulk_queryset())
+        return Response({'detail': f"{queued} task executions triggered."})
+
+    @action(detail=False, methods=['post'])
+    def delete_all(self, request):
+        deleted = bulk_actions.delete_tasks(self.get_bulk_queryset())
+        return Response({'detail': f"{deleted} tasks deleted."})
 
     @action(detail=True, methods=['post'])
     def pause(self, request, pk=None):
@@ -34,11 +157,16 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
         if task.status == 'ACTIVE':
             task.status = 'PAUSED'
             task.is_active = False
+            task.next_execution = task.compute_next_execution()
             task.save()
+            record_task_change(task.id)
             
-            PeriodicTask.objects.filter(name=f"scheduled-task-{task.id}").update(enabled=False)
+            periodic_task_queryset(task).update(enabled=False)
+            PeriodicTasks.update_changed()
             
-            Notification.objects.create(
+            publish_task_status(task)
+
+            notify(
                 title=f"Task Paused: {task.name}",
                 message=f"Scheduled task '{task.name}' has been paused.",
                 category='SYSTEM',
@@ -52,14 +180,21 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def resume(self, request, pk=None):
         task = self.get_object()
-        if task.status == 'PAUSED':
+        if task.can_be_resumed():
             task.status = 'ACTIVE'
             task.is_active = True
+            task.next_execution = task.compute_next_execution()
             task.save()
+            record_task_change(task.id)
             
-            PeriodicTask.objects.filter(name=f"scheduled-task-{task.id}").update(enabled=True)
+            # Rebuilt rather than just enabled: a failed task's PeriodicTask
+            # may be missing or stale.
+            sync_periodic_task(task)
+            PeriodicTasks.update_changed()
             
-            Notification.objects.create(
+            publish_task_status(task)
+
+            notify(
                 title=f"Task Resumed: {task.name}",
                 message=f"Scheduled task '{task.name}' has been resumed.",
                 category='SYSTEM',
@@ -74,7 +209,7 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
     def execute_now(self, request, pk=None):
         task = self.get_object()
         from .tasks import execute_scheduled_task
-        execute_scheduled_task.delay(task.id)
+        execute_scheduled_task.delay(task.id, priority=task.priority)
         
         return Response({'detail': 'Task execution triggered.'})
 
@@ -85,6 +220,23 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
         serializer = ExecutionLogSerializer(logs, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    @versioned('tasks')
+    def status_counts(self, request):
+        # Lists are paginated without a count, so the dashboard's totals
+        # come from here: one GROUP BY, cached until a task changes.
+        by_status = dict(
+            ScheduledTask.objects.order_by().values_list('status').annotate(count=Count('id'))
+        )
+        return Response({'total': sum(by_status.values()), 'by_status': by_status})
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        task = self.get_object()
+        query = StatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(execution_stats(task_id=task.id, **query.validated_data))
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         
@@ -95,15 +247,17 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
             )
 
         with transaction.atomic():
-            PeriodicTask.objects.filter(name=f"scheduled-task-{instance.id}").delete()
+            periodic_task_queryset(instance).delete()
             
-            Notification.objects.create(
+            notify(
                 title=f"Task Deleted: {instance.name}",
                 message=f"Scheduled task '{instance.name}' has been deleted.",
                 category='SYSTEM',
                 priority='LOW'
             )
+            publish_task_status(instance, deleted=True)
             
+            record_task_change(instance.id, deleted=True)
             instance.delete()
 
         return Response(
@@ -114,51 +268,117 @@ class ScheduledTaskViewSet(viewsets.ModelViewSet):
 class ExecutionLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ExecutionLog.objects.all().select_related('task')
     serializer_class = ExecutionLogSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['task', 'status']
+    search_indexes = [('logs', 'id'), ('tasks', 'task_id')]
     search_fields = ['task__name', 'message']
     ordering_fields = ['-executed_at']
     ordering = ['-executed_at']
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(ChangesMixin, viewsets.ModelViewSet):
     
-    queryset = Notification.objects.all().select_related('task')
+    queryset = Notification.objects.annotate(last_activity=LAST_ACTIVITY).select_related('task')
     serializer_class = NotificationSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, SearchOrderingFilter]
     
     filterset_class = NotificationFilter
 
     
+    search_indexes = [('notifications', 'id')]
     search_fields = ['title', 'message']
-    ordering_fields = ['created_at', 'priority', 'is_read']
-    ordering = ['-created_at']
+    ordering_fields = ['last_activity', 'created_at', 'priority', 'is_read']
+    ordering = ['-last_activity']
+
+    change_model = NotificationChange
+    change_field = 'notification_id'
+
+    @versioned('notifications', 'tasks')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         instance = self.get_object()
-        instance.is_read = True
-        instance.save(update_fields=['is_read'])
+        instance.mark_as_read()
         return Response({"detail": "Notification marked as read."})
 
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
-        updated = self.get_queryset().filter(is_read=False).update(is_read=True)
+        updated = counters.mark_all_read(self.get_queryset())
         return Response({"detail": f"{updated} notifications marked as read."})
 
     @action(detail=False, methods=['get'])
+    @versioned('notifications')
     def unread_count(self, request):
-        count = self.get_queryset().filter(is_read=False).count()
-        return Response({"unread_count": count})
+        return Response(counters.unread_breakdown())
 
     @action(detail=False, methods=['post'])
     def archive_all_read(self, request):
-        updated = self.get_queryset().filter(is_read=True, is_archived=False).update(is_archived=True)
+        with transaction.atomic():
+            archivable = self.get_queryset().filter(is_read=True, is_archived=False)
+            record_notification_changes_in(archivable)
+            updated = archivable.update(is_archived=True)
+        bump_version('notifications')
         return Response({"detail": f"{updated} notifications archived."})
 
     def partial_update(self, request, *args, **kwargs):
         instance = self.get_object()
         is_read = request.data.get('is_read', True)
-        instance.is_read = is_read
-        instance.save(update_fields=['is_read'])
+        counters.set_read(instance, serializers.BooleanField().to_internal_value(is_read))
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            counters.record_created(serializer.save())
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = Notification.objects.select_for_update().get(pk=serializer.instance.pk)
+            counters.record_updated(previous, serializer.save())
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            counters.record_deleted(instance)
+            instance.delete()
+
+
+@api_view(['GET'])
+def stats(request):
+    """Fleet-wide execution statistics; same parameters as /api/tasks/{id}/stats/."""
+    query = StatsQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    return Response(execution_stats(**query.validated_data))
+
+
+async def notification_stream(request):
+    """
+    Server-Sent Events feed of new notifications and task status changes.
+
+    Browsers reconnect automatically and send the last event id they saw in
+    the ``Last-Event-ID`` header; ``?last_event_id=`` does the same for
+    clients that cannot set headers. An id the broker could not have issued
+    starts the stream from now. Needs an ASGI server so an open stream does
+    not tie up a worker thread.
+    """
+    broker = get_broker()
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if not last_id or not broker.is_valid_id(last_id):
+        last_id = await sync_to_async(broker.latest_id, thread_sensitive=False)()
+
+    async def events(last_id):
+        yield f"retry: {settings.NOTIFICATION_STREAM['RETRY_MS']}\n\n"
+        while True:
+            batch = await broker.aread(last_id, settings.NOTIFICATION_STREAM['HEARTBEAT'])
+            if not batch:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, event in batch:
+                last_id = event_id
+                data = json.dumps(event, cls=DjangoJSONEncoder)
+                yield f"id: {event_id}\nevent: {event['type']}\ndata: {data}\n\n"
+
+    response = StreamingHttpResponse(events(last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
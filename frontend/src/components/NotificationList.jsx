@@ -19,8 +19,14 @@ import {
   Info
 } from "lucide-react";
 
+// Events arriving within this long of each other share one refetch.
+const REFETCH_DELAY_MS = 500;
+// While the event stream is down, poll this often instead.
+const POLL_INTERVAL_MS = 15000;
+
 export default function NotificationList({ onStatsUpdate }) {
   const [notifications, setNotifications] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [unreadCount, setUnreadCount] = useState(0);
   const [loading, setLoading] = useState(true);
   const [filter, setFilter] = useState("UNREAD");
@@ -28,28 +34,36 @@ export default function NotificationList({ onStatsUpdate }) {
 
   const fetchNotifications = async () => {
     try {
-      let url = "notifications/?ordering=-created_at";
+      let url = "notifications/?ordering=-last_activity";
       if (filter === "UNREAD") {
         url += "&is_read=false";
       }
       const res = await api.get(url);
-      setNotifications(res.data);
-      
-      if (onStatsUpdate) {
-        onStatsUpdate({ notifications: res.data.length });
-      }
+      setNotifications(res.data.results ?? res.data);
+      setNextPage(res.data.next ?? null);
     } catch (err) {
       console.error("Failed to fetch notifications:", err);
     }
   };
 
+  const loadMore = async () => {
+    try {
+      // `next` is an absolute URL carrying the keyset cursor.
+      const res = await api.get(nextPage);
+      setNotifications(prev => [...prev, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      console.error("Failed to fetch more notifications:", err);
+    }
+  };
+
   const fetchUnreadCount = async () => {
     try {
       const res = await api.get("notifications/unread_count/");
       setUnreadCount(res.data.unread_count);
       
       if (onStatsUpdate) {
-        onStatsUpdate({ unreadCount: res.data.unread_count });
+        onStatsUpdate({ unreadNotifications: res.data.unread_count });
       }
     } catch (err) {
       console.error("Failed to fetch unread count:", err);
@@ -65,12 +79,40 @@ export default function NotificationList({ onStatsUpdate }) {
     
     loadData();
     
-    const interval = setInterval(() => {
+    const refresh = () => {
       fetchNotifications();
       fetchUnreadCount();
-    }, 5000);
+    };
+
+    // EventSource reconnects on its own and resumes from the last event id.
+    // A burst of events (a bulk action, the backlog replayed on reconnect)
+    // costs one refetch rather than two requests per event.
+    const stream = new EventSource(`${api.defaults.baseURL}notifications/stream/`);
+    let refetch = null;
+    stream.addEventListener("notification", () => {
+      if (refetch) return;
+      refetch = setTimeout(() => {
+        refetch = null;
+        refresh();
+      }, REFETCH_DELAY_MS);
+    });
+
+    // Until the stream is (re)connected, e.g. behind a server that cannot
+    // hold it open, fall back to polling.
+    let poll = null;
+    stream.addEventListener("error", () => {
+      if (!poll) poll = setInterval(refresh, POLL_INTERVAL_MS);
+    });
+    stream.addEventListener("open", () => {
+      clearInterval(poll);
+      poll = null;
+    });
     
-    return () => clearInterval(interval);
+    return () => {
+      clearTimeout(refetch);
+      clearInterval(poll);
+      stream.close();
+    };
   }, [filter]);
 
   const markAsRead = async (notificationId) => {
@@ -266,7 +308,7 @@ export default function NotificationList({ onStatsUpdate }) {
                         </div>
                         <div className="flex items-center text-xs text-gray-500">
                           <Clock className="w-3.5 h-3.5 mr-1" />
-                          {formatTimeAgo(notification.created_at)}
+                          {formatTimeAgo(notification.last_occurred_at ?? notification.created_at)}
                         </div>
                       </div>
                       
@@ -315,6 +357,14 @@ export default function NotificationList({ onStatsUpdate }) {
             <span className="text-xs text-gray-500">
               Showing {notifications.length} {filter === "UNREAD" ? 'unread' : ''} notifications
             </span>
+            {nextPage && (
+              <button
+                onClick={loadMore}
+                className="text-xs text-purple-400 hover:text-purple-300 transition-colors"
+              >
+                Load more
+              </button>
+            )}
             <button
               onClick={() => setFilter("ALL")}
               className="text-xs text-purple-400 hover:text-purple-300 transition-colors flex items-center"
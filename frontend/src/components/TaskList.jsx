@@ -24,7 +24,9 @@ import {
 
 export default function TaskList({ refreshTrigger, onStatsUpdate }) {
   const [tasks, setTasks] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedTask, setSelectedTask] = useState(null);
   const [filter, setFilter] = useState("ALL");
   const [searchTerm, setSearchTerm] = useState("");
@@ -38,7 +40,8 @@ export default function TaskList({ refreshTrigger, onStatsUpdate }) {
         url += `?status=${filter}`;
       }
       const res = await api.get(url);
-      setTasks(res.data);
+      setTasks(res.data.results ?? res.data);
+      setNextPage(res.data.next ?? null);
       
       if (onStatsUpdate) {
         onStatsUpdate();
@@ -54,6 +57,20 @@ export default function TaskList({ refreshTrigger, onStatsUpdate }) {
     fetchTasks();
   }, [filter, refreshTrigger]);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      // `next` is an absolute URL carrying the keyset cursor.
+      const res = await api.get(nextPage);
+      setTasks(prev => [...prev, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      console.error("Failed to fetch more tasks:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async (taskId, taskName) => {
     if (!window.confirm(`Are you sure you want to delete "${taskName}"?`)) {
       return;
@@ -150,7 +167,7 @@ export default function TaskList({ refreshTrigger, onStatsUpdate }) {
               <h2 className="text-xl sm:text-2xl font-bold text-white flex items-center">
                 Scheduled Tasks
                 <span className="ml-3 px-2.5 py-1 bg-gray-700/80 rounded-lg text-sm font-normal text-gray-300">
-                  {tasks.length}
+                  {tasks.length}{nextPage ? "+" : ""}
                 </span>
               </h2>
               <p className="text-xs sm:text-sm text-gray-400 mt-0.5">
@@ -320,7 +337,7 @@ export default function TaskList({ refreshTrigger, onStatsUpdate }) {
                             <span className="hidden sm:inline">Pause</span>
                             <span className="sm:hidden">Pause</span>
                           </button>
-                        ) : task.status === 'PAUSED' ? (
+                        ) : task.can_be_resumed ? (
                           <button
                             onClick={() => handlePauseResume(task.id, 'resume')}
                             className="flex-1 lg:flex-none px-4 py-2.5 bg-neonGreen-500/10 hover:bg-neonGreen-500/20 text-neonGreen-400 rounded-xl text-sm font-medium transition-all flex items-center justify-center border border-neonGreen-500/20 hover:border-neonGreen-500/40"
@@ -358,6 +375,16 @@ export default function TaskList({ refreshTrigger, onStatsUpdate }) {
                 </div>
               </div>
             ))}
+            {nextPage && (
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="w-full px-4 py-2.5 bg-gray-900/30 hover:bg-gray-900/50 text-gray-300 rounded-xl text-sm font-medium transition-all flex items-center justify-center border border-gray-700/50 hover:border-neonGreen-500/50"
+              >
+                {loadingMore && <Loader2 className="w-4 h-4 mr-2 animate-spin" />}
+                Load more
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -23,34 +23,29 @@ export default function Dashboard() {
     failedTasks: 0,
     activeTasks: 0,
     pausedTasks: 0,
-    totalNotifications: 0,
     unreadNotifications: 0
   });
   const [loading, setLoading] = useState(true);
 
   const fetchStats = async () => {
     try {
-      const tasksRes = await api.get("tasks/");
-      const tasks = tasksRes.data;
-      
-      const totalTasks = tasks.length;
-      const completedTasks = tasks.filter(t => t.status === "COMPLETED").length;
-      const failedTasks = tasks.filter(t => t.status === "FAILED").length;
-      const activeTasks = tasks.filter(t => t.status === "ACTIVE").length;
-      const pausedTasks = tasks.filter(t => t.status === "PAUSED").length;
-      const pendingTasks = activeTasks + pausedTasks;
-      
-      const notificationsRes = await api.get("notifications/?limit=1");
-      const unreadRes = await api.get("notifications/unread_count/");
+      // Task lists are paginated without a count, so totals come from the
+      // status_counts endpoint rather than from a page of tasks.
+      const [countsRes, unreadRes] = await Promise.all([
+        api.get("tasks/status_counts/"),
+        api.get("notifications/unread_count/")
+      ]);
+      const byStatus = countsRes.data.by_status;
+      const activeTasks = byStatus.ACTIVE || 0;
+      const pausedTasks = byStatus.PAUSED || 0;
       
       setStats({
-        totalTasks,
-        completedTasks,
-        failedTasks,
+        totalTasks: countsRes.data.total,
+        completedTasks: byStatus.COMPLETED || 0,
+        failedTasks: byStatus.FAILED || 0,
         activeTasks,
         pausedTasks,
-        pendingTasks,
-        totalNotifications: notificationsRes.data.count || notificationsRes.data.length || 0,
+        pendingTasks: activeTasks + pausedTasks,
         unreadNotifications: unreadRes.data.unread_count || 0
       });
     } catch (err) {
@@ -114,9 +109,8 @@ export default function Dashboard() {
       borderColor: "border-red-500/20"
     },
     {
-      title: "Notifications",
-      value: stats.totalNotifications,
-      subtitle: `${stats.unreadNotifications} unread`,
+      title: "Unread Notifications",
+      value: stats.unreadNotifications,
       icon: Bell,
       color: "from-purple-500 to-purple-600",
       bgColor: "bg-purple-500/10",